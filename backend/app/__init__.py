@@ -3,11 +3,16 @@ from flask_cors import CORS
 from .api.v1.routes import api_bp
 from .api.v1.config_routes import config_bp
 from .core.app_config import AppConfig
+from .core.compression import init_gzip
+from .core.json_provider import FastJSONProvider
 
 def create_app(config_class=AppConfig):
     """Application factory pattern"""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    # JSON 序列化：orjson 可用时使用，非调试模式输出紧凑格式
+    app.json = FastJSONProvider(app)
+    init_gzip(app)
     
     # Enable CORS
     CORS(app)
@@ -97,6 +97,49 @@ def delete_longport_config():
             'error': f'删除配置失败: {str(e)}'
         }), 500
 
+@config_bp.route('/longport/reconcile', methods=['POST'])
+def reconcile_longport_positions():
+    """长桥持仓对账，返回偏差报告；apply为true时同时生成修正交易"""
+    try:
+        data = request.get_json() or {}
+        
+        # 验证必需参数
+        for field in ['userId', 'config_id']:
+            if not data.get(field):
+                return jsonify({
+                    'success': False,
+                    'error': f'缺少必需参数: {field}'
+                }), 400
+        
+        # apply只接受布尔值或字符串'true'/'false'，避免字符串"false"被当作真值而误写修正交易
+        apply = data.get('apply', False)
+        if isinstance(apply, str) and apply.lower() in ('true', 'false'):
+            apply = apply.lower() == 'true'
+        if not isinstance(apply, bool):
+            return jsonify({
+                'success': False,
+                'error': 'apply必须是布尔值'
+            }), 400
+        
+        longport_service = LongportService(data['userId'])
+        report = longport_service.reconcile_positions(data['config_id'], apply=apply)
+        
+        return jsonify({
+            'success': True,
+            'data': report
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'持仓对账失败: {str(e)}'
+        }), 500
+
 @config_bp.route('/list', methods=['GET'])
 def list_user_configs():
     """获取用户所有配置"""
@@ -1,22 +1,32 @@
 from typing_extensions import deprecated
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from datetime import datetime
 from cachetools import TTLCache
+import threading
 import uuid
 from decimal import Decimal
 
 from app.services.longport import LongportService
 from ...models import AssetManagerContext
-from ...core.database import Database, AccountManager, TransactionManager, ForeignExchangeRateManager, PriceTracingManager
+from ...core.database import Database, AccountManager, TransactionManager, ForeignExchangeRateManager, PriceTracingManager, PortfolioValuationManager
 from ...util.get_currency_rate import convert_currency_amount
 from ...util.time_utils import isoformat_utc8, format_datetime_with_timezone
+from ...util.downsample import lttb, parse_resolution
 from ...services.price_fetch import PriceFetcher
+from ...services.valuation import ValuationEngine, get_portfolio_summary
+from ...core.app_config import AppConfig
+from ...core.data_version import get_data_versions
+from ...services.event_hub import get_event_hub, format_sse
 
 # Create blueprint
 api_bp = Blueprint('api', __name__)
 
 price_fetcher = PriceFetcher()  # 初始化价格获取器
 
+# /assets/info 响应缓存：(userId, 数据版本) -> 序列化后的响应体，版本变化后旧条目不再命中，到期自动清除
+_assets_info_cache = TTLCache(maxsize=AppConfig.ASSETS_INFO_CACHE_SIZE, ttl=AppConfig.ASSETS_INFO_CACHE_TTL)
+_assets_info_lock = threading.Lock()
+
 @api_bp.route('/assets/add', methods=['POST'])
 def add_asset():
     """新增一个资产项目"""
@@ -32,6 +42,12 @@ def add_asset():
                     'error': f'缺少必需字段: {field}'
                 }), 400
 
+        # 股票未填写描述时使用证券名称（静态信息缓存）
+        if data['type'] == 'stock' and not str(data['description']).strip():
+            info = price_fetcher.get_security_info([data['symbol']]).get(data['symbol'])
+            if info:
+                data['description'] = info.get('name_cn') or info.get('name_en') or data['symbol']
+
         # 新增资产时，quantity和remain_cost只能为0
         asset_id = str(uuid.uuid4())
         asset_data = {
@@ -81,7 +97,10 @@ def add_asset():
 
 @api_bp.route('/assets/info', methods=['GET'])
 def get_assets():
-    """获取指定用户的所有资产和负债"""
+    """获取指定用户的所有资产和负债
+
+    响应按 (userId, 数据版本) 缓存并带 ETag，数据未变化时对带 If-None-Match 的请求返回 304
+    """
     try:
         userId = request.args.get('userId')
         if not userId:
@@ -90,15 +109,92 @@ def get_assets():
                 'error': '缺少必需参数: userId'
             }), 400
 
-        # 获取资产
-        with AssetManagerContext() as m:
-            assets = m.get_all_assets(userId)
+        version = get_data_versions().get(userId)
+        etag = f'assets-{version}'
+        # 启用gzip时ETag会变为弱ETag，按弱比较匹配
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            key = (userId, version)
+            with _assets_info_lock:
+                body = _assets_info_cache.get(key)
+            if body is None:
+                # 获取资产
+                with AssetManagerContext() as m:
+                    assets = m.get_all_assets(userId)
+                body = jsonify({
+                    'success': True,
+                    'data': assets
+                }).get_data()
+                with _assets_info_lock:
+                    _assets_info_cache[key] = body
+            response = Response(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        # 浏览器每次都带 If-None-Match 重新验证，数据未变时只收到 304
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        print(e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@api_bp.route('/stream', methods=['GET'])
+def stream_updates():
+    """以 Server-Sent Events 推送用户资产价格与估值的变化
+
+    事件：ready（连接建立，附当前数据版本）、assets（变化/删除的资产，字段同 /assets/info）、
+    valuation（总市值、成本与未实现盈亏，货币由 currency 参数指定）、resync（积压过多，需重新拉取 /assets/info）
+    """
+    userId = request.args.get('userId')
+    if not userId:
+        return jsonify({
+            'success': False,
+            'error': '缺少必需参数: userId'
+        }), 400
+    currency = request.args.get('currency', 'CNY').upper()
+    subscription = get_event_hub().subscribe(userId, currency)
+
+    def generate():
+        try:
+            while True:
+                item = subscription.get(AppConfig.STREAM_HEARTBEAT_SECONDS)
+                if item is None:
+                    # 心跳注释行，保持连接并让服务器及时发现客户端断开
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(*item)
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲
+    })
+
+@api_bp.route('/assets/tree', methods=['GET'])
+def get_asset_tree():
+    """获取用户的资产树，每个节点附带换算为指定货币（默认CNY）后的小计"""
+    try:
+        userId = request.args.get('userId')
+        if not userId:
+            return jsonify({
+                'success': False,
+                'error': '缺少必需参数: userId'
+            }), 400
+        currency = request.args.get('currency', 'CNY').upper()
+        
+        with Database() as db:
+            tree = ValuationEngine(db).valuate_tree(userId, currency)
         return jsonify({
             'success': True,
-            'data': assets
+            'data': {
+                'currency': currency,
+                'tree': tree
+            }
         }), 200
     except Exception as e:
-        print(e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -327,7 +423,8 @@ def create_transaction():
             'direction': data['direction'],
             'quantity': str(data['quantity']),  # 转换为字符串
             'price': str(data['price']),    # 转换为字符串
-            'currency': data['currency']
+            'currency': data['currency'],
+            'lotId': data.get('lotId')  # 卖出时指定平仓批次，不传则先进先出
         }
         
         # 根据交易记录更新资产信息（强制使用上下文）
@@ -357,8 +454,9 @@ def delete_transaction(transaction_id):
                 'error': '缺少必需参数: userId'
             }), 400
         
-        with Database() as db:
-            success = TransactionManager(db).delete_transaction(transaction_id, userId)
+        # 删除后按账本重放该账户的持仓（强制使用上下文，删除与重放在同一事务中）
+        with AssetManagerContext() as m:
+            success = m.delete_transaction(userId, transaction_id)
         
         if success:
             return jsonify({
@@ -377,9 +475,146 @@ def delete_transaction(transaction_id):
             'error': str(e)
         }), 400
 
+@api_bp.route('/accounts/<account_id>/position', methods=['GET'])
+def get_account_position(account_id):
+    """查询账户在指定时间点的持仓数量与平均成本（date 为日期时取当天收盘后，默认当前）"""
+    try:
+        userId = request.args.get('userId')
+        if not userId:
+            return jsonify({
+                'success': False,
+                'error': '缺少必需参数: userId'
+            }), 400
+        
+        date = request.args.get('date') or format_datetime_with_timezone()
+        if len(date) == 10:
+            date = f'{date} 23:59:59+08:00'
+        
+        with AssetManagerContext() as m:
+            account = m.get_asset_by_id(account_id)
+            if not account or account['userId'] != userId:
+                return jsonify({
+                    'success': False,
+                    'error': f'账户 {account_id} 不存在或不属于该用户'
+                }), 400
+            position = m.get_position_as_of(account_id, date)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'accountId': account_id,
+                'date': date,
+                'quantity': str(position['quantity']),
+                'cost': str(position['cost']),
+                'lastTransactionDate': position['asOfDate']
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@api_bp.route('/accounts/<account_id>/lots', methods=['GET'])
+def get_account_lots(account_id):
+    """查询账户的持仓批次与已实现盈亏（includeClosed=true 时包含已平仓批次）"""
+    try:
+        userId = request.args.get('userId')
+        if not userId:
+            return jsonify({
+                'success': False,
+                'error': '缺少必需参数: userId'
+            }), 400
+        include_closed = request.args.get('includeClosed', 'false').lower() == 'true'
+        
+        with AssetManagerContext() as m:
+            account = m.get_asset_by_id(account_id)
+            if not account or account['userId'] != userId:
+                return jsonify({
+                    'success': False,
+                    'error': f'账户 {account_id} 不存在或不属于该用户'
+                }), 400
+            lots = m.get_lots(account_id, include_closed)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'accountId': account_id,
+                'lots': [{
+                    'lotId': lot['id'],
+                    'openDate': lot['openDate'],
+                    'quantity': lot['quantity'],
+                    'remainingQuantity': lot['remainingQuantity'],
+                    'price': lot['price'],
+                    'isOpen': bool(lot['isOpen'])
+                } for lot in lots['lots']],
+                'realized': [{
+                    'transactionId': row['transactionId'],
+                    'lotId': row['lotId'],
+                    'date': row['date'],
+                    'quantity': row['quantity'],
+                    'costPrice': row['costPrice'],
+                    'salePrice': row['salePrice'],
+                    'pnl': row['pnl']
+                } for row in lots['realized']],
+                'realizedPnl': str(lots['realizedPnl'])
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+def _series_args():
+    """解析时间序列查询的公共参数 start/end/resolution/mode/max_points，参数无效时抛出 ValueError"""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    # 只给出日期时包含当天的全部数据点
+    if end and len(end) == 10:
+        end = f'{end} 23:59:59'
+    resolution = parse_resolution(request.args.get('resolution'))
+    mode = request.args.get('mode', 'mean').lower()
+    if mode not in ('mean', 'ohlc'):
+        raise ValueError('mode 必须是 mean 或 ohlc')
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None and max_points < 3:
+        raise ValueError('max_points 必须是不小于 3 的整数')
+    return start, end, resolution, mode, max_points
+
+def _bucket_point(row, value_key, mode):
+    """把一个分桶聚合结果转换成返回的数据点，value_key 为取值字段名（ohlc 时为收盘价，否则为均值）"""
+    if mode == 'ohlc':
+        return {
+            'date': row['date'], value_key: str(row['close']), 'open': str(row['open']),
+            'high': str(row['high']), 'low': str(row['low']), 'close': str(row['close']),
+            'count': row['count']
+        }
+    return {'date': row['date'], value_key: str(row['mean']), 'count': row['count']}
+
+def _downsample(points, rows, values, max_points):
+    """点数超过 max_points 时按 LTTB 算法降采样，rows 与 points 一一对应并提供 epoch 时间"""
+    if not max_points or len(points) <= max_points:
+        return points
+    # 无法解析的日期沿用前一个点的时间
+    times, last = [], 0
+    for row in rows:
+        last = row['epoch'] if row['epoch'] is not None else last
+        times.append(last)
+    return [points[i] for i in lttb(times, values, max_points)]
+
 @api_bp.route('/get_price_tracing', methods=['GET'])
 def get_price_tracing():
-    """获取指定账户的价格追踪数据"""
+    """获取指定账户的价格追踪数据
+
+    可选参数：
+    - start/end: 时间范围（日期或日期时间，含端点）
+    - resolution: 分桶粒度（秒数或 5m、1h、1d 等），在 SQL 中按桶聚合；不传或 raw 时返回原始点
+    - mode: 分桶后的取值方式，mean（桶内均值，默认）或 ohlc（开高低收，price 为收盘价）
+    - max_points: 最多返回的点数，超出时按 LTTB 算法降采样，保留曲线形状
+    """
     try:
         account_id = request.args.get('accountId')
         
@@ -390,22 +625,99 @@ def get_price_tracing():
                 'error': '缺少必需参数: accountId'
             }), 400
         
+        start, end, resolution, mode, max_points = _series_args()
+        
         # 获取价格追踪数据
         with Database() as db:
-            price_tracing_raw = PriceTracingManager(db).get_price_tracing(account_id)
-            
-            # 转换为简化的格式（只包含date和price）
-            price_tracing = []
-            for item in price_tracing_raw:
-                price_tracing.append({
-                    'date': item['date'],
-                    'price': item['price']
-                })
+            manager = PriceTracingManager(db)
+            if resolution is None:
+                rows = manager.get_price_tracing(account_id, start, end)
+                price_tracing = [{'date': row['date'], 'price': row['price']} for row in rows]
+                values = [float(row['price']) for row in rows] if max_points else []
+            else:
+                rows = manager.get_price_buckets(account_id, resolution, start, end)
+                price_tracing = [_bucket_point(row, 'price', mode) for row in rows]
+                values = [row['close' if mode == 'ohlc' else 'mean'] for row in rows]
+        
         return jsonify({
             'success': True,
             'data': {
                 'accountId': account_id,
-                'price_tracing': price_tracing
+                'price_tracing': _downsample(price_tracing, rows, values, max_points)
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@api_bp.route('/portfolio/summary', methods=['GET'])
+def get_portfolio_summary_route():
+    """获取用户资产汇总：总市值、总成本、未实现盈亏，以及按类型、货币、顶层资产组的分布"""
+    try:
+        userId = request.args.get('userId')
+        if not userId:
+            return jsonify({
+                'success': False,
+                'error': '缺少必需参数: userId'
+            }), 400
+        currency = request.args.get('currency', 'CNY').upper()
+        
+        return jsonify({
+            'success': True,
+            'data': dict(get_portfolio_summary(userId, currency), userId=userId)
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@api_bp.route('/portfolio/valuation', methods=['GET'])
+def get_portfolio_valuation():
+    """获取指定用户的总资产估值序列
+
+    可选参数与 /get_price_tracing 相同：start/end 时间范围、resolution 分桶粒度、
+    mode（mean 或 ohlc，ohlc 时 value 为收盘值）与 max_points 最多返回的点数。
+    不同货币的估值分别分桶与降采样。
+    """
+    try:
+        userId = request.args.get('userId')
+        if not userId:
+            return jsonify({
+                'success': False,
+                'error': '缺少必需参数: userId'
+            }), 400
+        
+        start, end, resolution, mode, max_points = _series_args()
+        
+        with Database() as db:
+            manager = PortfolioValuationManager(db)
+            if resolution is None:
+                rows = manager.get_valuations(userId, start, end)
+                points = [{'date': row['ts'], 'value': row['value']} for row in rows]
+                values = [float(row['value']) for row in rows] if max_points else []
+            else:
+                rows = manager.get_valuation_buckets(userId, resolution, start, end)
+                points = [_bucket_point(row, 'value', mode) for row in rows]
+                values = [row['close' if mode == 'ohlc' else 'mean'] for row in rows]
+        
+        # 按货币分别降采样，再按时间合并
+        valuations = []
+        for currency in dict.fromkeys(row['currency'] for row in rows):
+            indices = [i for i, row in enumerate(rows) if row['currency'] == currency]
+            currency_points = [dict(points[i], currency=currency) for i in indices]
+            currency_values = [values[i] for i in indices] if values else []
+            valuations.extend(_downsample(currency_points, [rows[i] for i in indices], currency_values, max_points))
+        valuations.sort(key=lambda point: point['date'])
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'userId': userId,
+                'valuations': valuations
             }
         }), 200
         
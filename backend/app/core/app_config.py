@@ -10,14 +10,27 @@ class AppConfig:
     # 数据库配置
     DATABASE_PATH = os.environ.get('DATABASE_PATH') or 'finance.db'
     
+    # 配置存储：tinydb（config.json）或 sqlite（数据库Config表，首次启用时自动从config.json迁移）
+    CONFIG_BACKEND = os.environ.get('CONFIG_BACKEND', 'tinydb')
+    CONFIG_CACHE_ENABLED = os.environ.get('CONFIG_CACHE_ENABLED', 'True').lower() == 'true'  # 配置读缓存，写入时按版本号失效
+    CONFIG_MULTIPROCESS = os.environ.get('CONFIG_MULTIPROCESS', 'False').lower() == 'true'  # API与定时任务分进程/多worker部署时开启：跨进程加锁并广播配置变更
+    CONFIG_CHANGE_POLL_INTERVAL = float(os.environ.get('CONFIG_CHANGE_POLL_INTERVAL', 0.5))  # 检查其他进程变更的间隔（秒）
+    
     # TinyDB配置
     TINYDB_CONFIG_PATH = os.environ.get('TINYDB_CONFIG_PATH') or 'config.json'
+    TINYDB_STORAGE_MODE = os.environ.get('TINYDB_STORAGE_MODE', 'caching')  # caching: 内存写回缓存，按间隔原子落盘；direct: 每次写入直接重写文件
+    TINYDB_FLUSH_INTERVAL = float(os.environ.get('TINYDB_FLUSH_INTERVAL', 0))  # caching模式落盘间隔（秒），默认0表示每次写入返回前原子落盘；大于0时按间隔合并写入，崩溃可能丢失最近的写入
+    TINYDB_FSYNC = os.environ.get('TINYDB_FSYNC', 'True').lower() == 'true'  # 落盘时是否fsync，关闭后掉电可能丢失最近的写入
     print(TINYDB_CONFIG_PATH)
     print(DATABASE_PATH)
     
-    # JSON配置
-    JSON_AS_ASCII = False  # 支持中文
-    JSONIFY_PRETTYPRINT_REGULAR = True  # 美化JSON输出
+    # JSON响应配置
+    JSON_PRETTY = os.environ.get('JSON_PRETTY', 'False').lower() == 'true'  # 缩进输出JSON响应，便于调试；默认紧凑输出
+    
+    # 响应压缩配置
+    GZIP_ENABLED = os.environ.get('GZIP_ENABLED', 'False').lower() == 'true'  # 对较大的JSON响应进行gzip压缩（nginx已压缩时无需开启）
+    GZIP_MIN_SIZE = int(os.environ.get('GZIP_MIN_SIZE', 1024))  # 超过该字节数才压缩
+    GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))  # 压缩级别 1-9
     
     # CORS配置
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
@@ -28,6 +41,45 @@ class AppConfig:
     # 日志配置
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
     
+    # 长桥同步配置
+    LONGPORT_SYNC_OVERLAP_MINUTES = int(os.environ.get('LONGPORT_SYNC_OVERLAP_MINUTES', 10))  # 同步窗口回溯重叠，重复订单按订单号跳过
+    LONGPORT_SYNC_WORKERS = int(os.environ.get('LONGPORT_SYNC_WORKERS', 4))  # 并发同步的配置数
+    LONGPORT_SYNC_TIMEOUT_SECONDS = int(os.environ.get('LONGPORT_SYNC_TIMEOUT_SECONDS', 45))  # 单个配置的同步超时
+    LONGPORT_TRADE_RATE_LIMIT = int(os.environ.get('LONGPORT_TRADE_RATE_LIMIT', 20))  # 交易类接口每秒调用上限
+    LONGPORT_QUOTE_RATE_LIMIT = int(os.environ.get('LONGPORT_QUOTE_RATE_LIMIT', 10))  # 行情类接口每秒调用上限
+    LONGPORT_SYNC_MODE = os.environ.get('LONGPORT_SYNC_MODE', 'poll')  # poll: 每分钟轮询；push: 订单推送 + 低频轮询对账
+    LONGPORT_PUSH_RECONCILE_MINUTES = int(os.environ.get('LONGPORT_PUSH_RECONCILE_MINUTES', 15))  # push模式下的轮询对账间隔
+    LONGPORT_RECONCILE_APPLY = os.environ.get('LONGPORT_RECONCILE_APPLY', 'False').lower() == 'true'  # 每小时持仓对账时是否自动生成修正交易
+    LONGPORT_HISTORY_IMPORT_DAYS = int(os.environ.get('LONGPORT_HISTORY_IMPORT_DAYS', 3650))  # 新配置导入历史订单的回溯天数
+    LONGPORT_HISTORY_IMPORT_WINDOW_DAYS = int(os.environ.get('LONGPORT_HISTORY_IMPORT_WINDOW_DAYS', 90))  # 单次history_orders请求的时间窗口
+    LONGPORT_HISTORY_IMPORT_WORKERS = int(os.environ.get('LONGPORT_HISTORY_IMPORT_WORKERS', 4))  # 并发拉取的时间窗口数
+    
+    # 账本配置
+    LEDGER_LOT_TRACKING = os.environ.get('LEDGER_LOT_TRACKING', 'True').lower() == 'true'  # 按批次记录持仓并计算每笔卖出的已实现盈亏
+    LEDGER_CHECKPOINT_INTERVAL = int(os.environ.get('LEDGER_CHECKPOINT_INTERVAL', 100))  # 每隔多少笔交易记录一个持仓检查点（另在每月最后一笔交易处记录）
+    
+    # SQLite配置
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 30))  # 写锁等待秒数，并发写入时避免 database is locked
+    
+    # 资产列表响应缓存（按用户数据版本失效）
+    ASSETS_INFO_CACHE_SIZE = int(os.environ.get('ASSETS_INFO_CACHE_SIZE', 1024))  # /assets/info 响应缓存的最大条目数
+    ASSETS_INFO_CACHE_TTL = int(os.environ.get('ASSETS_INFO_CACHE_TTL', 600))  # /assets/info 响应缓存的保留秒数
+    
+    # 定时任务领导者选举（多worker部署时只有一个进程运行定时任务）
+    SCHEDULER_LEASE_TTL = float(os.environ.get('SCHEDULER_LEASE_TTL', 30))  # 租约有效秒数，领导者失联超过该时间后由其他进程接任
+    SCHEDULER_LEASE_HEARTBEAT = float(os.environ.get('SCHEDULER_LEASE_HEARTBEAT', 10))  # 续约/竞选间隔秒数，应明显小于租约有效期
+    
+    # 实时推送（SSE）配置
+    STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', 100))  # 每个连接的待发送事件上限，积压时丢弃并通知客户端重新拉取
+    STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', 15))  # 无事件时发送心跳的间隔秒数
+    
+    # 证券静态信息缓存有效期（名称、每手股数等很少变化）
+    SECURITY_INFO_TTL_DAYS = int(os.environ.get('SECURITY_INFO_TTL_DAYS', 30))
+    
+    # 历史K线回填配置
+    CANDLESTICK_BACKFILL_WORKERS = int(os.environ.get('CANDLESTICK_BACKFILL_WORKERS', 4))  # 并发拉取的标的数
+    CANDLESTICK_BACKFILL_DEFAULT_DAYS = int(os.environ.get('CANDLESTICK_BACKFILL_DEFAULT_DAYS', 365))  # 无交易记录时的回填天数
+    
     @staticmethod
     def init_app(app):
         """初始化应用配置"""
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+跨进程变更通知
+基于SQLite的ChangeLog表，让同一数据库上的多个进程（API worker、定时任务）互相通知数据变更
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from .app_config import AppConfig
+from .database import Database, ChangeLogManager
+
+logger = logging.getLogger(__name__)
+
+# 变更记录保留时长（分钟）与清理间隔（秒）
+CHANGE_LOG_KEEP_MINUTES = 60
+CHANGE_LOG_CLEANUP_SECONDS = 600
+
+
+class ChangeNotifier:
+    """跨进程变更通知器
+
+    publish 写入一条变更记录（scope 表示数据类别，key 为具体对象，如用户ID）；
+    后台线程持有一个常驻连接，用 PRAGMA data_version 判断是否有其他连接提交过写入，
+    只有数据库发生变化时才查询新增的变更记录，并把其他进程产生的变更回调给订阅者。
+    watch 注册的回调在数据库有任何其他连接提交写入时调用，不需要写入方发布变更记录。
+    """
+
+    def __init__(self, poll_interval: float = None):
+        self.poll_interval = poll_interval or AppConfig.CONFIG_CHANGE_POLL_INTERVAL
+        self._listeners: List[Tuple[str, Callable[[str, str], None]]] = []
+        self._watchers: List[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+
+    def publish(self, scope: str, key: str = ''):
+        """记录一次变更，其他进程的订阅者会收到通知"""
+        with Database() as db:
+            ChangeLogManager(db).add_change(scope, key, os.getpid())
+
+    def subscribe(self, scope: str, callback: Callable[[str, str], None]):
+        """订阅某类变更，callback(scope, key) 在后台线程中调用"""
+        self._listeners.append((scope, callback))
+        self.start()
+
+    def watch(self, callback: Callable[[], None]):
+        """数据库被其他连接（含其他进程）写入后调用 callback()，在后台线程中调用"""
+        self._watchers.append(callback)
+        self.start()
+
+    def start(self):
+        """启动监听线程（fork 后的子进程会重新启动自己的线程）"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='change-notifier', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _dispatch(self, changes):
+        pid = os.getpid()
+        for change in changes:
+            if change['pid'] == pid:
+                continue
+            for scope, callback in self._listeners:
+                if change['scope'] != scope:
+                    continue
+                try:
+                    callback(change['scope'], change['key'])
+                except Exception as e:
+                    logger.error(f"处理变更通知 {change['scope']}:{change['key']} 失败: {e}")
+
+    def _run(self):
+        with Database() as db:
+            last_id = ChangeLogManager(db).get_last_id()
+        conn = sqlite3.connect(AppConfig.DATABASE_PATH, timeout=AppConfig.SQLITE_BUSY_TIMEOUT)
+        last_version = None
+        last_cleanup = time.monotonic()
+        try:
+            while not self._stop.wait(self.poll_interval):
+                try:
+                    version = conn.execute('PRAGMA data_version').fetchone()[0]
+                    if version != last_version:
+                        if last_version is not None:
+                            for callback in self._watchers:
+                                callback()
+                        last_version = version
+                        with Database() as db:
+                            changes = ChangeLogManager(db).get_changes_since(last_id)
+                        if changes:
+                            last_id = changes[-1]['id']
+                            self._dispatch(changes)
+
+                    if time.monotonic() - last_cleanup > CHANGE_LOG_CLEANUP_SECONDS:
+                        last_cleanup = time.monotonic()
+                        with Database() as db:
+                            ChangeLogManager(db).cleanup_old_changes(CHANGE_LOG_KEEP_MINUTES)
+                except Exception as e:
+                    logger.error(f"检查跨进程变更失败: {e}")
+        finally:
+            conn.close()
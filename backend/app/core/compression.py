@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+响应压缩
+对较大的 JSON 响应按客户端的 Accept-Encoding 进行 gzip 压缩（前面有 nginx 压缩时无需开启）
+"""
+
+import gzip
+
+from flask import Flask, Response, request
+
+from .app_config import AppConfig
+
+
+def init_gzip(app: Flask) -> None:
+    """注册 gzip 压缩（仅 GZIP_ENABLED 开启时）"""
+    if not AppConfig.GZIP_ENABLED:
+        return
+
+    @app.after_request
+    def gzip_response(response: Response) -> Response:
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or response.mimetype != 'application/json'
+                or 'Content-Encoding' in response.headers
+                or 'gzip' not in request.accept_encodings):
+            return response
+        data = response.get_data()
+        if len(data) < AppConfig.GZIP_MIN_SIZE:
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=AppConfig.GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # 压缩后字节不同，强ETag改为弱ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
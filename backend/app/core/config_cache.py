@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+配置读缓存
+在配置管理器前增加一层带版本号的进程内读缓存
+"""
+
+import copy
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class CachedConfigManager:
+    """带版本号失效的配置读缓存（接口与被包装的配置管理器一致）
+
+    每个用户、全局配置、用户列表各有一个单调递增的版本号，写入完成后递增对应版本。
+    读取不加锁：缓存条目的版本与当前版本一致时直接返回，否则读底层存储并以读取前的版本回填，
+    读写交错时回填的条目版本落后，下次读取会重新加载，不会长期读到旧数据。
+    返回的都是深拷贝，调用方修改返回值不会污染缓存。
+    传入 notifier 时，本进程的写入会广播给其他进程，其他进程的写入也会使本进程的缓存失效。
+    """
+
+    _GLOBAL = object()  # 全局配置版本号的键
+    _USER_IDS = object()  # 用户列表版本号的键
+
+    def __init__(self, backend, notifier=None):
+        self.backend = backend
+        self.notifier = notifier
+        self._versions: Dict[Any, int] = {}
+        self._version_counter = itertools.count(1)
+        self._user_cache: Dict[str, Tuple[int, Optional[Dict]]] = {}
+        self._global_cache: Dict[str, Tuple[int, Any]] = {}
+        self._user_ids_cache: Optional[Tuple[int, List[str], set]] = None
+        self._write_lock = threading.Lock()
+        if notifier is not None:
+            notifier.subscribe('config.user', lambda scope, userid: self.invalidate(userid))
+            notifier.subscribe('config.global', lambda scope, key: self.invalidate_global())
+
+    def _version(self, key) -> int:
+        return self._versions.get(key, 0)
+
+    def _bump(self, *keys):
+        for key in keys:
+            self._versions[key] = next(self._version_counter)
+
+    def _bump_user(self, userid: str):
+        self._bump(userid)
+        # 只有新增用户才需要失效用户列表
+        user_ids_cache = self._user_ids_cache
+        if user_ids_cache is None or userid not in user_ids_cache[2]:
+            self._bump(self._USER_IDS)
+
+    def invalidate(self, userid: str = None):
+        """使缓存失效：指定用户时只失效该用户（及用户列表），否则全部失效"""
+        if userid is None:
+            self._bump(self._GLOBAL, self._USER_IDS, *list(self._user_cache.keys()))
+        else:
+            self._bump(userid, self._USER_IDS)
+
+    def invalidate_global(self):
+        """使全局配置缓存失效"""
+        self._bump(self._GLOBAL)
+
+    def _publish(self, scope: str, key: str):
+        if self.notifier is None:
+            return
+        try:
+            self.notifier.publish(scope, key)
+        except Exception as e:
+            print(f"广播配置变更失败: {str(e)}")
+
+    # ---- 读操作（无锁） ----
+    def get_user_config(self, userid: str) -> Optional[Dict]:
+        version = self._version(userid)
+        cached = self._user_cache.get(userid)
+        if cached is None or cached[0] != version:
+            config = self.backend.get_user_config(userid)
+            cached = (version, config)
+            if config is not None:
+                self._user_cache[userid] = cached
+                # 底层存储会为新用户自动创建默认配置，此时用户列表需要失效
+                user_ids_cache = self._user_ids_cache
+                if user_ids_cache is not None and userid not in user_ids_cache[2]:
+                    self._bump(self._USER_IDS)
+        return copy.deepcopy(cached[1])
+
+    def get_global_config(self, key: str) -> Optional[Any]:
+        version = self._version(self._GLOBAL)
+        cached = self._global_cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, self.backend.get_global_config(key))
+            self._global_cache[key] = cached
+        return copy.deepcopy(cached[1])
+
+    def get_all_user_ids(self) -> List[str]:
+        version = self._version(self._USER_IDS)
+        cached = self._user_ids_cache
+        if cached is None or cached[0] != version:
+            user_ids = self.backend.get_all_user_ids()
+            cached = (version, user_ids, set(user_ids))
+            self._user_ids_cache = cached
+        return list(cached[1])
+
+    # ---- 写操作（写入底层存储后递增版本） ----
+    def set_user_config(self, userid: str, config_data: Dict) -> bool:
+        with self._write_lock:
+            try:
+                return self.backend.set_user_config(userid, config_data)
+            finally:
+                self._bump_user(userid)
+                self._publish('config.user', userid)
+
+    def modify_user_config(self, userid: str, key: str, updater: Callable[[Any], Any]) -> bool:
+        with self._write_lock:
+            try:
+                return self.backend.modify_user_config(userid, key, updater)
+            finally:
+                self._bump_user(userid)
+                self._publish('config.user', userid)
+
+    def update_user_config(self, userid: str, config_data: Dict) -> bool:
+        with self._write_lock:
+            try:
+                return self.backend.update_user_config(userid, config_data)
+            finally:
+                self._bump_user(userid)
+                self._publish('config.user', userid)
+
+    def set_global_config(self, config_data: Dict) -> bool:
+        with self._write_lock:
+            try:
+                return self.backend.set_global_config(config_data)
+            finally:
+                self._bump(self._GLOBAL)
+                self._publish('config.global', '')
+
+    def delete_global_config(self, key: str) -> bool:
+        with self._write_lock:
+            try:
+                return self.backend.delete_global_config(key)
+            finally:
+                self._bump(self._GLOBAL)
+                self._publish('config.global', key)
+
+    def flush(self):
+        self.backend.flush()
+
+    def close(self):
+        self.backend.close()
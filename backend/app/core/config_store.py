@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+配置存储选择
+按 AppConfig.CONFIG_BACKEND 返回进程内共享的配置管理器
+"""
+
+import threading
+
+from .app_config import AppConfig
+from .config_cache import CachedConfigManager
+from .tinydb_config import TinyDBConfigManager
+
+_config_manager = None
+_config_manager_lock = threading.Lock()
+_change_notifier = None
+
+
+def get_change_notifier():
+    """获取进程内共享的跨进程变更通知器"""
+    global _change_notifier
+    with _config_manager_lock:
+        if _change_notifier is None:
+            from .change_notifier import ChangeNotifier
+            _change_notifier = ChangeNotifier()
+    return _change_notifier
+
+
+def get_config_manager():
+    """获取配置管理器（TinyDBConfigManager 或 SQLiteConfigManager，接口一致）
+
+    使用 sqlite 存储且 Config 表为空时，会先从 TINYDB_CONFIG_PATH 一次性迁移已有配置。
+    CONFIG_CACHE_ENABLED 开启时在外层包一层带版本号失效的读缓存；
+    CONFIG_MULTIPROCESS 开启时缓存通过 ChangeNotifier 与其他进程互相失效。
+    """
+    global _config_manager
+    if _config_manager is not None:
+        return _config_manager
+
+    notifier = get_change_notifier() if AppConfig.CONFIG_MULTIPROCESS and AppConfig.CONFIG_CACHE_ENABLED else None
+    with _config_manager_lock:
+        if _config_manager is None:
+            if AppConfig.CONFIG_BACKEND == 'sqlite':
+                from .sqlite_config import SQLiteConfigManager
+                manager = SQLiteConfigManager()
+                manager.migrate_from_tinydb(AppConfig.TINYDB_CONFIG_PATH)
+            else:
+                manager = TinyDBConfigManager()
+            if AppConfig.CONFIG_CACHE_ENABLED:
+                manager = CachedConfigManager(manager, notifier)
+            _config_manager = manager
+    return _config_manager
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+用户数据版本
+在进程内缓存 DataVersion 表中的版本号，数据库没有写入时查询版本不访问SQLite
+"""
+
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from .app_config import AppConfig
+from .database import Database, DataVersionManager
+
+_data_versions = None
+_data_versions_lock = threading.Lock()
+
+
+class DataVersionCache:
+    """进程内的用户数据版本缓存
+
+    版本号由触发器在写入的同一事务中递增，这里只缓存读到的值：本进程提交写入后（Database 提交回调）
+    或其他进程写入后（ChangeNotifier.watch，仅 CONFIG_MULTIPROCESS 开启时）递增代数，
+    缓存条目的代数落后时才重新读取版本表，其余时候直接返回内存中的版本。
+    add_listener 注册的回调在每次失效后调用（如唤醒推送线程检查哪些用户的数据发生了变化）。
+    """
+
+    def __init__(self, notifier=None):
+        self._generation = 0
+        self._versions: Dict[str, Tuple[int, int]] = {}
+        self._listeners: List[Callable[[], None]] = []
+        Database.add_commit_listener(self.invalidate)
+        if notifier is not None:
+            notifier.watch(self.invalidate)
+
+    def add_listener(self, callback: Callable[[], None]):
+        self._listeners.append(callback)
+
+    def invalidate(self):
+        """数据库发生了写入，所有缓存的版本需要重新读取"""
+        self._generation += 1
+        for callback in self._listeners:
+            callback()
+
+    def get(self, user_id: str) -> int:
+        """获取用户当前的数据版本（用户数据或汇率变化后增大）"""
+        generation = self._generation
+        cached = self._versions.get(user_id)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        with Database() as db:
+            version = DataVersionManager(db).get_version(user_id)
+        # 以读取前的代数回填，读取期间发生写入时下次会重新读取
+        self._versions[user_id] = (generation, version)
+        return version
+
+
+def get_data_versions() -> DataVersionCache:
+    """获取进程内共享的数据版本缓存"""
+    global _data_versions
+    if _data_versions is not None:
+        return _data_versions
+    notifier = None
+    if AppConfig.CONFIG_MULTIPROCESS:
+        from .config_store import get_change_notifier
+        notifier = get_change_notifier()
+    with _data_versions_lock:
+        if _data_versions is None:
+            _data_versions = DataVersionCache(notifier)
+    return _data_versions
@@ -1,19 +1,62 @@
 import sqlite3
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 from decimal import Decimal
 from ..util.time_utils import get_current_time_utc8, format_datetime_utc8, isoformat_utc8
 
 from .app_config import AppConfig
 
+# 本进程内已完成建表检查的数据库路径，避免每次会话都重复执行建表语句
+_initialized_paths = set()
+
+# 仅作记录、不影响账户持仓的交易类型（如导入的历史成交）
+RECORD_ONLY_TRANSACTION_TYPES = ('history_import',)
+# 账本顺序：按交易时间（统一换算为儒略日，兼容不同时区写法）再按写入顺序
+LEDGER_TIME = 'COALESCE(julianday(date), 0)'
+# 交易所属月份（北京时间），用于在月末记录持仓检查点
+LEDGER_MONTH = "strftime('%Y-%m', date, '+8 hours')"
+LEDGER_FILTER = "(type IS NULL OR type NOT IN ({}))".format(
+    ', '.join(f"'{t}'" for t in RECORD_ONLY_TRANSACTION_TYPES)
+)
+
+def _backfill_opening_balances(cursor: sqlite3.Cursor) -> None:
+    """为旧数据推算期初持仓：账户当前持仓中账本交易无法解释的部分即为期初持仓
+
+    期初数量 = 当前数量 - 账本交易的净数量；按成本总额 quantity * cost 随交易线性变化推算期初成本，
+    结果为负（持仓曾清零使成本归零）时取当前平均成本。账本交易多于当前持仓的账户不设期初持仓。
+    """
+    net = {}
+    for row in cursor.execute(f'SELECT accountId, direction, quantity, price FROM Transactions WHERE {LEDGER_FILTER}'):
+        quantity, basis = net.get(row['accountId'], (Decimal('0'), Decimal('0')))
+        sign = 1 if row['direction'] == 0 else -1
+        net[row['accountId']] = (quantity + sign * Decimal(row['quantity']),
+                                 basis + sign * Decimal(row['quantity']) * Decimal(row['price']))
+
+    openings = []
+    for account in cursor.execute('SELECT id, quantity, cost FROM Accounts').fetchall():
+        quantity, cost = Decimal(account['quantity']), Decimal(account['cost'])
+        net_quantity, net_basis = net.get(account['id'], (Decimal('0'), Decimal('0')))
+        opening_quantity = quantity - net_quantity
+        if opening_quantity <= 0:
+            continue
+        opening_cost = ((quantity * cost - net_basis) / opening_quantity).quantize(Decimal('0.00000001'))
+        if opening_cost < 0:
+            opening_cost = cost
+        openings.append((str(opening_quantity), str(opening_cost), account['id']))
+    cursor.executemany('UPDATE Accounts SET openingQuantity = ?, openingCost = ? WHERE id = ?', openings)
+
 def _ensure_initialized(db_path: str = 'finance.db') -> None:
     """确保数据库文件与表结构已初始化。"""
+    if db_path in _initialized_paths and os.path.exists(db_path):
+        return
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     # 与旧实现保持一致的 PRAGMA
     cursor.execute("PRAGMA timezone = '+08:00'")
+    # WAL模式下读写互不阻塞，适合定时任务并发写入（设置会持久化到数据库文件）
+    cursor.execute("PRAGMA journal_mode = WAL")
         
     # 创建Accounts表
     cursor.execute('''
@@ -28,7 +71,9 @@ def _ensure_initialized(db_path: str = 'finance.db') -> None:
             cost TEXT NOT NULL,
             marketPrice TEXT,
             currency VARCHAR(10) NOT NULL,
-            isActive BOOLEAN NOT NULL DEFAULT 1
+            isActive BOOLEAN NOT NULL DEFAULT 1,
+            openingQuantity TEXT NOT NULL DEFAULT '0',
+            openingCost TEXT NOT NULL DEFAULT '0'
         )
     ''')
     
@@ -76,10 +121,91 @@ def _ensure_initialized(db_path: str = 'finance.db') -> None:
             quantity TEXT NOT NULL,
             price TEXT NOT NULL,
             currency VARCHAR(10) NOT NULL,
+            externalId VARCHAR(128),
+            type VARCHAR(32),
             FOREIGN KEY (accountId) REFERENCES Accounts(id)
         )
     ''')
     
+    # 检查是否需要添加externalId字段（兼容旧版本）
+    try:
+        cursor.execute('SELECT externalId FROM Transactions LIMIT 1')
+    except sqlite3.OperationalError:
+        cursor.execute('ALTER TABLE Transactions ADD COLUMN externalId VARCHAR(128)')
+    
+    # 检查是否需要添加type字段（兼容旧版本），记录交易类型，如 trade/dividend/fee 等，手工录入为NULL
+    try:
+        cursor.execute('SELECT type FROM Transactions LIMIT 1')
+    except sqlite3.OperationalError:
+        cursor.execute('ALTER TABLE Transactions ADD COLUMN type VARCHAR(32)')
+    
+    # 检查是否需要添加余额字段（兼容旧版本），记录该笔交易入账后的持仓数量与平均成本，供账本增量重放
+    try:
+        cursor.execute('SELECT balanceQuantity, balanceCost FROM Transactions LIMIT 1')
+    except sqlite3.OperationalError:
+        cursor.execute('ALTER TABLE Transactions ADD COLUMN balanceQuantity TEXT')
+        cursor.execute('ALTER TABLE Transactions ADD COLUMN balanceCost TEXT')
+    
+    # 检查是否需要添加lotId字段（兼容旧版本），卖出时指定要平仓的批次，为空表示先进先出
+    try:
+        cursor.execute('SELECT lotId FROM Transactions LIMIT 1')
+    except sqlite3.OperationalError:
+        cursor.execute('ALTER TABLE Transactions ADD COLUMN lotId VARCHAR(64)')
+    
+    # 检查是否需要添加期初持仓字段（兼容旧版本），账户建立时已有、没有对应交易的持仓（如长桥持仓快照），账本重放从它开始
+    try:
+        cursor.execute('SELECT openingQuantity, openingCost FROM Accounts LIMIT 1')
+    except sqlite3.OperationalError:
+        cursor.execute("ALTER TABLE Accounts ADD COLUMN openingQuantity TEXT NOT NULL DEFAULT '0'")
+        cursor.execute("ALTER TABLE Accounts ADD COLUMN openingCost TEXT NOT NULL DEFAULT '0'")
+        _backfill_opening_balances(cursor)
+    
+    # 创建账户持仓检查点表：每隔若干笔交易及每月末记录一次持仓，账本重放与历史持仓查询从最近的检查点开始
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS AccountCheckpoint (
+            accountId VARCHAR(64) NOT NULL,
+            ledgerTime REAL NOT NULL,
+            ledgerRowid INTEGER NOT NULL,
+            asOfDate DATETIME NOT NULL,
+            quantity TEXT NOT NULL,
+            cost TEXT NOT NULL,
+            txCount INTEGER NOT NULL,
+            PRIMARY KEY (accountId, ledgerTime, ledgerRowid)
+        ) WITHOUT ROWID
+    ''')
+    
+    # 创建持仓批次表：每笔买入一个批次（id为买入交易ID），卖出按先进先出或指定批次扣减剩余数量
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS AccountLot (
+            id VARCHAR(64) PRIMARY KEY,
+            accountId VARCHAR(64) NOT NULL,
+            ledgerTime REAL NOT NULL,
+            ledgerRowid INTEGER NOT NULL,
+            openDate DATETIME NOT NULL,
+            quantity TEXT NOT NULL,
+            remainingQuantity TEXT NOT NULL,
+            price TEXT NOT NULL,
+            isOpen BOOLEAN NOT NULL DEFAULT 1
+        )
+    ''')
+    
+    # 创建已实现盈亏表：卖出每消耗一个批次记录一行（lotId为空表示没有批次记录的旧持仓，按平均成本计算）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS RealizedPnl (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            accountId VARCHAR(64) NOT NULL,
+            transactionId VARCHAR(64) NOT NULL,
+            lotId VARCHAR(64),
+            ledgerTime REAL NOT NULL,
+            ledgerRowid INTEGER NOT NULL,
+            date DATETIME NOT NULL,
+            quantity TEXT NOT NULL,
+            costPrice TEXT NOT NULL,
+            salePrice TEXT NOT NULL,
+            pnl TEXT NOT NULL
+        )
+    ''')
+    
     # 创建PriceTracing表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS PriceTracing (
@@ -91,9 +217,89 @@ def _ensure_initialized(db_path: str = 'finance.db') -> None:
         )
     ''')
     
+    # 创建用户总资产估值序列表（按 (userId, ts) 聚簇存储，按用户+时间范围查询只需顺序扫描）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS PortfolioValuation (
+            userId VARCHAR(64) NOT NULL,
+            ts DATETIME NOT NULL,
+            value TEXT NOT NULL,
+            currency VARCHAR(10) NOT NULL DEFAULT 'CNY',
+            accountCount INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (userId, ts)
+        ) WITHOUT ROWID
+    ''')
+    
+    # 创建数据版本表：账户、交易变更时由触发器递增该用户的版本号，汇率变更时递增全局版本（userId 为空串），
+    # 缓存的汇总结果与当前版本不一致即已过期
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS DataVersion (
+            userId VARCHAR(64) PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    
+    # 创建标的历史日K表（按标的共享，不区分用户）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SymbolPriceHistory (
+            symbol VARCHAR(64) NOT NULL,
+            date DATE NOT NULL,
+            open TEXT NOT NULL,
+            high TEXT NOT NULL,
+            low TEXT NOT NULL,
+            close TEXT NOT NULL,
+            volume INTEGER,
+            PRIMARY KEY (symbol, date)
+        )
+    ''')
+    
+    # 创建标的历史日K已回填区间表（记录请求过的区间，非交易日没有K线也算已覆盖）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SymbolPriceCoverage (
+            symbol VARCHAR(64) PRIMARY KEY,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    
+    # 创建证券静态信息缓存表（名称、每手股数等几乎不变的信息）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SecurityStaticInfo (
+            symbol VARCHAR(64) PRIMARY KEY,
+            name_cn VARCHAR(255),
+            name_en VARCHAR(255),
+            lot_size INTEGER,
+            currency VARCHAR(10),
+            exchange VARCHAR(32),
+            updated_at DATETIME NOT NULL
+        )
+    ''')
+    
+    # 创建跨进程变更记录表（各进程据此失效本地缓存，定期清理）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ChangeLog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope VARCHAR(32) NOT NULL,
+            key VARCHAR(128) NOT NULL,
+            pid INTEGER NOT NULL,
+            created_at DATETIME DEFAULT (datetime('now', '+8 hours'))
+        )
+    ''')
+    
+    # 创建领导者租约表：多进程部署时只有持有未过期租约的进程运行定时任务，持有者定期续约
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS LeaderLease (
+            name VARCHAR(32) PRIMARY KEY,
+            holder VARCHAR(128) NOT NULL,
+            expiresAt REAL NOT NULL
+        )
+    ''')
+    
     # 创建索引
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_config_userId_type_item ON Config(userId, type, item)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_config_userId ON Config(userId)')
+    # 配置项唯一，支持按 (userId, type, item, subItem) 直接 upsert
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_config_userId_type_item_subItem ON Config(userId, type, item, subItem)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_config_type_userId ON Config(type, userId)')
     
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_foreign_exchange_rate_currency_created ON ForeignExchangeRate(foreign_currency, created_at)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_foreign_exchange_rate_created ON ForeignExchangeRate(created_at)')
@@ -106,18 +312,50 @@ def _ensure_initialized(db_path: str = 'finance.db') -> None:
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_userId_isActive ON Accounts(userId, isActive)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_userId_symbol_isActive ON Accounts(userId, symbol, isActive)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_type_isActive ON Accounts(type, isActive)')
+    # 资产树按父账户递归查找子账户
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_account_userId_parentId ON Accounts(userId, parentId)')
     
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_transaction_userId ON Transactions(userId)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_transaction_accountId ON Transactions(accountId)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_transaction_userId_date ON Transactions(userId, date DESC)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_transaction_date ON Transactions(date)')
+    # 外部ID（如券商订单号）在同一账户内唯一，保证同步幂等；NULL不受约束
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_transaction_accountId_externalId ON Transactions(accountId, externalId)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transaction_externalId ON Transactions(externalId)')
+    # 账本顺序索引，账户内按时间定位与重放
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_transaction_accountId_ledger ON Transactions(accountId, {LEDGER_TIME})')
+    
+    # 未平仓批次按先进先出顺序的部分索引，已平仓批次不占用索引
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_lot_accountId_open ON AccountLot(accountId, ledgerTime, ledgerRowid) WHERE isOpen = 1')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_lot_accountId_ledger ON AccountLot(accountId, ledgerTime, ledgerRowid)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_realized_pnl_accountId_ledger ON RealizedPnl(accountId, ledgerTime, ledgerRowid)')
     
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_tracing_accountId ON PriceTracing(accountId)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_tracing_date ON PriceTracing(date)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_tracing_accountId_date ON PriceTracing(accountId, date)')
+    
+    # 数据版本触发器：更新只在字段值确实变化时递增，重建持仓等未改变数据的批量写入不会使缓存失效
+    bump = 'INSERT INTO DataVersion (userId, version) VALUES ({}, 1) ON CONFLICT(userId) DO UPDATE SET version = version + 1;'
+    account_columns = ('type', 'parentId', 'description', 'quantity', 'cost', 'marketPrice', 'currency', 'isActive', 'symbol')
+    transaction_columns = ('description', 'date', 'direction', 'quantity', 'price', 'currency', 'lotId')
+    changed = lambda columns: ' OR '.join(f'OLD.{c} IS NOT NEW.{c}' for c in columns)
+    data_version_triggers = {
+        'trg_account_insert_version': ('AFTER INSERT ON Accounts', bump.format('NEW.userId')),
+        'trg_account_update_version': (f'AFTER UPDATE ON Accounts WHEN {changed(account_columns)}', bump.format('NEW.userId')),
+        'trg_account_delete_version': ('AFTER DELETE ON Accounts', bump.format('OLD.userId')),
+        'trg_transaction_insert_version': ('AFTER INSERT ON Transactions', bump.format('NEW.userId')),
+        'trg_transaction_update_version': (f'AFTER UPDATE ON Transactions WHEN {changed(transaction_columns)}', bump.format('NEW.userId')),
+        'trg_transaction_delete_version': ('AFTER DELETE ON Transactions', bump.format('OLD.userId')),
+        'trg_exchange_rate_insert_version': ('AFTER INSERT ON ForeignExchangeRate', bump.format("''")),
+        'trg_exchange_rate_update_version': ('AFTER UPDATE ON ForeignExchangeRate', bump.format("''")),
+        'trg_exchange_rate_delete_version': ('AFTER DELETE ON ForeignExchangeRate', bump.format("''")),
+    }
+    for name, (event, body) in data_version_triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
         
     conn.commit()
     conn.close()
+    _initialized_paths.add(db_path)
 
 
 class Database:
@@ -126,17 +364,27 @@ class Database:
     - with 正常退出时提交；异常时回滚
     - 提供 execute_query/execute_update/execute_insert 接口，不会中途提交
     - 兼容各 *Manager(db) 的调用
+    - 提交了写入的会话结束后依次调用 add_commit_listener 注册的回调
     """
 
-    def __init__(self):
+    _commit_listeners: List[Callable[[], None]] = []
+
+    @classmethod
+    def add_commit_listener(cls, callback: Callable[[], None]):
+        """注册本进程写入提交后的回调（如使进程内缓存的数据版本失效）"""
+        cls._commit_listeners.append(callback)
+
+    def __init__(self, timeout: float = None):
+        """timeout 为等待写锁的秒数，默认 SQLITE_BUSY_TIMEOUT"""
         self.db_path = AppConfig.DATABASE_PATH
+        self.timeout = AppConfig.SQLITE_BUSY_TIMEOUT if timeout is None else timeout
         _ensure_initialized(self.db_path)
         self._conn: Optional[sqlite3.Connection] = None
         self._cursor: Optional[sqlite3.Cursor] = None
         self._active: bool = False
 
     def __enter__(self) -> 'Database':
-        self._conn = sqlite3.connect(self.db_path)
+        self._conn = sqlite3.connect(self.db_path, timeout=self.timeout)
         self._conn.row_factory = sqlite3.Row
         self._cursor = self._conn.cursor()
         self._cursor.execute("PRAGMA timezone = '+08:00'")
@@ -144,10 +392,12 @@ class Database:
         return self
 
     def __exit__(self, exc_type, exc, tb):
+        committed = False
         try:
             if self._active and self._conn is not None:
                 if exc_type is None:
                     self._conn.commit()
+                    committed = self._conn.total_changes > 0
                 else:
                     self._conn.rollback()
         finally:
@@ -156,23 +406,60 @@ class Database:
             self._active = False
             self._conn = None
             self._cursor = None
+        if committed:
+            for callback in self._commit_listeners:
+                callback()
 
     def rollback(self):
         if self._conn is not None:
             self._conn.rollback()
 
+    def begin_immediate(self):
+        """立即获取写锁开始事务，用于跨进程安全的读-改-写（须在本会话第一条语句前调用）"""
+        if not self._cursor:
+            raise RuntimeError("Database 会话未初始化或已结束")
+        self._cursor.execute('BEGIN IMMEDIATE')
+
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict]:
         if not self._cursor:
             raise RuntimeError("Database 会话未初始化或已结束")
         self._cursor.execute(query, params)
         return [dict(row) for row in self._cursor.fetchall()]
 
+    def execute_query_rows(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """查询并返回原始行，适合大批量只读遍历"""
+        if not self._cursor:
+            raise RuntimeError("Database 会话未初始化或已结束")
+        self._cursor.execute(query, params)
+        return self._cursor.fetchall()
+
+    def iter_query_rows(self, query: str, params: tuple = (), batch_size: int = 1000) -> Iterator[sqlite3.Row]:
+        """使用独立游标分批读取，适合单次流式遍历大表（遍历期间可在同一会话中执行其他语句）"""
+        if not self._conn:
+            raise RuntimeError("Database 会话未初始化或已结束")
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
     def execute_update(self, query: str, params: tuple = ()) -> int:
         if not self._cursor:
             raise RuntimeError("Database 会话未初始化或已结束")
         self._cursor.execute(query, params)
         return self._cursor.rowcount
 
+    def execute_many(self, query: str, params_seq: List[tuple]) -> int:
+        if not self._cursor:
+            raise RuntimeError("Database 会话未初始化或已结束")
+        self._cursor.executemany(query, params_seq)
+        return self._cursor.rowcount
+
     def execute_insert(self, query: str, params: tuple = ()) -> str:
         if not self._cursor:
             raise RuntimeError("Database 会话未初始化或已结束")
@@ -184,6 +471,52 @@ class Database:
                 self._conn.rollback()
             raise e
 
+def query_series_buckets(db: Database, table: str, key_column: str, key: str, time_column: str, value_column: str,
+                         bucket_seconds: int, start: str = None, end: str = None,
+                         tiebreak_column: str = None, group_columns: Tuple[str, ...] = ()) -> List[Dict]:
+    """按固定时长分桶聚合时间序列，每桶返回开、高、低、收、均值与点数
+
+    桶按时间字符串的墙上时间对齐（如 1d 的桶从当天 00:00:00 开始），date 为桶的起始时间，epoch 为其秒数；
+    开盘、收盘取桶内按时间排序的第一个与最后一个点。group_columns 中的列（如货币）不同的点不会合并到同一桶。
+    """
+    conditions = [f'{key_column} = ?']
+    params = [bucket_seconds, key]
+    if start:
+        conditions.append(f'{time_column} >= ?')
+        params.append(start)
+    if end:
+        conditions.append(f'{time_column} <= ?')
+        params.append(end)
+    order = f'date, {tiebreak_column}' if tiebreak_column else 'date'
+    point_columns = ''.join(f'{column}, ' for column in (tiebreak_column, *group_columns) if column)
+    groups = ''.join(f', {column}' for column in group_columns)
+    query = f'''
+        WITH points AS (
+            SELECT {point_columns}{time_column} AS date, CAST({value_column} AS REAL) AS value,
+                   CAST(strftime('%s', {time_column}) AS INTEGER) / ? AS bucket
+            FROM {table}
+            WHERE {' AND '.join(conditions)}
+        ),
+        ranked AS (
+            SELECT bucket{groups}, value,
+                   FIRST_VALUE(value) OVER w AS open,
+                   LAST_VALUE(value) OVER w AS close
+            FROM points
+            WHERE bucket IS NOT NULL
+            WINDOW w AS (PARTITION BY bucket{groups} ORDER BY {order}
+                         ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)
+        )
+        SELECT strftime('%Y-%m-%d %H:%M:%S', bucket * ?, 'unixepoch') AS date, bucket * ? AS epoch{groups},
+               MIN(open) AS open, MAX(value) AS high, MIN(value) AS low, MIN(close) AS close,
+               AVG(value) AS mean, COUNT(*) AS count
+        FROM ranked
+        GROUP BY bucket{groups}
+        ORDER BY bucket ASC{groups}
+    '''
+    params.extend((bucket_seconds, bucket_seconds))
+    return db.execute_query(query, tuple(params))
+
+
 class AccountManager:
     """账户管理器"""
     
@@ -193,8 +526,9 @@ class AccountManager:
     def create_account(self, account_data: Dict) -> str:
         """创建新账户"""
         query = '''
-            INSERT INTO Accounts (id, userId, symbol, type, parentId, description, quantity, cost, marketPrice, currency, isActive)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO Accounts (id, userId, symbol, type, parentId, description, quantity, cost, marketPrice, currency, isActive,
+                                  openingQuantity, openingCost)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         '''
         params = (
             account_data['id'],
@@ -207,10 +541,17 @@ class AccountManager:
             account_data['cost'],
             account_data.get('marketPrice'),
             account_data['currency'],
-            account_data.get('isActive', True)
+            account_data.get('isActive', True),
+            str(account_data.get('openingQuantity', '0')),
+            str(account_data.get('openingCost', '0'))
         )
         return self.db.execute_insert(query, params)
     
+    def get_opening_balances(self) -> Dict[str, Tuple[Decimal, Decimal]]:
+        """获取所有有期初持仓的账户 {accountId: (openingQuantity, openingCost)}"""
+        rows = self.db.execute_query("SELECT id, openingQuantity, openingCost FROM Accounts WHERE CAST(openingQuantity AS REAL) != 0")
+        return {row['id']: (Decimal(row['openingQuantity']), Decimal(row['openingCost'])) for row in rows}
+    
     def get_accounts_by_user(self, userId: str) -> List[Dict]:
         """获取用户的所有活跃账户 - 优化版本"""
         query = '''
@@ -220,6 +561,89 @@ class AccountManager:
         '''
         return self.db.execute_query(query, (userId,))
     
+    def get_active_holdings(self, user_ids: List[str] = None) -> List[sqlite3.Row]:
+        """批量获取活跃账户的估值字段 (userId, type, parentId, currency, quantity, price)
+
+        price 为市场价，未设置或为0时使用成本价；不指定 user_ids 时返回全部用户。
+        返回原始行（可按下标解包），省去逐行转换为字典，供估值引擎单次遍历。
+        """
+        query = '''
+            SELECT userId, type, parentId, currency, quantity,
+                   CASE WHEN marketPrice IS NULL OR marketPrice = '' OR CAST(marketPrice AS REAL) = 0
+                        THEN cost ELSE marketPrice END AS price
+            FROM Accounts
+            WHERE isActive = 1
+        '''
+        if user_ids is None:
+            return self.db.execute_query_rows(query)
+        results = []
+        # 分批查询，避免超过SQLite的参数数量上限
+        for i in range(0, len(user_ids), 500):
+            batch = user_ids[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            results.extend(self.db.execute_query_rows(f'{query} AND userId IN ({placeholders})', tuple(batch)))
+        return results
+    
+    def get_account_tree(self, userId: str) -> List[sqlite3.Row]:
+        """用递归CTE一次查出用户的活跃账户树，按深度从深到浅返回
+
+        每行包含账户字段及 depth（根节点为0）、price（市场价，未设置或为0时为成本价）。
+        只有从根账户（无父账户）可达的账户才会返回，与前端构建资产树的规则一致；
+        path 记录祖先路径，防止错误数据形成环时无限递归。
+        """
+        query = '''
+            WITH RECURSIVE tree(id, depth, path) AS (
+                SELECT id, 0, '/' || id || '/' FROM Accounts
+                WHERE userId = ? AND isActive = 1 AND (parentId IS NULL OR parentId = '')
+                UNION ALL
+                SELECT a.id, tree.depth + 1, tree.path || a.id || '/'
+                FROM Accounts a JOIN tree ON a.parentId = tree.id
+                WHERE a.userId = ? AND a.isActive = 1 AND instr(tree.path, '/' || a.id || '/') = 0
+            )
+            SELECT a.id, a.parentId, a.type, a.symbol, a.description, a.quantity, a.cost, a.marketPrice, a.currency,
+                   CASE WHEN a.marketPrice IS NULL OR a.marketPrice = '' OR CAST(a.marketPrice AS REAL) = 0
+                        THEN a.cost ELSE a.marketPrice END AS price,
+                   tree.depth
+            FROM tree JOIN Accounts a ON a.id = tree.id
+            ORDER BY tree.depth DESC
+        '''
+        return self.db.execute_query_rows(query, (userId, userId))
+    
+    def get_holdings_by_root(self, userId: str) -> List[sqlite3.Row]:
+        """获取用户活跃账户的估值字段及所属顶层节点，供估值引擎按定点数汇总
+
+        递归CTE为每个账户找到所属的顶层节点（rootId），资产组本身不返回；
+        每行为 (rootId, rootName, rootType, type, currency, quantity, price, cost) 的原始字符串，
+        price 为市场价，未设置或为0时使用成本价。
+        """
+        query = '''
+            WITH RECURSIVE tree(id, rootId, path) AS (
+                SELECT id, id, '/' || id || '/' FROM Accounts
+                WHERE userId = ? AND isActive = 1 AND (parentId IS NULL OR parentId = '')
+                UNION ALL
+                SELECT a.id, tree.rootId, tree.path || a.id || '/'
+                FROM Accounts a JOIN tree ON a.parentId = tree.id
+                WHERE a.userId = ? AND a.isActive = 1 AND instr(tree.path, '/' || a.id || '/') = 0
+            )
+            SELECT tree.rootId, r.description AS rootName, r.type AS rootType, a.type, a.currency, a.quantity,
+                   CASE WHEN a.marketPrice IS NULL OR a.marketPrice = '' OR CAST(a.marketPrice AS REAL) = 0
+                        THEN a.cost ELSE a.marketPrice END AS price,
+                   a.cost
+            FROM tree
+            JOIN Accounts a ON a.id = tree.id
+            JOIN Accounts r ON r.id = tree.rootId
+            WHERE a.type != 'group'
+        '''
+        return self.db.execute_query_rows(query, (userId, userId))
+    
+    def get_accounts_by_id_prefix(self, userId: str, prefix: str) -> List[Dict]:
+        """获取用户ID前缀匹配的所有账户（含未激活账户），如某个长桥配置下的全部股票账户"""
+        query = '''
+            SELECT * FROM Accounts
+            WHERE userId = ? AND substr(id, 1, ?) = ?
+        '''
+        return self.db.execute_query(query, (userId, len(prefix), prefix))
+    
     def get_account_by_id(self, account_id: str) -> Optional[Dict]:
         """根据ID获取账户"""
         query = 'SELECT * FROM Accounts WHERE id = ?'
@@ -255,6 +679,13 @@ class AccountManager:
         )
         return self.db.execute_update(query, params) > 0
     
+    def update_positions(self, positions: List[tuple]) -> int:
+        """批量更新账户持仓，元素为 (quantity, cost, isActive, id)"""
+        if not positions:
+            return 0
+        query = 'UPDATE Accounts SET quantity = ?, cost = ?, isActive = ? WHERE id = ?'
+        return self.db.execute_many(query, positions)
+    
     def delete_account(self, account_id: str) -> bool:
         """删除账户（软删除）"""
         query = 'UPDATE Accounts SET isActive = 0 WHERE id = ?'
@@ -286,13 +717,15 @@ class TransactionManager:
     def __init__(self, db: Database):
         self.db = db
     
-    def create_transaction(self, transaction_data: Dict) -> str:
-        """创建新交易记录"""
-        query = '''
-            INSERT INTO Transactions (id, userId, accountId, description, date, direction, quantity, price, currency)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        '''
-        params = (
+    _INSERT_QUERY = '''
+        INSERT INTO Transactions (id, userId, accountId, description, date, direction, quantity, price, currency, externalId, type,
+                                  balanceQuantity, balanceCost, lotId)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    @staticmethod
+    def _insert_params(transaction_data: Dict) -> tuple:
+        return (
             transaction_data['id'],
             transaction_data['userId'],
             transaction_data['accountId'],
@@ -301,9 +734,35 @@ class TransactionManager:
             transaction_data['direction'],
             str(transaction_data['quantity']),  # 转换为字符串
             str(transaction_data['price']),   # 转换为字符串
-            transaction_data['currency']
+            transaction_data['currency'],
+            transaction_data.get('externalId'),
+            transaction_data.get('type'),
+            None if transaction_data.get('balanceQuantity') is None else str(transaction_data['balanceQuantity']),
+            None if transaction_data.get('balanceCost') is None else str(transaction_data['balanceCost']),
+            transaction_data.get('lotId') or None
         )
-        return self.db.execute_insert(query, params)
+    
+    def create_transaction(self, transaction_data: Dict) -> str:
+        """创建新交易记录"""
+        return self.db.execute_insert(self._INSERT_QUERY, self._insert_params(transaction_data))
+    
+    def create_transactions(self, transactions: List[Dict]) -> int:
+        """批量创建交易记录（单条语句批量执行）"""
+        if not transactions:
+            return 0
+        return self.db.execute_many(self._INSERT_QUERY, [self._insert_params(t) for t in transactions])
+    
+    def get_existing_external_ids(self, external_ids: List[str]) -> set:
+        """返回给定外部ID中已入库的部分"""
+        existing = set()
+        external_ids = list(set(external_ids))
+        # 分批查询，避免超过SQLite的参数数量上限
+        for i in range(0, len(external_ids), 500):
+            chunk = external_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            query = f'SELECT DISTINCT externalId FROM Transactions WHERE externalId IN ({placeholders})'
+            existing.update(row['externalId'] for row in self.db.execute_query(query, tuple(chunk)))
+        return existing
     
     def get_transactions_by_user(self, userId: str, accountId: str = None, start_date: str = None, end_date: str = None, page_index: int = 0, page_size: int = 20) -> Dict:
         """获取用户的交易记录，支持按账户ID和日期范围过滤，支持分页"""
@@ -392,7 +851,7 @@ class TransactionManager:
         
         query = '''
             UPDATE Transactions 
-            SET description = ?, date = ?, direction = ?, quantity = ?, price = ?, currency = ?
+            SET description = ?, date = ?, direction = ?, quantity = ?, price = ?, currency = ?, lotId = ?
             WHERE id = ?
         '''
         params = (
@@ -402,6 +861,7 @@ class TransactionManager:
             str(transaction_data['quantity']),  # 转换为字符串
             str(transaction_data['price']),   # 转换为字符串
             transaction_data['currency'],
+            transaction_data.get('lotId') or None,
             transaction_id
         )
         return self.db.execute_update(query, params) > 0
@@ -420,6 +880,269 @@ class TransactionManager:
         
         query = 'DELETE FROM Transactions WHERE id = ?'
         return self.db.execute_update(query, (transaction_id,)) > 0
+    
+    # ---- 账本重放 ----
+    def get_ledger_position(self, transaction_ids: List[str]) -> Optional[Tuple[float, int]]:
+        """获取给定交易中账本顺序最靠前的位置 (时间, rowid)"""
+        position = None
+        transaction_ids = list(set(transaction_ids))
+        for i in range(0, len(transaction_ids), 500):
+            chunk = transaction_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            query = f'''
+                SELECT {LEDGER_TIME} AS t, rowid AS r FROM Transactions
+                WHERE id IN ({placeholders})
+                ORDER BY t, r
+                LIMIT 1
+            '''
+            rows = self.db.execute_query(query, tuple(chunk))
+            if rows and (position is None or (rows[0]['t'], rows[0]['r']) < position):
+                position = (rows[0]['t'], rows[0]['r'])
+        return position
+    
+    def get_ledger_tail_ids(self, account_id: str, count: int) -> List[str]:
+        """按账本顺序获取账户最后 count 笔交易的ID（从前到后）"""
+        query = f'''
+            SELECT id FROM Transactions
+            WHERE accountId = ? AND {LEDGER_FILTER}
+            ORDER BY {LEDGER_TIME} DESC, rowid DESC
+            LIMIT ?
+        '''
+        return [row['id'] for row in reversed(self.db.execute_query(query, (account_id, count)))]
+    
+    _ENTRY_COLUMNS = f'''
+        id, direction, quantity, price, date, balanceQuantity, balanceCost, lotId,
+        {LEDGER_TIME} AS ledgerTime, rowid AS ledgerRowid, {LEDGER_MONTH} AS month
+    '''
+    
+    def to_ledger_time(self, date) -> float:
+        """把日期换算为账本时间（儒略日）"""
+        return self.db.execute_query('SELECT COALESCE(julianday(?), 0) AS t', (date,))[0]['t']
+    
+    def get_balance_before(self, account_id: str, position: Tuple[float, int]) -> Optional[Dict]:
+        """获取账本中位于 position 之前的最后一笔交易（含余额），没有更早的交易时返回None"""
+        query = f'''
+            SELECT {self._ENTRY_COLUMNS} FROM Transactions
+            WHERE accountId = ? AND {LEDGER_FILTER}
+              AND ({LEDGER_TIME} < ? OR ({LEDGER_TIME} = ? AND rowid < ?))
+            ORDER BY {LEDGER_TIME} DESC, rowid DESC
+            LIMIT 1
+        '''
+        results = self.db.execute_query(query, (account_id, position[0], position[0], position[1]))
+        return results[0] if results else None
+    
+    def get_last_entry_as_of(self, account_id: str, ledger_time: float) -> Optional[Dict]:
+        """获取账本时间不晚于 ledger_time 的最后一笔交易（含余额）"""
+        query = f'''
+            SELECT {self._ENTRY_COLUMNS} FROM Transactions
+            WHERE accountId = ? AND {LEDGER_FILTER} AND {LEDGER_TIME} <= ?
+            ORDER BY {LEDGER_TIME} DESC, rowid DESC
+            LIMIT 1
+        '''
+        results = self.db.execute_query(query, (account_id, ledger_time))
+        return results[0] if results else None
+    
+    def get_ledger_entries(self, account_id: str, position: Tuple[float, int] = None,
+                           exclusive: bool = False, until: float = None) -> List[Dict]:
+        """按账本顺序获取账户从 position 开始的交易（exclusive 为True时不含 position 本身）
+
+        position 为None时从头开始；until 给出时只返回账本时间不晚于 until 的交易。
+        """
+        query = f'''
+            SELECT {self._ENTRY_COLUMNS} FROM Transactions
+            WHERE accountId = ? AND {LEDGER_FILTER}
+        '''
+        params = (account_id,)
+        if position is not None:
+            query += f" AND ({LEDGER_TIME} > ? OR ({LEDGER_TIME} = ? AND rowid {'>' if exclusive else '>='} ?))"
+            params += (position[0], position[0], position[1])
+        if until is not None:
+            query += f' AND {LEDGER_TIME} <= ?'
+            params += (until,)
+        query += f' ORDER BY {LEDGER_TIME}, rowid'
+        return self.db.execute_query(query, params)
+    
+    def count_ledger_entries(self, account_id: str, after: Tuple[float, int] = None, before: Tuple[float, int] = None) -> int:
+        """统计账户在 (after, before) 之间（均不含）的交易笔数，端点为None表示不限"""
+        query = f'SELECT COUNT(*) AS n FROM Transactions WHERE accountId = ? AND {LEDGER_FILTER}'
+        params = (account_id,)
+        if after is not None:
+            query += f' AND ({LEDGER_TIME} > ? OR ({LEDGER_TIME} = ? AND rowid > ?))'
+            params += (after[0], after[0], after[1])
+        if before is not None:
+            query += f' AND ({LEDGER_TIME} < ? OR ({LEDGER_TIME} = ? AND rowid < ?))'
+            params += (before[0], before[0], before[1])
+        return self.db.execute_query(query, params)[0]['n']
+    
+    def iter_all_ledger_entries(self) -> Iterator[sqlite3.Row]:
+        """流式遍历所有账户的账本（按账户、账本顺序）
+
+        行为 (accountId, id, direction, quantity, price, date, lotId, ledgerTime, ledgerRowid, month)
+        """
+        query = f'''
+            SELECT accountId, id, direction, quantity, price, date, lotId,
+                   {LEDGER_TIME} AS ledgerTime, rowid AS ledgerRowid, {LEDGER_MONTH} AS month
+            FROM Transactions
+            WHERE {LEDGER_FILTER}
+            ORDER BY accountId, {LEDGER_TIME}, rowid
+        '''
+        return self.db.iter_query_rows(query)
+    
+    def update_balances(self, balances: List[tuple]) -> int:
+        """批量更新交易入账后的余额，元素为 (balanceQuantity, balanceCost, id)"""
+        if not balances:
+            return 0
+        query = 'UPDATE Transactions SET balanceQuantity = ?, balanceCost = ? WHERE id = ?'
+        return self.db.execute_many(query, balances)
+    
+    def stage_balances(self, balances: List[tuple]) -> int:
+        """把余额写入临时表（流式遍历 Transactions 期间不直接修改该表），元素为 (balanceQuantity, balanceCost, id)"""
+        self.db.execute_update('''
+            CREATE TEMP TABLE IF NOT EXISTS StagedBalances (
+                id VARCHAR(64) PRIMARY KEY,
+                balanceQuantity TEXT,
+                balanceCost TEXT
+            )
+        ''')
+        if not balances:
+            return 0
+        query = 'INSERT OR REPLACE INTO StagedBalances (balanceQuantity, balanceCost, id) VALUES (?, ?, ?)'
+        return self.db.execute_many(query, balances)
+    
+    def apply_staged_balances(self) -> int:
+        """把临时表中的余额一次性写回 Transactions 并删除临时表"""
+        self.stage_balances([])
+        updated = self.db.execute_update('''
+            UPDATE Transactions
+            SET balanceQuantity = s.balanceQuantity, balanceCost = s.balanceCost
+            FROM StagedBalances AS s
+            WHERE Transactions.id = s.id
+        ''')
+        self.db.execute_update('DROP TABLE StagedBalances')
+        return updated
+
+class AccountCheckpointManager:
+    """账户持仓检查点管理器"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def add_checkpoints(self, checkpoints: List[tuple]) -> int:
+        """批量写入检查点，元素为 (accountId, ledgerTime, ledgerRowid, asOfDate, quantity, cost, txCount)"""
+        if not checkpoints:
+            return 0
+        query = '''
+            INSERT OR REPLACE INTO AccountCheckpoint (accountId, ledgerTime, ledgerRowid, asOfDate, quantity, cost, txCount)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        return self.db.execute_many(query, checkpoints)
+    
+    def get_checkpoint_before(self, account_id: str, position: Tuple[float, int]) -> Optional[Dict]:
+        """获取账本位置在 position 之前（不含）的最近检查点"""
+        query = '''
+            SELECT * FROM AccountCheckpoint
+            WHERE accountId = ? AND (ledgerTime < ? OR (ledgerTime = ? AND ledgerRowid < ?))
+            ORDER BY ledgerTime DESC, ledgerRowid DESC
+            LIMIT 1
+        '''
+        results = self.db.execute_query(query, (account_id, position[0], position[0], position[1]))
+        return results[0] if results else None
+    
+    def get_checkpoint_as_of(self, account_id: str, ledger_time: float) -> Optional[Dict]:
+        """获取账本时间不晚于 ledger_time 的最近检查点"""
+        query = '''
+            SELECT * FROM AccountCheckpoint
+            WHERE accountId = ? AND ledgerTime <= ?
+            ORDER BY ledgerTime DESC, ledgerRowid DESC
+            LIMIT 1
+        '''
+        results = self.db.execute_query(query, (account_id, ledger_time))
+        return results[0] if results else None
+    
+    def get_checkpoints(self, account_id: str) -> List[Dict]:
+        """获取账户的全部检查点（按账本顺序）"""
+        query = 'SELECT * FROM AccountCheckpoint WHERE accountId = ? ORDER BY ledgerTime, ledgerRowid'
+        return self.db.execute_query(query, (account_id,))
+    
+    def delete_checkpoints_from(self, account_id: str, position: Tuple[float, int] = None) -> int:
+        """删除账本位置在 position 及之后的检查点（账本被修改后失效），position 为None时删除该账户全部检查点"""
+        if position is None:
+            return self.db.execute_update('DELETE FROM AccountCheckpoint WHERE accountId = ?', (account_id,))
+        query = '''
+            DELETE FROM AccountCheckpoint
+            WHERE accountId = ? AND (ledgerTime > ? OR (ledgerTime = ? AND ledgerRowid >= ?))
+        '''
+        return self.db.execute_update(query, (account_id, position[0], position[0], position[1]))
+
+
+class AccountLotManager:
+    """持仓批次与已实现盈亏管理器"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def get_lots(self, account_id: str, include_closed: bool = False) -> List[Dict]:
+        """按先进先出顺序获取账户的批次（默认只返回未平仓批次，走部分索引）"""
+        query = 'SELECT * FROM AccountLot WHERE accountId = ?'
+        if not include_closed:
+            query += ' AND isOpen = 1'
+        query += ' ORDER BY ledgerTime, ledgerRowid'
+        return self.db.execute_query(query, (account_id,))
+    
+    def get_lots_by_ids(self, lot_ids: List[str]) -> List[Dict]:
+        results = []
+        lot_ids = list(set(lot_ids))
+        for i in range(0, len(lot_ids), 500):
+            chunk = lot_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            results.extend(self.db.execute_query(f'SELECT * FROM AccountLot WHERE id IN ({placeholders})', tuple(chunk)))
+        return results
+    
+    def add_lots(self, lots: List[tuple]) -> int:
+        """批量写入批次，元素为 (id, accountId, ledgerTime, ledgerRowid, openDate, quantity, remainingQuantity, price, isOpen)"""
+        if not lots:
+            return 0
+        query = '''
+            INSERT OR REPLACE INTO AccountLot (id, accountId, ledgerTime, ledgerRowid, openDate, quantity, remainingQuantity, price, isOpen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        return self.db.execute_many(query, lots)
+    
+    def update_lots(self, lots: List[tuple]) -> int:
+        """批量更新批次剩余数量，元素为 (remainingQuantity, isOpen, id)"""
+        if not lots:
+            return 0
+        return self.db.execute_many('UPDATE AccountLot SET remainingQuantity = ?, isOpen = ? WHERE id = ?', lots)
+    
+    def add_realized(self, rows: List[tuple]) -> int:
+        """批量写入已实现盈亏，元素为 (accountId, transactionId, lotId, ledgerTime, ledgerRowid, date, quantity, costPrice, salePrice, pnl)"""
+        if not rows:
+            return 0
+        query = '''
+            INSERT INTO RealizedPnl (accountId, transactionId, lotId, ledgerTime, ledgerRowid, date, quantity, costPrice, salePrice, pnl)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        return self.db.execute_many(query, rows)
+    
+    def get_realized(self, account_id: str) -> List[Dict]:
+        """按账本顺序获取账户的已实现盈亏明细"""
+        query = 'SELECT * FROM RealizedPnl WHERE accountId = ? ORDER BY ledgerTime, ledgerRowid, id'
+        return self.db.execute_query(query, (account_id,))
+    
+    def delete_from(self, account_id: str, position: Tuple[float, int]) -> List[Dict]:
+        """删除账本位置在 position 及之后的批次与已实现盈亏，返回被删除的盈亏记录（用于恢复更早批次的剩余数量）"""
+        condition = 'accountId = ? AND (ledgerTime > ? OR (ledgerTime = ? AND ledgerRowid >= ?))'
+        params = (account_id, position[0], position[0], position[1])
+        realized = self.db.execute_query(f'SELECT lotId, quantity FROM RealizedPnl WHERE {condition}', params)
+        self.db.execute_update(f'DELETE FROM RealizedPnl WHERE {condition}', params)
+        self.db.execute_update(f'DELETE FROM AccountLot WHERE {condition}', params)
+        return realized
+    
+    def delete_account(self, account_id: str) -> int:
+        """删除账户的全部批次与已实现盈亏"""
+        self.db.execute_update('DELETE FROM RealizedPnl WHERE accountId = ?', (account_id,))
+        return self.db.execute_update('DELETE FROM AccountLot WHERE accountId = ?', (account_id,))
+
 
 class ForeignExchangeRateManager:
     """外汇汇率管理器"""
@@ -494,6 +1217,15 @@ class ForeignExchangeRateManager:
         '''
         return self.db.execute_update(query, (date,))
     
+    def get_latest_exchange_rates(self, date: str = None) -> Dict[str, Dict]:
+        """一次查询获取各货币在指定日期（默认今天）的最新汇率，返回 currency -> 汇率记录"""
+        query = '''
+            SELECT * FROM ForeignExchangeRate
+            WHERE DATE(created_at) = DATE(COALESCE(?, datetime('now', '+8 hours')))
+            ORDER BY created_at ASC
+        '''
+        return {row['foreign_currency']: row for row in self.db.execute_query(query, (date,))}
+    
     def get_latest_exchange_rate(self, currency: str, date: str = None) -> Optional[Dict]:
         """获取指定货币的最新汇率"""
         if currency == "CNY":
@@ -550,23 +1282,23 @@ class PriceTracingManager:
         return self.db.execute_insert(query, params)
     
     def get_price_tracing(self, account_id: str, start_date: str = None, end_date: str = None) -> List[Dict]:
-        """获取指定账户的价格追踪数据"""
-        if start_date and end_date:
-            query = '''
-                SELECT * FROM PriceTracing 
-                WHERE accountId = ? AND date BETWEEN ? AND ?
-                ORDER BY date ASC
-            '''
-            params = (account_id, start_date, end_date)
-        else:
-            query = '''
-                SELECT * FROM PriceTracing 
-                WHERE accountId = ?
-                ORDER BY date ASC
-            '''
-            params = (account_id,)
-        
-        return self.db.execute_query(query, params)
+        """获取指定账户的价格追踪数据（按时间升序），start_date/end_date 可单独指定；epoch 为日期对应的秒数，供降采样使用"""
+        query = "SELECT date, price, CAST(strftime('%s', date) AS INTEGER) AS epoch FROM PriceTracing WHERE accountId = ?"
+        params = [account_id]
+        if start_date:
+            query += ' AND date >= ?'
+            params.append(start_date)
+        if end_date:
+            query += ' AND date <= ?'
+            params.append(end_date)
+        query += ' ORDER BY date ASC'
+        return self.db.execute_query(query, tuple(params))
+    
+    def get_price_buckets(self, account_id: str, bucket_seconds: int,
+                          start_date: str = None, end_date: str = None) -> List[Dict]:
+        """按固定时长分桶聚合价格追踪数据，见 query_series_buckets"""
+        return query_series_buckets(self.db, 'PriceTracing', 'accountId', account_id, 'date', 'price',
+                                    bucket_seconds, start_date, end_date, tiebreak_column='id')
     
     def get_latest_price(self, account_id: str) -> Optional[Dict]:
         """获取指定账户的最新价格"""
@@ -596,4 +1328,282 @@ class PriceTracingManager:
     def delete_price_tracing_by_account(self, account_id: str) -> bool:
         """删除指定账户的所有价格追踪数据"""
         query = 'DELETE FROM PriceTracing WHERE accountId = ?'
-        return self.db.execute_update(query, (account_id,)) > 0
\ No newline at end of file
+        return self.db.execute_update(query, (account_id,)) > 0
+
+
+class DataVersionManager:
+    """用户数据版本管理器（版本号由触发器维护）"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def get_version(self, user_id: str) -> int:
+        """用户数据版本：该用户版本与全局（汇率）版本之和，两者都只增不减，任一变化都会使结果变化"""
+        query = "SELECT COALESCE(SUM(version), 0) AS version FROM DataVersion WHERE userId IN (?, '')"
+        return self.db.execute_query(query, (user_id,))[0]['version']
+
+
+class PortfolioValuationManager:
+    """用户总资产估值序列管理器"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def add_valuations(self, valuations: List[Dict]) -> int:
+        """批量写入估值点，同一用户同一时间点重复写入时覆盖"""
+        if not valuations:
+            return 0
+        query = '''
+            INSERT OR REPLACE INTO PortfolioValuation (userId, ts, value, currency, accountCount)
+            VALUES (?, ?, ?, ?, ?)
+        '''
+        params_seq = [(
+            item['userId'],
+            item['ts'],
+            str(item['value']),
+            item.get('currency', 'CNY'),
+            item.get('accountCount', 0)
+        ) for item in valuations]
+        return self.db.execute_many(query, params_seq)
+    
+    def get_valuations(self, user_id: str, start: str = None, end: str = None) -> List[Dict]:
+        """获取指定用户在时间范围内的估值序列（按时间升序），start/end 可单独指定；epoch 为时间对应的秒数，供降采样使用"""
+        query = "SELECT ts, value, currency, accountCount, CAST(strftime('%s', ts) AS INTEGER) AS epoch FROM PortfolioValuation WHERE userId = ?"
+        params = [user_id]
+        if start:
+            query += ' AND ts >= ?'
+            params.append(start)
+        if end:
+            query += ' AND ts <= ?'
+            params.append(end)
+        query += ' ORDER BY ts ASC'
+        return self.db.execute_query(query, tuple(params))
+    
+    def get_valuation_buckets(self, user_id: str, bucket_seconds: int, start: str = None, end: str = None) -> List[Dict]:
+        """按固定时长分桶聚合用户的估值序列（不同货币的估值分开聚合），见 query_series_buckets"""
+        return query_series_buckets(self.db, 'PortfolioValuation', 'userId', user_id, 'ts', 'value',
+                                    bucket_seconds, start, end, group_columns=('currency',))
+    
+    def get_latest_valuation(self, user_id: str) -> Optional[Dict]:
+        """获取指定用户最新的估值点"""
+        query = '''
+            SELECT ts, value, currency, accountCount FROM PortfolioValuation
+            WHERE userId = ?
+            ORDER BY ts DESC
+            LIMIT 1
+        '''
+        results = self.db.execute_query(query, (user_id,))
+        return results[0] if results else None
+
+
+class SymbolPriceHistoryManager:
+    """标的历史日K管理器"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def get_backfill_targets(self) -> List[Dict]:
+        """获取所有持仓股票标的及其首笔交易日期（无交易记录时first_date为None）"""
+        query = '''
+            SELECT a.symbol AS symbol, MIN(SUBSTR(t.date, 1, 10)) AS first_date
+            FROM Accounts a
+            LEFT JOIN Transactions t ON t.accountId = a.id
+            WHERE a.type = 'stock' AND a.isActive = 1
+            GROUP BY a.symbol
+            ORDER BY a.symbol
+        '''
+        return self.db.execute_query(query)
+    
+    def get_covered_range(self, symbol: str) -> Optional[Dict]:
+        """获取指定标的已回填的日期范围；没有回填记录时（旧版本写入的数据）取已入库日K的日期范围"""
+        results = self.db.execute_query(
+            'SELECT start_date, end_date FROM SymbolPriceCoverage WHERE symbol = ?', (symbol,)
+        )
+        if results:
+            return results[0]
+        query = '''
+            SELECT MIN(date) AS start_date, MAX(date) AS end_date
+            FROM SymbolPriceHistory
+            WHERE symbol = ?
+        '''
+        results = self.db.execute_query(query, (symbol,))
+        if not results or results[0]['start_date'] is None:
+            return None
+        return results[0]
+    
+    def set_covered_range(self, symbol: str, start_date: str, end_date: str) -> int:
+        """记录指定标的已回填的日期范围（覆盖原记录）"""
+        query = '''
+            INSERT INTO SymbolPriceCoverage (symbol, start_date, end_date) VALUES (?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET start_date = excluded.start_date, end_date = excluded.end_date
+        '''
+        return self.db.execute_update(query, (symbol, start_date, end_date))
+    
+    def add_candlesticks(self, symbol: str, candlesticks: List[Dict]) -> int:
+        """批量写入日K数据，已存在的(symbol, date)会被跳过"""
+        if not candlesticks:
+            return 0
+        query = '''
+            INSERT OR IGNORE INTO SymbolPriceHistory (symbol, date, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        params_seq = [(
+            symbol,
+            item['date'],
+            str(item['open']),
+            str(item['high']),
+            str(item['low']),
+            str(item['close']),
+            item.get('volume')
+        ) for item in candlesticks]
+        return self.db.execute_many(query, params_seq)
+    
+    def get_history(self, symbol: str, start_date: str = None, end_date: str = None) -> List[Dict]:
+        """获取指定标的的历史日K"""
+        if start_date and end_date:
+            query = '''
+                SELECT * FROM SymbolPriceHistory
+                WHERE symbol = ? AND date BETWEEN ? AND ?
+                ORDER BY date ASC
+            '''
+            params = (symbol, start_date, end_date)
+        else:
+            query = '''
+                SELECT * FROM SymbolPriceHistory
+                WHERE symbol = ?
+                ORDER BY date ASC
+            '''
+            params = (symbol,)
+        return self.db.execute_query(query, params)
+
+
+class SecurityStaticInfoManager:
+    """证券静态信息管理器"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def get_by_symbols(self, symbols: List[str]) -> Dict[str, Dict]:
+        """批量获取证券静态信息，返回 symbol -> 信息"""
+        results = {}
+        symbols = list(set(symbols))
+        # 分批查询，避免超过SQLite的参数数量上限
+        for i in range(0, len(symbols), 500):
+            chunk = symbols[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            query = f'SELECT * FROM SecurityStaticInfo WHERE symbol IN ({placeholders})'
+            for row in self.db.execute_query(query, tuple(chunk)):
+                results[row['symbol']] = row
+        return results
+    
+    def upsert_many(self, infos: List[Dict]) -> int:
+        """批量写入或更新证券静态信息"""
+        if not infos:
+            return 0
+        query = '''
+            INSERT OR REPLACE INTO SecurityStaticInfo (symbol, name_cn, name_en, lot_size, currency, exchange, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        params_seq = [(
+            info['symbol'],
+            info.get('name_cn'),
+            info.get('name_en'),
+            info.get('lot_size'),
+            info.get('currency'),
+            info.get('exchange'),
+            info['updated_at']
+        ) for info in infos]
+        return self.db.execute_many(query, params_seq)
+
+
+class ConfigItemManager:
+    """配置项管理器（Config表，值为JSON文本）"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def get_item(self, userId: str, type: str, item: str, subItem: str = '') -> Optional[str]:
+        """按 (userId, type, item, subItem) 点查配置值"""
+        query = 'SELECT value FROM Config WHERE userId = ? AND type = ? AND item = ? AND subItem = ?'
+        results = self.db.execute_query(query, (userId, type, item, subItem))
+        return results[0]['value'] if results else None
+    
+    def get_items(self, userId: str, type: str) -> List[Dict]:
+        """获取某个用户某类配置的全部配置项"""
+        query = 'SELECT item, subItem, value FROM Config WHERE userId = ? AND type = ?'
+        return self.db.execute_query(query, (userId, type))
+    
+    def upsert_items(self, userId: str, type: str, items: Dict[str, str], subItem: str = '') -> int:
+        """批量写入配置项，已存在则覆盖"""
+        if not items:
+            return 0
+        query = '''
+            INSERT INTO Config (userId, type, item, subItem, value)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(userId, type, item, subItem) DO UPDATE SET value = excluded.value
+        '''
+        return self.db.execute_many(query, [(userId, type, item, subItem, value) for item, value in items.items()])
+    
+    def delete_item(self, userId: str, type: str, item: str) -> bool:
+        """删除配置项（含全部subItem）"""
+        query = 'DELETE FROM Config WHERE userId = ? AND type = ? AND item = ?'
+        return self.db.execute_update(query, (userId, type, item)) > 0
+    
+    def get_user_ids(self, type: str) -> List[str]:
+        """获取拥有某类配置的全部用户ID"""
+        query = 'SELECT DISTINCT userId FROM Config WHERE type = ?'
+        return [row['userId'] for row in self.db.execute_query(query, (type,))]
+    
+    def count_items(self) -> int:
+        query = 'SELECT COUNT(*) AS total FROM Config'
+        return self.db.execute_query(query)[0]['total']
+
+
+class ChangeLogManager:
+    """变更记录管理器"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def add_change(self, scope: str, key: str, pid: int) -> str:
+        """记录一次变更"""
+        query = 'INSERT INTO ChangeLog (scope, key, pid) VALUES (?, ?, ?)'
+        return self.db.execute_insert(query, (scope, key, pid))
+    
+    def get_changes_since(self, last_id: int) -> List[Dict]:
+        """获取指定ID之后的变更记录"""
+        query = 'SELECT id, scope, key, pid FROM ChangeLog WHERE id > ? ORDER BY id'
+        return self.db.execute_query(query, (last_id,))
+    
+    def get_last_id(self) -> int:
+        query = 'SELECT COALESCE(MAX(id), 0) AS last_id FROM ChangeLog'
+        return self.db.execute_query(query)[0]['last_id']
+    
+    def cleanup_old_changes(self, minutes_to_keep: int = 60) -> int:
+        """清理过期的变更记录"""
+        query = "DELETE FROM ChangeLog WHERE created_at < datetime('now', '+8 hours', ?)"
+        return self.db.execute_update(query, (f'-{minutes_to_keep} minutes',))
+
+
+class LeaderLeaseManager:
+    """领导者租约管理器"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def try_acquire(self, name: str, holder: str, ttl: float, now: float) -> bool:
+        """获取或续约租约：租约不存在、已过期或本来就由 holder 持有时成功，单条语句原子完成"""
+        query = '''
+            INSERT INTO LeaderLease (name, holder, expiresAt) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expiresAt = excluded.expiresAt
+            WHERE LeaderLease.holder = excluded.holder OR LeaderLease.expiresAt < ?
+        '''
+        return self.db.execute_update(query, (name, holder, now + ttl, now)) > 0
+    
+    def release(self, name: str, holder: str) -> bool:
+        """释放自己持有的租约，其他进程无需等待过期即可接任"""
+        return self.db.execute_update('DELETE FROM LeaderLease WHERE name = ? AND holder = ?', (name, holder)) > 0
+    
+    def get_lease(self, name: str) -> Optional[Dict]:
+        results = self.db.execute_query('SELECT * FROM LeaderLease WHERE name = ?', (name,))
+        return results[0] if results else None
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+JSON 序列化
+orjson 可用时用它编码/解码，不可用时退回标准库 json；Decimal 编码为字符串，datetime 编码为 ISO 8601
+"""
+
+import dataclasses
+import decimal
+import uuid
+from datetime import date, datetime
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+from .app_config import AppConfig
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库 json
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """两种编码器都不能直接处理的类型"""
+    if isinstance(obj, decimal.Decimal):
+        # 与原有响应一致，金额以字符串输出，避免精度损失
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider：优先使用 orjson，响应直接输出 UTF-8 字节
+
+    响应默认紧凑输出，不随 DEBUG 缩进（DEBUG 默认开启），需要缩进时设置 JSON_PRETTY。
+    """
+
+    ensure_ascii = False
+    default = staticmethod(_default)
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.compact = not AppConfig.JSON_PRETTY
+
+    # 标准库 json 的这些参数在 orjson 中有对应选项，其余参数交给标准库处理
+    _ORJSON_KWARGS = {'indent', 'separators', 'default', 'ensure_ascii', 'sort_keys'}
+
+    def _encode(self, obj: Any, pretty: bool) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or not self._ORJSON_KWARGS.issuperset(kwargs):
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj, bool(kwargs.get('indent'))).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None:
+            dump_args = {'indent': 2} if pretty else {'separators': (',', ':')}
+            body = f"{super().dumps(obj, **dump_args)}\n"
+        else:
+            body = self._encode(obj, pretty) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
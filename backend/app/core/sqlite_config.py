@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+SQLite配置管理器
+与 TinyDBConfigManager 接口一致，配置存放在 SQLite 的 Config 表中
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .database import Database, ConfigItemManager
+from .tinydb_config import create_default_user_config
+
+# 全局配置在Config表中使用的userId
+GLOBAL_USER_ID = '__global__'
+
+
+class SQLiteConfigManager:
+    """SQLite配置管理器
+
+    每个顶层配置项一行：用户配置 type='user'、item=顶层键；全局配置 userId='__global__'、type='global'、item=键；
+    值以JSON文本存储。读写都是按 (userId, type, item) 的索引点查，无需扫描整个配置文档；
+    每次调用一个独立事务，多个进程可以安全地并发读写。
+    """
+
+    def set_global_config(self, config_data: Dict) -> bool:
+        """设置全局配置
+
+        Args:
+            config_data: 配置数据字典，每个key-value对将作为独立的配置项
+
+        Returns:
+            bool: 设置是否成功
+        """
+        try:
+            if not config_data:
+                return True
+            with Database() as db:
+                ConfigItemManager(db).upsert_items(GLOBAL_USER_ID, 'global', self._dump_items(config_data))
+            return True
+        except Exception as e:
+            print(f"设置全局配置失败: {str(e)}")
+            return False
+
+    def get_global_config(self, key: str) -> Optional[Any]:
+        """获取全局配置
+
+        Args:
+            key: 配置键名
+
+        Returns:
+            Any: 配置值，如果不存在则返回None
+        """
+        try:
+            with Database() as db:
+                value = ConfigItemManager(db).get_item(GLOBAL_USER_ID, 'global', key)
+            return json.loads(value) if value is not None else None
+        except Exception as e:
+            print(f"获取全局配置失败: {str(e)}")
+            return None
+
+    def delete_global_config(self, key: str) -> bool:
+        """删除全局配置
+
+        Args:
+            key: 配置键名
+
+        Returns:
+            bool: 删除是否成功
+        """
+        try:
+            with Database() as db:
+                return ConfigItemManager(db).delete_item(GLOBAL_USER_ID, 'global', key)
+        except Exception as e:
+            print(f"删除全局配置失败: {str(e)}")
+            return False
+
+    def set_user_config(self, userid: str, config_data: Dict) -> bool:
+        """设置用户配置（按顶层键覆盖，其余键保持不变）
+
+        Args:
+            userid: 用户ID
+            config_data: 配置数据字典
+
+        Returns:
+            bool: 设置是否成功
+        """
+        try:
+            items = {key: value for key, value in config_data.items() if key != 'userid'}
+            with Database() as db:
+                ConfigItemManager(db).upsert_items(userid, 'user', self._dump_items(items))
+            return True
+        except Exception as e:
+            print(f"设置用户配置失败: {str(e)}")
+            return False
+
+    def modify_user_config(self, userid: str, key: str, updater: Callable[[Any], Any]) -> bool:
+        """原子地读-改-写用户配置的一个顶层键
+
+        使用 BEGIN IMMEDIATE 在读取前获取写锁，多个进程并发修改同一配置不会丢失更新。
+
+        Args:
+            userid: 用户ID
+            key: 顶层配置键，如 'longport'
+            updater: 接收当前值（不存在时为None），返回新值
+
+        Returns:
+            bool: 写入是否成功
+        """
+        with Database() as db:
+            db.begin_immediate()
+            manager = ConfigItemManager(db)
+            items = {row['item']: row['value'] for row in manager.get_items(userid, 'user')}
+            if not items:
+                # 新用户先写入默认配置，与 get_user_config 的行为保持一致
+                items = self._dump_items({k: v for k, v in create_default_user_config(userid).items() if k != 'userid'})
+                manager.upsert_items(userid, 'user', items)
+            value = updater(json.loads(items[key]) if key in items else None)
+            manager.upsert_items(userid, 'user', self._dump_items({key: value}))
+        return True
+
+    def update_user_config(self, userid: str, config_data: Dict) -> bool:
+        """更新用户配置（按顶层键合并，用户不存在时创建）"""
+        return self.set_user_config(userid, config_data)
+
+    def get_user_config(self, userid: str) -> Optional[Dict]:
+        """获取用户配置
+
+        Args:
+            userid: 用户ID
+
+        Returns:
+            Dict: 用户配置信息，如果用户不存在则自动创建默认配置
+        """
+        try:
+            with Database() as db:
+                manager = ConfigItemManager(db)
+                rows = manager.get_items(userid, 'user')
+                if not rows:
+                    print(f"用户 {userid} 配置不存在，创建默认配置")
+                    default_config = create_default_user_config(userid)
+                    manager.upsert_items(userid, 'user', self._dump_items(
+                        {key: value for key, value in default_config.items() if key != 'userid'}
+                    ))
+                    return default_config
+
+            config = {'userid': userid}
+            config.update({row['item']: json.loads(row['value']) for row in rows})
+            return config
+        except Exception as e:
+            print(f"获取用户配置失败: {str(e)}")
+            return None
+
+    def get_all_user_ids(self) -> List[str]:
+        """获取所有用户ID
+
+        Returns:
+            List[str]: 所有用户ID列表
+        """
+        try:
+            with Database() as db:
+                return ConfigItemManager(db).get_user_ids('user')
+        except Exception as e:
+            print(f"获取所有用户ID失败: {str(e)}")
+            return []
+
+    def migrate_from_tinydb(self, tinydb_path: str) -> Tuple[int, int]:
+        """从TinyDB的config.json一次性导入配置
+
+        目标表已有配置时不做任何操作，避免覆盖迁移后的修改。
+
+        Returns:
+            Tuple[int, int]: (导入的用户数, 导入的全局配置数)
+        """
+        if not os.path.exists(tinydb_path):
+            return 0, 0
+        with open(tinydb_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        document = json.loads(content) if content else {}
+
+        with Database() as db:
+            manager = ConfigItemManager(db)
+            if manager.count_items() > 0:
+                return 0, 0
+
+            user_count = 0
+            for user_config in document.get('user_configs', {}).values():
+                userid = user_config.get('userid')
+                if not userid:
+                    continue
+                items = {key: value for key, value in user_config.items() if key != 'userid'}
+                manager.upsert_items(userid, 'user', self._dump_items(items))
+                user_count += 1
+
+            global_items = {}
+            for global_config in document.get('global_configs', {}).values():
+                global_items.update(global_config)
+            manager.upsert_items(GLOBAL_USER_ID, 'global', self._dump_items(global_items))
+
+        print(f"已从 {tinydb_path} 迁移 {user_count} 个用户配置、{len(global_items)} 项全局配置")
+        return user_count, len(global_items)
+
+    @staticmethod
+    def _dump_items(items: Dict) -> Dict[str, str]:
+        return {key: json.dumps(value, ensure_ascii=False) for key, value in items.items()}
+
+    def flush(self):
+        """每次写入都已提交，无需落盘"""
+
+    def close(self):
+        """每次调用使用独立连接，无需关闭"""
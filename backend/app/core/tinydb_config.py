@@ -4,16 +4,42 @@ TinyDB通用配置管理器
 提供基础的配置存储和管理功能
 """
 
+from contextlib import contextmanager
+import copy
 from datetime import timezone
 import os
 import json
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 from tinydb import TinyDB, Query
 from tinydb.storages import JSONStorage
 import threading
-# from tinydb.middlewares import CachingMiddleware  # 注释掉缓存中间件
+from .tinydb_storage import AtomicCachingStorage
+from ..util.file_lock import FileLock
 
 
+def create_default_user_config(userid: str) -> Dict:
+    """创建用户默认配置（各配置存储共用）
+    
+    Args:
+        userid: 用户ID
+        
+    Returns:
+        Dict: 默认配置字典
+    """
+    from datetime import datetime
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        'userid': userid,
+        'created_at': now,
+        'updated_at': now,
+        'settings': {
+            'currency': 'CNY',
+            'language': 'zh-CN',
+            'timezone': 'Asia/Shanghai'
+        },
+        'longport': {}
+    }
+
 class TinyDBConfigManager:
     """TinyDB通用配置管理器"""
     
@@ -39,34 +65,64 @@ class TinyDBConfigManager:
         Args:
             db_path: TinyDB数据库文件路径，如果为None则使用默认路径
         """
-        # 使用锁来确保线程安全
+        # 使用锁来确保线程安全（可重入：get_user_config 会在持锁时调用 set_user_config）
         if not hasattr(self, '_lock'):
-            self._lock = threading.Lock()
+            self._lock = threading.RLock()
 
         # 如果已经初始化过，直接返回
         if hasattr(self, 'db'):
             return
             
-        if db_path is None:
-            # 尝试从应用配置获取路径
-            try:
-                from .app_config import AppConfig
+        storage_mode, flush_interval, fsync, multiprocess = 'direct', 0, True, False
+        try:
+            from .app_config import AppConfig
+            if db_path is None:
                 db_path = AppConfig.TINYDB_CONFIG_PATH
-            except ImportError:
-                db_path = 'config.json'
+            storage_mode = AppConfig.TINYDB_STORAGE_MODE
+            flush_interval = AppConfig.TINYDB_FLUSH_INTERVAL
+            fsync = AppConfig.TINYDB_FSYNC
+            multiprocess = AppConfig.CONFIG_MULTIPROCESS
+        except ImportError:
+            db_path = db_path or 'config.json'
         
         # 确保配置目录存在
         config_dir = os.path.dirname(db_path)
         if config_dir and not os.path.exists(config_dir):
             os.makedirs(config_dir)
         
-        # 初始化TinyDB，不使用缓存中间件，确保数据立即写入
-        self.db = TinyDB(db_path, storage=JSONStorage)
+        # 多进程模式：每次操作持有跨进程文件锁，先加载其他进程的改动，写入立即落盘
+        self._file_lock = FileLock(db_path + '.lock') if multiprocess else None
+        if multiprocess:
+            flush_interval = 0
+
+        if storage_mode == 'caching':
+            # 文档常驻内存，写入合并后由后台线程按间隔原子落盘，落盘与读改写共用同一把锁
+            self.db = TinyDB(db_path, storage=AtomicCachingStorage, flush_interval=flush_interval,
+                             fsync=fsync, lock=self._lock)
+        else:
+            # 不使用缓存，每次写入立即重写整个文件
+            self.db = TinyDB(db_path, storage=JSONStorage)
 
         self.user_config_table = self.db.table('user_configs')
         self.global_config_table = self.db.table('global_configs')
         self.query = Query()
 
+    @contextmanager
+    def _locked(self):
+        """获取进程内锁；多进程模式下同时持有文件锁并同步其他进程的写入"""
+        with self._lock:
+            if self._file_lock is None:
+                yield
+                return
+            with self._file_lock:
+                storage = self.db.storage
+                if not isinstance(storage, AtomicCachingStorage) or storage.reload_if_changed():
+                    # 文档可能已被其他进程改写，丢弃表的查询缓存与下一个文档ID
+                    for table in (self.user_config_table, self.global_config_table):
+                        table.clear_cache()
+                        table._next_id = None
+                yield
+
     def set_global_config(self, config_data: Dict) -> bool:
         """设置全局配置
         
@@ -79,7 +135,7 @@ class TinyDBConfigManager:
         Returns:
             bool: 设置是否成功
         """
-        with self._lock:
+        with self._locked():
             try:
                 if not config_data:
                     return True
@@ -123,7 +179,7 @@ class TinyDBConfigManager:
         Returns:
             Any: 配置值，如果不存在则返回None
         """
-        with self._lock:
+        with self._locked():
             try:
                 config = self.global_config_table.get(self.query[key].exists())
                 return config[key] if config else None
@@ -140,7 +196,7 @@ class TinyDBConfigManager:
         Returns:
             bool: 删除是否成功
         """
-        with self._lock:
+        with self._locked():
             try:
                 removed = self.global_config_table.remove(self.query[key].exists())
                 return len(removed) > 0
@@ -158,7 +214,7 @@ class TinyDBConfigManager:
         Returns:
             bool: 设置是否成功
         """
-        with self._lock:
+        with self._locked():
             try:
                 # 检查是否已存在该用户的配置
                 existing_config = self.user_config_table.get(self.query.userid == userid)
@@ -180,6 +236,34 @@ class TinyDBConfigManager:
                 print(f"设置用户配置失败: {str(e)}")
                 return False
     
+    def modify_user_config(self, userid: str, key: str, updater: Callable[[Any], Any]) -> bool:
+        """原子地读-改-写用户配置的一个顶层键
+        
+        Args:
+            userid: 用户ID
+            key: 顶层配置键，如 'longport'
+            updater: 接收当前值（不存在时为None）的副本，返回新值
+            
+        Returns:
+            bool: 写入是否成功
+        """
+        with self._locked():
+            config = self.get_user_config(userid) or {}
+            value = updater(copy.deepcopy(config.get(key)))
+            return self.set_user_config(userid, {key: value})
+    
+    def update_user_config(self, userid: str, config_data: Dict) -> bool:
+        """更新用户配置（按顶层键合并，用户不存在时创建）
+        
+        Args:
+            userid: 用户ID
+            config_data: 配置数据字典
+            
+        Returns:
+            bool: 更新是否成功
+        """
+        return self.set_user_config(userid, config_data)
+    
     def get_user_config(self, userid: str) -> Optional[Dict]:
         """获取用户配置
         
@@ -189,7 +273,7 @@ class TinyDBConfigManager:
         Returns:
             Dict: 用户配置信息，如果用户不存在则自动创建默认配置
         """
-        with self._lock:
+        with self._locked():
             try:
                 config = self.user_config_table.get(self.query.userid == userid)
                 
@@ -216,7 +300,7 @@ class TinyDBConfigManager:
         Returns:
             List[str]: 所有用户ID列表
         """
-        with self._lock:
+        with self._locked():
             try:
                 all_configs = self.user_config_table.all()
                 user_ids = [config.get('userid') for config in all_configs if config.get('userid')]
@@ -234,17 +318,7 @@ class TinyDBConfigManager:
         Returns:
             Dict: 默认配置字典
         """
-        return {
-            'userid': userid,
-            'created_at': self._get_current_timestamp(),
-            'updated_at': self._get_current_timestamp(),
-            'settings': {
-                'currency': 'CNY',
-                'language': 'zh-CN',
-                'timezone': 'Asia/Shanghai'
-            },
-            'longport': {}
-        }
+        return create_default_user_config(userid)
     
     def _get_current_timestamp(self) -> str:
         """获取当前时间戳字符串
@@ -255,7 +329,13 @@ class TinyDBConfigManager:
         from datetime import datetime
         return datetime.now(timezone.utc).isoformat()
     
+    def flush(self):
+        """立即把缓存中的配置落盘（direct模式下无操作）"""
+        storage = self.db.storage
+        if isinstance(storage, AtomicCachingStorage):
+            storage.flush()
+    
     def close(self):
-        """关闭数据库连接"""
+        """关闭数据库连接（caching模式下会先落盘）"""
         if self.db:
             self.db.close() 
\ No newline at end of file
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+TinyDB写回缓存存储
+文档常驻内存，写入合并后按间隔原子落盘
+"""
+
+import atexit
+import copy
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+from tinydb.storages import Storage, touch
+
+
+class AtomicCachingStorage(Storage):
+    """写回缓存存储
+
+    读写都只操作内存中的文档，写入仅标记为脏；后台线程每 flush_interval 秒把脏文档
+    写入同目录的临时文件、fsync 后通过 os.replace 原子替换原文件，进程退出时再落盘一次。
+    flush_interval 为0时每次写入立即落盘（与 JSONStorage 的持久性相同，但仍是原子替换）。
+
+    read 返回文档的深拷贝：TinyDB 只浅拷贝 Document，若直接返回缓存，调用方修改嵌套字典（如 longport 配置）
+    会绕过锁与脏标记直接改动缓存；写入必须经过 write 才会生效并落盘。
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, fsync: bool = True,
+                 lock: Optional[threading.RLock] = None, encoding: str = 'utf-8', **kwargs):
+        super().__init__()
+        touch(path, create_dirs=False)
+        self._path = path
+        self._flush_interval = flush_interval
+        self._fsync = fsync
+        self._lock = lock or threading.RLock()
+        self._encoding = encoding
+        self._kwargs = kwargs
+        self._dirty = False
+        self._closed = threading.Event()
+
+        self._data: Optional[Dict] = None
+        self._signature = None
+        self._load()
+
+        atexit.register(self.flush)
+        if flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name='tinydb-flusher', daemon=True)
+            self._flusher.start()
+
+    def _file_signature(self):
+        stat = os.stat(self._path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        with open(self._path, 'r', encoding=self._encoding) as f:
+            content = f.read()
+        self._data = json.loads(content) if content else None
+        self._signature = self._file_signature()
+
+    def reload_if_changed(self) -> bool:
+        """文件被其他进程改写过时重新加载（调用方需持有跨进程锁），返回是否重新加载"""
+        with self._lock:
+            if self._dirty or self._file_signature() == self._signature:
+                return False
+            self._load()
+            return True
+
+    def read(self) -> Optional[Dict]:
+        with self._lock:
+            return copy.deepcopy(self._data)
+
+    def write(self, data: Dict) -> None:
+        with self._lock:
+            self._data = data
+            self._dirty = True
+            if self._flush_interval <= 0:
+                self.flush()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self._flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"配置文件落盘失败，下次重试: {str(e)}")
+
+    def flush(self) -> None:
+        """把脏文档原子写入磁盘：临时文件 -> fsync -> rename"""
+        with self._lock:
+            if not self._dirty:
+                return
+            content = json.dumps(self._data, **self._kwargs)
+            directory = os.path.dirname(os.path.abspath(self._path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self._path), suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding=self._encoding) as f:
+                    f.write(content)
+                    f.flush()
+                    if self._fsync:
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, self._path)
+                self._signature = self._file_signature()
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            if self._fsync and hasattr(os, 'O_DIRECTORY'):
+                # 同步目录项，保证rename本身在掉电后也可见
+                dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            self._dirty = False
+
+    def close(self) -> None:
+        self._closed.set()
+        self.flush()
@@ -0,0 +1,125 @@
+from collections import deque
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional
+
+
+class LotBook:
+    """单个账户的持仓批次簿
+
+    未平仓批次按账本顺序排在 deque 中：买入在队尾开新批次，先进先出卖出从队首消耗；
+    卖出指定批次（交易的 lotId）时通过 id 索引直接定位，被卖完的批次留在队列中，
+    轮到队首时再弹出（惰性删除），每笔卖出的代价只与实际消耗的批次数有关。
+    批次与已实现盈亏的变更先记在内存中，由调用方在同一个数据库事务中写回。
+
+    没有买入交易对应的持仓（期初持仓、启用批次记录之前的持仓）比所有批次都早，
+    第一次 apply 时为其建立一个期初批次放在队首，先进先出卖出时最先消耗。
+    """
+
+    OPENING_LOT_PREFIX = 'opening:'
+
+    def __init__(self, account_id: str, lots: Iterable[Dict] = (), opening_price: Optional[Decimal] = None):
+        self.account_id = account_id
+        self.opening_price = opening_price
+        self._queue = deque()
+        self._lots: Dict[str, Dict] = {}
+        self._opened: List[Dict] = []
+        self._changed = set()
+        self._seeded = False
+        self.realized: List[tuple] = []
+        for lot in lots:
+            self._push(dict(lot, remainingQuantity=Decimal(lot['remainingQuantity']), price=Decimal(lot['price'])))
+
+    @property
+    def opening_lot_id(self) -> str:
+        return self.OPENING_LOT_PREFIX + self.account_id
+
+    def _push(self, lot: Dict):
+        self._lots[lot['id']] = lot
+        if lot['remainingQuantity'] > 0:
+            self._queue.append(lot)
+
+    def _seed_opening(self, entry: Dict, quantity: Decimal, average_cost: Decimal) -> None:
+        """交易前持仓数量多于未平仓批次剩余数量之和时，差额作为期初批次放在队首
+
+        期初批次按期初成本计价（没有期初持仓时按交易前的平均成本），开仓日期记为首次建立时的交易日期。
+        """
+        self._seeded = True
+        if self.opening_lot_id in self._lots:
+            return
+        untracked = quantity - sum((lot['remainingQuantity'] for lot in self._lots.values()), Decimal('0'))
+        if untracked <= 0:
+            return
+        lot = {
+            'id': self.opening_lot_id, 'ledgerTime': 0, 'ledgerRowid': 0, 'openDate': entry['date'],
+            'quantity': untracked, 'remainingQuantity': untracked,
+            'price': self.opening_price if self.opening_price else average_cost
+        }
+        self._opened.append(lot)
+        self._lots[lot['id']] = lot
+        self._queue.appendleft(lot)
+
+    def apply(self, entry: Dict, average_cost: Decimal, quantity: Decimal) -> None:
+        """按一笔账本交易更新批次；quantity、average_cost 为交易前的持仓数量与平均成本"""
+        if not self._seeded:
+            self._seed_opening(entry, quantity, average_cost)
+        if entry['direction'] == 0:
+            quantity = Decimal(str(entry['quantity']))
+            lot = {
+                'id': entry['id'], 'ledgerTime': entry['ledgerTime'], 'ledgerRowid': entry['ledgerRowid'],
+                'openDate': entry['date'], 'quantity': quantity, 'remainingQuantity': quantity,
+                'price': Decimal(str(entry['price']))
+            }
+            self._opened.append(lot)
+            self._push(lot)
+        elif entry['direction'] == 1:
+            self._close(entry, average_cost)
+        else:
+            raise ValueError("direction字段必须是0（入账）或1（出账）")
+
+    def _close(self, entry: Dict, average_cost: Decimal) -> None:
+        remaining = Decimal(str(entry['quantity']))
+        sale_price = Decimal(str(entry['price']))
+        lot_id = entry['lotId']
+        if lot_id:
+            lot = self._lots.get(lot_id)
+            if lot is None or lot['remainingQuantity'] < remaining:
+                raise ValueError(f"批次 {lot_id} 不存在或剩余数量不足，无法卖出 {remaining}")
+            self._consume(entry, lot, remaining, sale_price)
+            return
+
+        queue = self._queue
+        while remaining > 0 and queue:
+            lot = queue[0]
+            take = min(remaining, lot['remainingQuantity'])
+            if take > 0:
+                self._consume(entry, lot, take, sale_price)
+                remaining -= take
+            if lot['remainingQuantity'] == 0:
+                queue.popleft()
+        if remaining > 0:
+            # 批次数量与持仓不一致时（数据异常）按交易前的平均成本计算剩余部分的盈亏
+            self._realize(entry, None, remaining, average_cost, sale_price)
+
+    def _consume(self, entry: Dict, lot: Dict, quantity: Decimal, sale_price: Decimal) -> None:
+        lot['remainingQuantity'] -= quantity
+        self._changed.add(lot['id'])
+        self._realize(entry, lot['id'], quantity, lot['price'], sale_price)
+
+    def _realize(self, entry: Dict, lot_id, quantity: Decimal, cost_price: Decimal, sale_price: Decimal) -> None:
+        pnl = (quantity * (sale_price - cost_price)).quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP)
+        self.realized.append((
+            self.account_id, entry['id'], lot_id, entry['ledgerTime'], entry['ledgerRowid'], str(entry['date']),
+            str(quantity), str(cost_price), str(sale_price), str(pnl)
+        ))
+
+    def opened_rows(self) -> List[tuple]:
+        """新开批次的写入行（已是最终剩余数量）"""
+        return [(lot['id'], self.account_id, lot['ledgerTime'], lot['ledgerRowid'], str(lot['openDate']),
+                 str(lot['quantity']), str(lot['remainingQuantity']), str(lot['price']), lot['remainingQuantity'] > 0)
+                for lot in self._opened]
+
+    def changed_rows(self) -> List[tuple]:
+        """已有批次剩余数量的更新行"""
+        opened = {lot['id'] for lot in self._opened}
+        return [(str(self._lots[lot_id]['remainingQuantity']), self._lots[lot_id]['remainingQuantity'] > 0, lot_id)
+                for lot_id in self._changed if lot_id not in opened]
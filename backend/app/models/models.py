@@ -1,9 +1,12 @@
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from decimal import Decimal, ROUND_HALF_UP
-from ..core.database import Database, AccountManager, TransactionManager
+from ..core.app_config import AppConfig
+from ..core.database import (Database, AccountManager, TransactionManager, AccountCheckpointManager, AccountLotManager,
+                             RECORD_ONLY_TRANSACTION_TYPES)
+from .lots import LotBook
 
 class AssetManagerContext:
     """资产写操作上下文（强制 with 使用）。"""
@@ -12,11 +15,15 @@ class AssetManagerContext:
         self._db: Optional[Database] = None
         self._am: Optional[AccountManager] = None
         self._tm: Optional[TransactionManager] = None
+        self._cm: Optional[AccountCheckpointManager] = None
+        self._lm: Optional[AccountLotManager] = None
 
     def __enter__(self) -> 'AssetManagerContext':
         self._db = Database().__enter__()
         self._am = AccountManager(self._db)
         self._tm = TransactionManager(self._db)
+        self._cm = AccountCheckpointManager(self._db)
+        self._lm = AccountLotManager(self._db)
         return self
 
     def __exit__(self, exc_type, exc, tb):
@@ -25,6 +32,8 @@ class AssetManagerContext:
         self._db = None
         self._am = None
         self._tm = None
+        self._cm = None
+        self._lm = None
 
     def rollback(self):
         if self._db is not None:
@@ -40,7 +49,8 @@ class AssetManagerContext:
         if 'userId' not in asset_data:
             raise ValueError("userId是必需字段")
 
-        existing_account = self._am.get_account_by_symbol(
+        # 资产编号只在活跃账户中唯一，未激活账户（如仅挂载历史交易的已清仓标的）不参与检查
+        existing_account = asset_data.get('isActive', True) and self._am.get_account_by_symbol(
             asset_data['userId'], asset_data.get('symbol', asset_data['id'])
         )
         if existing_account:
@@ -59,7 +69,10 @@ class AssetManagerContext:
             'cost': asset_data['cost'],
             'marketPrice': asset_data['cost'],
             'currency': asset_data['currency'],
-            'isActive': True
+            'isActive': asset_data.get('isActive', True),
+            # 建立账户时直接给出的持仓没有对应交易，记为期初持仓，账本重放从它开始
+            'openingQuantity': asset_data['quantity'],
+            'openingCost': asset_data['cost']
         })
 
     def delete_asset(self, userId: str, id: str) -> bool:
@@ -87,26 +100,18 @@ class AssetManagerContext:
             'isActive': True
         })
 
-    def update_asset_by_transaction(self, transaction_data: Dict) -> bool:
-        self._ensure_active()
-        if not transaction_data or 'userId' not in transaction_data or 'accountId' not in transaction_data:
-            raise ValueError("缺少必须字段")
-
-        account = self._am.get_account_by_id(transaction_data['accountId'])
-        if not account:
-            return False
-        if account['userId'] != transaction_data['userId']:
-            return False
-
-        original_quantity = Decimal(str(account['quantity']))
-        original_cost = Decimal(str(account['cost']))
-        transaction_quantity = Decimal(str(transaction_data['quantity']))
-        transaction_price = Decimal(str(transaction_data['price']))
-
+    @staticmethod
+    def _normalize_direction(transaction_data: Dict) -> None:
         if transaction_data['direction'] == 'buy':
             transaction_data['direction'] = 0
         if transaction_data['direction'] == 'sell':
             transaction_data['direction'] = 1
+
+    @staticmethod
+    def _apply_to_position(original_quantity: Decimal, original_cost: Decimal, transaction_data: Dict) -> tuple:
+        """按一笔交易计算新的持仓数量与平均成本，返回 (new_quantity, new_cost)"""
+        transaction_quantity = Decimal(str(transaction_data['quantity']))
+        transaction_price = Decimal(str(transaction_data['price']))
         direction = transaction_data['direction']
 
         if direction == 1:
@@ -124,8 +129,32 @@ class AssetManagerContext:
             new_cost = new_cost.quantize(Decimal('0.00000001'), rounding=ROUND_HALF_UP)
         else:
             raise ValueError("direction字段必须是0（入账）或1（出账）")
+        return new_quantity, new_cost
+
+    def update_asset_by_transaction(self, transaction_data: Dict) -> bool:
+        self._ensure_active()
+        if not transaction_data or 'userId' not in transaction_data or 'accountId' not in transaction_data:
+            raise ValueError("缺少必须字段")
+
+        account = self._am.get_account_by_id(transaction_data['accountId'])
+        if not account:
+            return False
+        if account['userId'] != transaction_data['userId']:
+            return False
+
+        self._normalize_direction(transaction_data)
+        new_quantity, new_cost = self._apply_to_position(
+            Decimal(str(account['quantity'])), Decimal(str(account['cost'])), transaction_data
+        )
+        transaction_data['balanceQuantity'] = new_quantity
+        transaction_data['balanceCost'] = new_cost
 
         self._tm.create_transaction(transaction_data)
+        # 补录的交易不在账本末尾，需要从它开始重放其后的交易
+        if self._tm.get_ledger_tail_ids(account['id'], 1) != [transaction_data['id']]:
+            self.replay_account(account['id'], self._tm.get_ledger_position([transaction_data['id']]))
+            return True
+        self._record_appended(account, [transaction_data['id']], Decimal(str(account['quantity'])), Decimal(str(account['cost'])))
         print(f"qwq update_account: {account['id']}, {new_quantity}, {new_cost}")
         return self._am.update_account(account['id'], {
             'type': account['type'],
@@ -138,6 +167,336 @@ class AssetManagerContext:
             'isActive': new_quantity > 0
         })
 
+    def update_assets_by_transactions(self, transactions: List[Dict]) -> int:
+        """批量按交易更新资产
+
+        按给定顺序逐笔计算持仓，交易记录一次批量写入，每个账户只更新一次。
+        账户不存在或不属于该用户的交易会被跳过，返回实际入账的交易数。
+        """
+        self._ensure_active()
+        positions: Dict[str, Dict] = {}
+        applied = []
+        for transaction_data in transactions:
+            if not transaction_data or 'userId' not in transaction_data or 'accountId' not in transaction_data:
+                raise ValueError("缺少必须字段")
+            account_id = transaction_data['accountId']
+            if account_id not in positions:
+                account = self._am.get_account_by_id(account_id)
+                positions[account_id] = {
+                    'account': account,
+                    'quantity': Decimal(str(account['quantity'])) if account else None,
+                    'cost': Decimal(str(account['cost'])) if account else None
+                }
+                positions[account_id]['originalQuantity'] = positions[account_id]['quantity']
+                positions[account_id]['originalCost'] = positions[account_id]['cost']
+            position = positions[account_id]
+            if not position['account'] or position['account']['userId'] != transaction_data['userId']:
+                continue
+
+            self._normalize_direction(transaction_data)
+            position['quantity'], position['cost'] = self._apply_to_position(
+                position['quantity'], position['cost'], transaction_data
+            )
+            transaction_data['balanceQuantity'] = position['quantity']
+            transaction_data['balanceCost'] = position['cost']
+            applied.append(transaction_data)
+
+        self._tm.create_transactions(applied)
+        applied_account_ids = {t['accountId'] for t in applied}
+        for account_id in applied_account_ids:
+            position = positions[account_id]
+            account = position['account']
+            self._am.update_account(account_id, {
+                'type': account['type'],
+                'parentId': account.get('parentId'),
+                'description': account.get('description'),
+                'quantity': str(position['quantity']),
+                'cost': str(position['cost']),
+                'marketPrice': account.get('marketPrice', str(position['cost'])),
+                'currency': account['currency'],
+                'isActive': position['quantity'] > 0
+            })
+            # 新交易没有按顺序追加在账本末尾时（补录了更早的交易），从最早的一笔开始重放
+            applied_ids = [t['id'] for t in applied if t['accountId'] == account_id]
+            if self._tm.get_ledger_tail_ids(account_id, len(applied_ids)) != applied_ids:
+                self.replay_account(account_id, self._tm.get_ledger_position(applied_ids))
+            else:
+                self._record_appended(account, applied_ids, position['originalQuantity'], position['originalCost'])
+        return len(applied)
+
+    def update_transaction(self, userId: str, transaction_id: str, transaction_data: Dict) -> bool:
+        """修改交易记录，并从受影响的位置重放账户持仓；交易不存在或不属于该用户时返回False"""
+        self._ensure_active()
+        existing = self._tm.get_transaction_by_id(transaction_id)
+        if not existing or existing['userId'] != userId:
+            return False
+
+        merged = {key: transaction_data.get(key, existing[key])
+                  for key in ('description', 'date', 'direction', 'quantity', 'price', 'currency', 'lotId')}
+        self._normalize_direction(merged)
+        old_position = self._tm.get_ledger_position([transaction_id])
+        self._tm.update_transaction(transaction_id, merged)
+        if existing['type'] not in RECORD_ONLY_TRANSACTION_TYPES:
+            # 修改日期可能使交易前移或后移，从新旧位置中靠前的一个开始重放
+            new_position = self._tm.get_ledger_position([transaction_id])
+            self.replay_account(existing['accountId'], min(old_position, new_position))
+        return True
+
+    def delete_transaction(self, userId: str, transaction_id: str) -> bool:
+        """删除交易记录，并从其位置重放账户持仓；交易不存在或不属于该用户时返回False"""
+        self._ensure_active()
+        existing = self._tm.get_transaction_by_id(transaction_id)
+        if not existing or existing['userId'] != userId:
+            return False
+
+        position = self._tm.get_ledger_position([transaction_id])
+        self._tm.delete_transaction(transaction_id)
+        if existing['type'] not in RECORD_ONLY_TRANSACTION_TYPES:
+            self.replay_account(existing['accountId'], position)
+        return True
+
+    @staticmethod
+    def _checkpoint_row(account_id: str, entry: Dict, quantity: Decimal, cost: Decimal, count: int) -> tuple:
+        return (account_id, entry['ledgerTime'], entry['ledgerRowid'], str(entry['date']), str(quantity), str(cost), count)
+
+    def _collect_checkpoints(self, account_id: str, previous: Optional[Dict], count: int, states) -> List[tuple]:
+        """遍历 (entry, quantity, cost) 序列，在每 N 笔交易及每月最后一笔交易处生成检查点
+
+        previous 为起点前一笔交易（含其入账后的 quantity/cost），count 为起点之前的交易笔数。
+        """
+        interval = max(AppConfig.LEDGER_CHECKPOINT_INTERVAL, 1)
+        checkpoints = []
+        for entry, quantity, cost in states:
+            # 进入新的月份：前一笔是上个月的最后一笔交易
+            if previous is not None and entry['month'] != previous['month']:
+                checkpoints.append(self._checkpoint_row(
+                    account_id, previous, previous['quantity'], previous['cost'], count
+                ))
+            count += 1
+            if count % interval == 0:
+                checkpoints.append(self._checkpoint_row(account_id, entry, quantity, cost, count))
+            previous = dict(entry, quantity=quantity, cost=cost)
+        return checkpoints
+
+    def _ledger_count_before(self, account_id: str, position: Tuple[float, int]) -> int:
+        """账本中位于 position 之前的交易笔数：从最近的检查点开始计数，只需统计其后的少量交易"""
+        checkpoint = self._cm.get_checkpoint_before(account_id, position)
+        if checkpoint is None:
+            return self._tm.count_ledger_entries(account_id, before=position)
+        return checkpoint['txCount'] + self._tm.count_ledger_entries(
+            account_id, after=(checkpoint['ledgerTime'], checkpoint['ledgerRowid']), before=position
+        )
+
+    def _new_lot_book(self, account: Dict, lots=()) -> LotBook:
+        """创建账户的批次簿，期初批次按账户的期初成本计价"""
+        opening_quantity, opening_cost = self._opening_balance(account)
+        return LotBook(account['id'], lots, opening_cost if opening_quantity > 0 else None)
+
+    def _load_lot_book(self, account: Dict, position: Tuple[float, int] = None) -> LotBook:
+        """撤销账本位置 position 及之后的批次与已实现盈亏（None 表示全部），返回撤销后的未平仓批次簿
+
+        被撤销的卖出按已实现盈亏记录把数量退回原批次，因此只需重放 position 之后的交易。
+        """
+        account_id = account['id']
+        if position is None:
+            self._lm.delete_account(account_id)
+            return self._new_lot_book(account)
+        restored: Dict[str, Decimal] = {}
+        for row in self._lm.delete_from(account_id, position):
+            if row['lotId'] is not None:
+                restored[row['lotId']] = restored.get(row['lotId'], Decimal('0')) + Decimal(row['quantity'])
+        self._lm.update_lots([(str(Decimal(lot['remainingQuantity']) + restored[lot['id']]), True, lot['id'])
+                              for lot in self._lm.get_lots_by_ids(list(restored))])
+        return self._new_lot_book(account, self._lm.get_lots(account_id))
+
+    def _save_lot_book(self, book: LotBook) -> None:
+        self._lm.add_lots(book.opened_rows())
+        self._lm.update_lots(book.changed_rows())
+        self._lm.add_realized(book.realized)
+
+    def _record_appended(self, account: Dict, transaction_ids: List[str], quantity: Decimal, cost: Decimal) -> None:
+        """为追加在账本末尾、已带余额的新交易补记检查点并更新持仓批次，quantity、cost 为这些交易之前的持仓"""
+        account_id = account['id']
+        position = self._tm.get_ledger_position(transaction_ids)
+        entries = self._tm.get_ledger_entries(account_id, position)
+        if AppConfig.LEDGER_LOT_TRACKING:
+            book = self._new_lot_book(account, self._lm.get_lots(account_id))
+            for entry in entries:
+                book.apply(entry, cost, quantity)
+                quantity, cost = Decimal(entry['balanceQuantity']), Decimal(entry['balanceCost'])
+            self._save_lot_book(book)
+
+        previous = self._tm.get_balance_before(account_id, position)
+        if previous is not None:
+            if previous['balanceQuantity'] is None:
+                return  # 旧数据没有余额，等待全量重建
+            previous = dict(previous, quantity=Decimal(previous['balanceQuantity']), cost=Decimal(previous['balanceCost']))
+        states = [(entry, Decimal(entry['balanceQuantity']), Decimal(entry['balanceCost'])) for entry in entries]
+        self._cm.add_checkpoints(self._collect_checkpoints(
+            account_id, previous, self._ledger_count_before(account_id, position), states
+        ))
+
+    @staticmethod
+    def _opening_balance(account: Optional[Dict]) -> Tuple[Decimal, Decimal]:
+        """账户的期初持仓 (quantity, cost)，即账本第一笔交易之前的持仓"""
+        if not account:
+            return Decimal('0'), Decimal('0')
+        return Decimal(account.get('openingQuantity') or '0'), Decimal(account.get('openingCost') or '0')
+
+    def replay_account(self, account_id: str, position: Tuple[float, int] = None) -> Optional[Tuple[Decimal, Decimal]]:
+        """按账本顺序重放账户交易，重算每笔交易后的余额、检查点及账户持仓，返回 (quantity, cost)
+
+        给出 position 时增量重放：以账本中前一笔交易记录的余额为起点，只重算 position 及之后的交易；
+        前一笔交易没有余额记录（旧数据）时从最近的检查点开始，没有检查点则从账户的期初持仓开始重放。
+        position 及之后的检查点、持仓批次与已实现盈亏会先撤销再重新生成。
+        卖出超过持有数量或指定批次剩余不足时抛出ValueError。
+        """
+        self._ensure_active()
+        account = self._am.get_account_by_id(account_id)
+        quantity, cost = self._opening_balance(account)
+        start, exclusive, previous, count = None, False, None, 0
+        if position is not None:
+            self._cm.delete_checkpoints_from(account_id, position)
+            previous = self._tm.get_balance_before(account_id, position)
+            if previous is not None and previous['balanceQuantity'] is not None:
+                quantity, cost = Decimal(previous['balanceQuantity']), Decimal(previous['balanceCost'])
+                start, count = position, self._ledger_count_before(account_id, position)
+            else:
+                checkpoint = self._cm.get_checkpoint_before(account_id, position)
+                if checkpoint is not None:
+                    quantity, cost = Decimal(checkpoint['quantity']), Decimal(checkpoint['cost'])
+                    start, exclusive, count = (checkpoint['ledgerTime'], checkpoint['ledgerRowid']), True, checkpoint['txCount']
+                previous = None
+            if previous is not None:
+                previous = dict(previous, quantity=quantity, cost=cost)
+        else:
+            self._cm.delete_checkpoints_from(account_id)
+        book = self._load_lot_book(account, position) if AppConfig.LEDGER_LOT_TRACKING and account else None
+
+        balances = []
+        states = []
+        for entry in self._tm.get_ledger_entries(account_id, start, exclusive):
+            before = (quantity, cost)
+            quantity, cost = self._apply_to_position(quantity, cost, entry)
+            # 从检查点开始重放时，position 之前的交易只用于恢复余额，其批次没有被撤销
+            if book is not None and (position is None or (entry['ledgerTime'], entry['ledgerRowid']) >= position):
+                book.apply(entry, before[1], before[0])
+            balances.append((str(quantity), str(cost), entry['id']))
+            states.append((entry, quantity, cost))
+        self._tm.update_balances(balances)
+        self._cm.add_checkpoints(self._collect_checkpoints(account_id, previous, count, states))
+        if book is not None:
+            self._save_lot_book(book)
+        self._am.update_positions([(str(quantity), str(cost), quantity > 0, account_id)])
+        return quantity, cost
+
+    def rebuild_all_accounts(self) -> Dict:
+        """单次流式遍历全部交易，从期初持仓起重建所有有交易记录的账户持仓、每笔交易的余额、检查点及持仓批次
+
+        某个账户重放失败（如卖出超过持有数量）时跳过该账户，不影响其他账户；
+        旧的检查点与批次在账户重放成功后才替换，失败的账户保持原有持仓、余额、检查点与批次。
+
+        Returns:
+            Dict: {'accounts': 重建的账户数, 'transactions': 重放的交易数, 'failed': {accountId: 错误信息}}
+        """
+        self._ensure_active()
+        openings = self._am.get_opening_balances()
+        track_lots = AppConfig.LEDGER_LOT_TRACKING
+        positions = []
+        failed = {}
+        staged = []
+        current = {'accountId': None}
+
+        def finish_account():
+            if current['accountId'] is None or current['accountId'] in failed:
+                return
+            staged.append(self._tm.stage_balances(current['balances']))
+            self._cm.delete_checkpoints_from(current['accountId'])
+            self._cm.add_checkpoints(self._collect_checkpoints(current['accountId'], None, 0, current['states']))
+            if current['book'] is not None:
+                self._lm.delete_account(current['accountId'])
+                self._save_lot_book(current['book'])
+            quantity, cost = current['quantity'], current['cost']
+            positions.append((str(quantity), str(cost), quantity > 0, current['accountId']))
+
+        for row in self._tm.iter_all_ledger_entries():
+            account_id, transaction_id = row['accountId'], row['id']
+            if account_id != current['accountId']:
+                finish_account()
+                quantity, cost = openings.get(account_id, (Decimal('0'), Decimal('0')))
+                book = LotBook(account_id, opening_price=cost if quantity > 0 else None) if track_lots else None
+                current = {'accountId': account_id, 'quantity': quantity, 'cost': cost,
+                           'balances': [], 'states': [], 'book': book}
+            if account_id in failed:
+                continue
+            try:
+                before = (current['quantity'], current['cost'])
+                current['quantity'], current['cost'] = self._apply_to_position(current['quantity'], current['cost'], row)
+                if current['book'] is not None:
+                    current['book'].apply(row, before[1], before[0])
+            except ValueError as e:
+                failed[account_id] = str(e)
+                continue
+            current['balances'].append((str(current['quantity']), str(current['cost']), transaction_id))
+            current['states'].append((row, current['quantity'], current['cost']))
+        finish_account()
+
+        self._tm.apply_staged_balances()
+        self._am.update_positions(positions)
+        return {'accounts': len(positions), 'transactions': sum(staged), 'failed': failed}
+
+    def get_position_as_of(self, account_id: str, date) -> Dict:
+        """查询账户在指定时间点的持仓 {'quantity', 'cost', 'asOfDate'}
+
+        优先使用该时间点前最后一笔交易记录的余额；旧数据没有余额时从最近的检查点开始重放。
+        """
+        self._ensure_active()
+        ledger_time = self._tm.to_ledger_time(date)
+        entry = self._tm.get_last_entry_as_of(account_id, ledger_time)
+        quantity, cost = self._opening_balance(self._am.get_account_by_id(account_id))
+        if entry is None:
+            return {'quantity': quantity, 'cost': cost, 'asOfDate': None}
+        if entry['balanceQuantity'] is not None:
+            return {'quantity': Decimal(entry['balanceQuantity']), 'cost': Decimal(entry['balanceCost']), 'asOfDate': entry['date']}
+
+        start = None
+        checkpoint = self._cm.get_checkpoint_as_of(account_id, ledger_time)
+        if checkpoint is not None:
+            quantity, cost = Decimal(checkpoint['quantity']), Decimal(checkpoint['cost'])
+            start = (checkpoint['ledgerTime'], checkpoint['ledgerRowid'])
+        for entry in self._tm.get_ledger_entries(account_id, start, exclusive=True, until=ledger_time):
+            quantity, cost = self._apply_to_position(quantity, cost, entry)
+        return {'quantity': quantity, 'cost': cost, 'asOfDate': entry['date']}
+
+    def get_lots(self, account_id: str, include_closed: bool = False) -> Dict:
+        """从批次表读取账户的持仓批次及已实现盈亏明细 {'lots', 'realized', 'realizedPnl'}"""
+        self._ensure_active()
+        realized = self._lm.get_realized(account_id)
+        return {
+            'lots': self._lm.get_lots(account_id, include_closed),
+            'realized': realized,
+            'realizedPnl': sum((Decimal(row['pnl']) for row in realized), Decimal('0'))
+        }
+
+    def record_transactions(self, transactions: List[Dict]) -> int:
+        """批量写入仅作记录的交易（不改变账户持仓），如导入的历史成交"""
+        self._ensure_active()
+        for transaction_data in transactions:
+            self._normalize_direction(transaction_data)
+        return self._tm.create_transactions(transactions)
+
+    def get_assets_by_id_prefix(self, userId: str, prefix: str) -> List[Dict]:
+        """在当前事务内获取ID前缀匹配的账户（含未激活账户）"""
+        self._ensure_active()
+        return self._am.get_accounts_by_id_prefix(userId, prefix)
+
+    def get_existing_external_ids(self, external_ids: List[str]) -> set:
+        """在当前事务内查询已入库的外部ID"""
+        self._ensure_active()
+        if not external_ids:
+            return set()
+        return self._tm.get_existing_external_ids(external_ids)
+
     def add_asset_with_initial_transaction(self, asset_data: Dict, transaction_data: Dict) -> None:
         self._ensure_active()
         self.add_asset(asset_data)
@@ -170,6 +529,9 @@ class AssetManagerContext:
 
     def get_asset_by_id(self, account_id: str) -> Optional[Dict]:
         """根据account_id获取资产"""
+        # 上下文内复用当前事务，才能读到本事务尚未提交的写入
+        if self._am is not None:
+            return self._am.get_account_by_id(account_id)
         with Database() as db:
             return AccountManager(db).get_account_by_id(account_id)
         
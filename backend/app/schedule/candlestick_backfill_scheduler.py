@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+历史K线回填定时任务模块
+"""
+
+import schedule
+import logging
+import os
+from app.services.candlestick_backfill import CandlestickBackfiller
+
+logger = logging.getLogger(__name__)
+
+def backfill_candlesticks():
+    """回填所有持仓标的的历史日K"""
+    logger.info("开始回填持仓标的历史K线...")
+    
+    try:
+        results = CandlestickBackfiller().backfill_all()
+        logger.info(f"历史K线回填完成: {len(results)} 个标的，新增 {sum(results.values())} 条日K")
+    except Exception as e:
+        logger.error(f"回填历史K线时发生错误: {e}")
+
+def setup_candlestick_backfill_scheduler():
+    """设置历史K线回填定时任务"""
+    logger.info("设置历史K线回填定时任务...")
+    
+    # 设置时区为Asia/Shanghai (+8)
+    os.environ['TZ'] = 'Asia/Shanghai'
+    
+    # 每天06:00执行（北京时间），此时各市场前一交易日K线均已收盘
+    schedule.every().day.at("06:00").do(backfill_candlesticks)
+    
+    logger.info("历史K线回填定时任务设置完成，每天06:00执行（北京时间）")
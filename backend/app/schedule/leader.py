@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+定时任务领导者选举
+多worker部署时每个进程都参与竞选，只有持有 SQLite 租约的进程运行定时任务
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.core.app_config import AppConfig
+from app.core.database import Database, LeaderLeaseManager
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'scheduler'
+
+_candidate = None
+_candidate_lock = threading.Lock()
+
+
+class SchedulerLeader:
+    """定时任务领导者
+
+    后台线程每隔 SCHEDULER_LEASE_HEARTBEAT 秒尝试获取/续约租约，成为领导者后在独立线程中运行调度器。
+    租约的有效期从发起续约的时刻算起，提前一个心跳周期视为失效：续约被拒绝、出错或返回时已超过该时刻
+    都会停止调度器，调度器在执行每个任务前也会检查租约，保证同一时间最多只有一个进程运行定时任务。
+    续约连接的写锁等待时间远小于 ttl - heartbeat，数据库繁忙时不会阻塞到租约被他人接任之后。
+    进程退出时主动释放租约。
+    """
+
+    def __init__(self, ttl: float = None, heartbeat: float = None):
+        self.ttl = ttl or AppConfig.SCHEDULER_LEASE_TTL
+        self.heartbeat = heartbeat or AppConfig.SCHEDULER_LEASE_HEARTBEAT
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        # 续约连接等待写锁的秒数，保证阻塞的续约在租约失效前返回
+        self.lock_timeout = max((self.ttl - self.heartbeat) / 2, 0.1)
+        self._stop = threading.Event()
+        self._scheduler_stop = None
+        self._lease_valid_until = None
+        self._thread = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._scheduler_stop is not None
+
+    def holds_lease(self) -> bool:
+        """租约是否仍在有效期内（已扣除一个心跳周期的余量）"""
+        valid_until = self._lease_valid_until
+        return valid_until is not None and time.monotonic() < valid_until
+
+    def _try_acquire(self) -> Optional[bool]:
+        """获取/续约租约，出错时返回 None"""
+        try:
+            with Database(timeout=self.lock_timeout) as db:
+                return LeaderLeaseManager(db).try_acquire(LEASE_NAME, self.holder, self.ttl, time.time())
+        except Exception as e:
+            logger.warning(f"竞选/续约定时任务租约失败: {e}")
+            return None
+
+    def _start_scheduler(self):
+        from app.schedule.scheduler import start_scheduler
+        logger.info(f"进程 {self.holder} 成为定时任务领导者")
+        self._scheduler_stop = threading.Event()
+        threading.Thread(target=start_scheduler, args=(self._scheduler_stop, self.holds_lease),
+                         name='scheduler', daemon=True).start()
+
+    def _stop_scheduler(self):
+        if self._scheduler_stop is not None:
+            logger.warning(f"进程 {self.holder} 失去定时任务领导者身份，停止调度器")
+            self._scheduler_stop.set()
+            self._scheduler_stop = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            acquired = self._try_acquire()
+            if acquired:
+                # 写入的过期时间不早于发起续约的时刻 + ttl
+                self._lease_valid_until = started + self.ttl - self.heartbeat
+            elif acquired is False:
+                self._lease_valid_until = None
+            if self.holds_lease():
+                if not self.is_leader:
+                    self._start_scheduler()
+            elif self.is_leader:
+                self._stop_scheduler()
+            self._stop.wait(self.heartbeat)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='scheduler-leader', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止竞选与调度器，并释放持有的租约"""
+        self._stop.set()
+        was_leader = self.is_leader
+        self._lease_valid_until = None
+        self._stop_scheduler()
+        if was_leader:
+            try:
+                with Database(timeout=self.lock_timeout) as db:
+                    LeaderLeaseManager(db).release(LEASE_NAME, self.holder)
+            except Exception as e:
+                logger.warning(f"释放定时任务租约失败: {e}")
+
+
+def start_scheduler_candidate() -> SchedulerLeader:
+    """在当前进程中启动定时任务竞选（每个进程只启动一次）"""
+    global _candidate
+    with _candidate_lock:
+        if _candidate is None:
+            _candidate = SchedulerLeader()
+            _candidate.start()
+    return _candidate
+
+
+def stop_scheduler_candidate():
+    global _candidate
+    with _candidate_lock:
+        if _candidate is not None:
+            _candidate.stop()
+            _candidate = None
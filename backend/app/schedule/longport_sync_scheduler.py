@@ -5,56 +5,98 @@
 
 import schedule
 import logging
-from app.core.tinydb_config import TinyDBConfigManager
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from app.core.app_config import AppConfig
+from app.core.config_store import get_config_manager
 from app.services.longport import LongportService
+from app.services.longport_push import longport_push_manager
 
 logger = logging.getLogger(__name__)
 
+# 同步线程池（进程内共享），并发数受 LONGPORT_SYNC_WORKERS 限制，调用频率受 longport 模块的全局限流器限制
+_sync_executor = ThreadPoolExecutor(max_workers=AppConfig.LONGPORT_SYNC_WORKERS, thread_name_prefix='longport-sync')
+# 防止上一轮尚未结束时开始新一轮
+_sync_run_lock = threading.Lock()
+# 正在执行的配置（含已超时但线程仍在运行的），避免同一配置被重复提交
+_inflight_configs = set()
+_inflight_lock = threading.Lock()
+# 历史订单导入任务互斥
+_import_run_lock = threading.Lock()
+
+def _sync_one_config(user_id: str, config_id: str, started_at: dict):
+    """同步单个长桥配置（在线程池中执行）"""
+    started_at[(user_id, config_id)] = time.monotonic()
+    try:
+        logger.debug(f"更新用户 {user_id} 的配置 {config_id}")
+        LongportService(user_id).update_user_longbridge_account(config_id)
+        logger.info(f"用户 {user_id} 的配置 {config_id} 更新成功")
+    finally:
+        with _inflight_lock:
+            _inflight_configs.discard((user_id, config_id))
+
+def _collect_sync_tasks(config_manager):
+    """收集所有用户的长桥配置"""
+    tasks = []
+    for user_id in config_manager.get_all_user_ids():
+        try:
+            longport_configs = LongportService(user_id).get_all_longport_configs()
+            if not longport_configs:
+                logger.info(f"用户 {user_id} 没有长桥配置，跳过")
+                continue
+            tasks.extend((user_id, config_id) for config_id in longport_configs.keys())
+        except Exception as e:
+            logger.error(f"读取用户 {user_id} 的长桥配置时发生错误: {e}")
+    return tasks
+
 def _sync_all_user_longport_accounts():
     """同步所有用户的长桥账户"""
     try:
         # 获取配置管理器
-        config_manager = TinyDBConfigManager()
-        
-        # 获取所有用户ID
-        user_ids = config_manager.get_all_user_ids()
+        config_manager = get_config_manager()
         
-        if not user_ids:
-            logger.info("没有找到用户，跳过长桥账户同步")
+        tasks = _collect_sync_tasks(config_manager)
+        if not tasks:
+            logger.info("没有找到长桥配置，跳过长桥账户同步")
             return
         
-        logger.info(f"开始同步 {len(user_ids)} 个用户的长桥账户...")
+        logger.info(f"开始并发同步 {len(tasks)} 个长桥配置...")
         
-        # 遍历每个用户
-        for user_id in user_ids:
-            try:
-                logger.info(f"同步用户 {user_id} 的长桥账户...")
-                
-                # 创建LongportService实例
-                longport_service = LongportService(user_id)
-                
-                # 获取该用户的所有长桥配置
-                longport_configs = longport_service.get_all_longport_configs()
-                
-                if not longport_configs:
-                    logger.info(f"用户 {user_id} 没有长桥配置，跳过")
+        started_at = {}
+        futures = {}
+        for task in tasks:
+            with _inflight_lock:
+                if task in _inflight_configs:
+                    logger.warning(f"用户 {task[0]} 的配置 {task[1]} 上次同步仍在进行，本轮跳过")
                     continue
-                
-                # 遍历每个配置ID并更新账户
-                for config_id in longport_configs.keys():
-                    try:
-                        logger.debug(f"更新用户 {user_id} 的配置 {config_id}")
-                        longport_service.update_user_longbridge_account(config_id)
-                        logger.info(f"用户 {user_id} 的配置 {config_id} 更新成功")
-                    except Exception as e:
-                        logger.error(f"更新用户 {user_id} 的配置 {config_id} 失败: {e}")
-                        continue
-                
-                logger.info(f"用户 {user_id} 的长桥账户同步完成")
-                
-            except Exception as e:
-                logger.error(f"同步用户 {user_id} 的长桥账户时发生错误: {e}")
-                continue
+                _inflight_configs.add(task)
+            futures[_sync_executor.submit(_sync_one_config, task[0], task[1], started_at)] = task
+        
+        # 等待所有任务完成；单个配置从开始执行起超过超时时间则放弃等待（线程结束前不会被再次提交）
+        pending = set(futures)
+        timeout = AppConfig.LONGPORT_SYNC_TIMEOUT_SECONDS
+        # 整轮截止时间：线程池被超时任务占满时，未开始的任务取消，留待下一轮
+        run_deadline = time.monotonic() + timeout * (len(futures) // AppConfig.LONGPORT_SYNC_WORKERS + 2)
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                user_id, config_id = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"更新用户 {user_id} 的配置 {config_id} 失败: {e}")
+            now = time.monotonic()
+            for future in list(pending):
+                task = futures[future]
+                if task in started_at and now - started_at[task] > timeout:
+                    logger.error(f"用户 {task[0]} 的配置 {task[1]} 同步超时（{timeout}秒），放弃等待")
+                    pending.discard(future)
+                elif now > run_deadline and future.cancel():
+                    logger.warning(f"用户 {task[0]} 的配置 {task[1]} 未能在本轮开始执行，已取消")
+                    with _inflight_lock:
+                        _inflight_configs.discard(task)
+                    pending.discard(future)
         
         logger.info("所有用户的长桥账户同步完成")
         
@@ -63,17 +105,79 @@ def _sync_all_user_longport_accounts():
 
 def sync_all_user_longport_accounts():
     """同步所有用户的长桥账户"""
+    if not _sync_run_lock.acquire(blocking=False):
+        logger.warning("上一轮长桥账户同步尚未结束，跳过本轮")
+        return
+    
     logger.info("开始同步所有用户的长桥账户...")
     
     try:
         _sync_all_user_longport_accounts()
     except Exception as e:
         logger.error(f"同步长桥账户时发生错误: {e}")
+    finally:
+        _sync_run_lock.release()
+
+def reconcile_all_longport_positions():
+    """对所有长桥配置做持仓对账，记录偏差；LONGPORT_RECONCILE_APPLY 开启时自动修正"""
+    try:
+        tasks = _collect_sync_tasks(get_config_manager())
+        for user_id, config_id in tasks:
+            try:
+                report = LongportService(user_id).reconcile_positions(config_id, apply=AppConfig.LONGPORT_RECONCILE_APPLY)
+                for drift in report['drifts']:
+                    logger.warning(
+                        f"用户 {user_id} 的配置 {config_id} 持仓偏差 {drift['symbol']}: "
+                        f"本地 {drift['local_quantity']}，券商 {drift['broker_quantity']}"
+                    )
+                logger.info(f"用户 {user_id} 的配置 {config_id} 持仓对账完成，偏差 {len(report['drifts'])} 个，修正 {report['applied']} 笔")
+            except Exception as e:
+                logger.error(f"用户 {user_id} 的配置 {config_id} 持仓对账失败: {e}")
+    except Exception as e:
+        logger.error(f"长桥持仓对账时发生错误: {e}")
+
+def import_longport_order_histories():
+    """为尚未完成历史订单导入的长桥配置继续导入（按检查点续传）"""
+    if not _import_run_lock.acquire(blocking=False):
+        logger.warning("上一轮长桥历史订单导入尚未结束，跳过本轮")
+        return
+    
+    try:
+        for user_id, config_id in _collect_sync_tasks(get_config_manager()):
+            try:
+                imported = LongportService(user_id).import_order_history(config_id)
+                if imported:
+                    logger.info(f"用户 {user_id} 的配置 {config_id} 导入历史订单 {imported} 笔")
+            except Exception as e:
+                logger.error(f"用户 {user_id} 的配置 {config_id} 导入历史订单失败，下次从检查点继续: {e}")
+    finally:
+        _import_run_lock.release()
+
+def refresh_longport_push_subscriptions():
+    """按当前配置刷新长桥订单推送订阅"""
+    try:
+        longport_push_manager.refresh()
+    except Exception as e:
+        logger.error(f"刷新长桥订单推送订阅时发生错误: {e}")
 
 def setup_longport_sync_scheduler():
     """设置长桥账户同步定时任务"""
     logger.info("设置长桥账户同步定时任务...")
     
+    # 每小时对账一次持仓
+    schedule.every(1).hours.do(reconcile_all_longport_positions)
+    
+    # 每5分钟检查一次新配置的历史订单导入（已完成的配置直接跳过）
+    schedule.every(5).minutes.do(import_longport_order_histories)
+    
+    if AppConfig.LONGPORT_SYNC_MODE == 'push':
+        # 推送模式：成交实时入账，新增/删除的配置每分钟检查一次，轮询仅作为低频对账兜底
+        refresh_longport_push_subscriptions()
+        schedule.every(1).minutes.do(refresh_longport_push_subscriptions)
+        schedule.every(AppConfig.LONGPORT_PUSH_RECONCILE_MINUTES).minutes.do(sync_all_user_longport_accounts)
+        logger.info(f"长桥账户同步定时任务设置完成（推送模式），每{AppConfig.LONGPORT_PUSH_RECONCILE_MINUTES}分钟轮询对账一次")
+        return
+    
     # 每1分钟执行一次
     schedule.every(1).minutes.do(sync_all_user_longport_accounts)
     
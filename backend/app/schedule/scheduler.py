@@ -4,13 +4,16 @@
 """
 
 import schedule
+import threading
 import time
 import logging
-from app.schedule import setup_currency_rate_scheduler, setup_stock_price_scheduler, setup_longport_sync_scheduler, setup_total_asset_price_scheduler
+from typing import Callable
+from app.schedule import setup_currency_rate_scheduler, setup_stock_price_scheduler, setup_longport_sync_scheduler, setup_total_asset_price_scheduler, setup_candlestick_backfill_scheduler
 from app.schedule.currency_rate_scheduler import fetch_daily_exchange_rates
 from app.schedule.stock_price_scheduler import update_stock_prices
 from app.schedule.longport_sync_scheduler import sync_all_user_longport_accounts
 from app.schedule.total_asset_price_scheduler import calculate_total_asset_price
+from app.schedule.candlestick_backfill_scheduler import backfill_candlesticks
 
 # 配置日志
 logging.basicConfig(
@@ -39,27 +42,50 @@ def setup_all_schedulers():
     # 设置总资产价格统计定时任务
     setup_total_asset_price_scheduler()
     
+    # 设置历史K线回填定时任务
+    setup_candlestick_backfill_scheduler()
+    
     logger.info("所有定时任务设置完成")
 
-def start_scheduler():
-    """启动定时任务（用于后台运行）"""
+def _run_pending(can_run: Callable[[], bool]):
+    """执行到期的定时任务，每个任务执行前检查 can_run，不满足时跳过剩余任务（留待下次检查）"""
+    for job in sorted(job for job in schedule.jobs if job.should_run):
+        if not can_run():
+            logger.warning("已失去定时任务领导者身份，跳过到期的定时任务")
+            return
+        result = job.run()
+        if isinstance(result, schedule.CancelJob) or result is schedule.CancelJob:
+            schedule.cancel_job(job)
+
+def start_scheduler(stop_event: threading.Event = None, is_leader: Callable[[], bool] = None):
+    """启动定时任务（用于后台运行）
+
+    stop_event 被设置后清空任务并返回（失去领导者身份时）；is_leader 在每个任务执行前调用，
+    返回 False 时跳过该任务，避免租约失效后、调度器停止前继续执行任务。
+    """
     logger.info("启动定时任务调度器...")
     
+    def can_run() -> bool:
+        return (stop_event is None or not stop_event.is_set()) and (is_leader is None or is_leader())
+    
     # 设置所有定时任务
     setup_all_schedulers()
     
     # 立即执行一次（用于测试）
     logger.info("立即执行一次所有任务...")
-    fetch_daily_exchange_rates()
-    update_stock_prices()
-    sync_all_user_longport_accounts()
     # calculate_total_asset_price() 不需要每次运行的时候产生一条记录，每天定时就好
+    for job in (fetch_daily_exchange_rates, update_stock_prices, sync_all_user_longport_accounts, backfill_candlesticks):
+        if not can_run():
+            break
+        job()
     
     # 运行调度器
-    while True:
+    while stop_event is None or not stop_event.is_set():
         try:
-            schedule.run_pending()
+            _run_pending(can_run)
             time.sleep(1)  # 每秒检查一次
         except Exception as e:
             logger.error(f"调度器运行错误: {e}")
             time.sleep(10)  # 出错时等待10秒再继续
+    schedule.clear()
+    logger.info("定时任务调度器已停止")
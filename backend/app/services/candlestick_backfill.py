@@ -0,0 +1,134 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from longport.openapi import QuoteContext, Config, Period, AdjustType
+
+from ..core.app_config import AppConfig
+from ..core.database import Database, SymbolPriceHistoryManager
+from ..core.config_store import get_config_manager
+from ..util.time_utils import get_current_time_utc8
+from .longport import quote_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# 长桥单次K线请求最多返回1000根，按自然日切分请求区间以保证不超限
+CANDLESTICK_CHUNK_DAYS = 1000
+
+
+class CandlestickBackfiller:
+    """历史日K回填器，从首笔交易日起为每个持仓标的补齐日K数据"""
+
+    def __init__(self, max_workers: int = None):
+        self.config_manager = get_config_manager()
+        self.max_workers = max_workers or AppConfig.CANDLESTICK_BACKFILL_WORKERS
+
+    def _create_quote_context(self) -> QuoteContext:
+        app_key = self.config_manager.get_global_config('longport_app_key')
+        app_secret = self.config_manager.get_global_config('longport_app_secret')
+        access_token = self.config_manager.get_global_config('longport_access_token')
+
+        if not all([app_key, app_secret, access_token]):
+            raise Exception("LongPort API配置不完整，请先设置app_key、app_secret和access_token")
+
+        config = Config(
+            app_key=app_key,
+            app_secret=app_secret,
+            access_token=access_token,
+            enable_print_quote_packages=False
+        )
+        return QuoteContext(config)
+
+    @staticmethod
+    def _missing_ranges(start: date, end: date, covered: Optional[Dict]) -> List[Tuple[date, date]]:
+        """计算[start, end]中尚未覆盖的区间（只补头尾，已覆盖区间跳过）
+
+        covered 为已请求过的区间而非已返回K线的日期，周末、节假日等没有K线的日期不会被反复请求。
+        """
+        if start > end:
+            return []
+        if not covered:
+            return [(start, end)]
+
+        covered_start = date.fromisoformat(covered['start_date'])
+        covered_end = date.fromisoformat(covered['end_date'])
+        ranges = []
+        if start < covered_start:
+            ranges.append((start, min(end, covered_start - timedelta(days=1))))
+        if end > covered_end:
+            ranges.append((max(start, covered_end + timedelta(days=1)), end))
+        return ranges
+
+    @staticmethod
+    def _date_chunks(start: date, end: date) -> List[Tuple[date, date]]:
+        chunks = []
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + timedelta(days=CANDLESTICK_CHUNK_DAYS - 1))
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+        return chunks
+
+    def _backfill_symbol(self, ctx: QuoteContext, symbol: str, start: date, end: date) -> int:
+        """回填单个标的，返回新写入的日K条数"""
+        with Database() as db:
+            covered = SymbolPriceHistoryManager(db).get_covered_range(symbol)
+
+        inserted = 0
+        for range_start, range_end in self._missing_ranges(start, end, covered):
+            candlesticks = []
+            for chunk_start, chunk_end in self._date_chunks(range_start, range_end):
+                # 与其他行情请求共用全局限流
+                quote_rate_limiter.acquire()
+                resp = ctx.history_candlesticks_by_date(symbol, Period.Day, AdjustType.NoAdjust, chunk_start, chunk_end)
+                for item in resp:
+                    candlesticks.append({
+                        'date': item.timestamp.strftime('%Y-%m-%d'),
+                        'open': item.open,
+                        'high': item.high,
+                        'low': item.low,
+                        'close': item.close,
+                        'volume': item.volume
+                    })
+            # 缺失区间紧邻已覆盖区间，合并后整体记为已覆盖（即使区间内没有K线）
+            if covered:
+                covered = {
+                    'start_date': min(covered['start_date'], range_start.isoformat()),
+                    'end_date': max(covered['end_date'], range_end.isoformat())
+                }
+            else:
+                covered = {'start_date': range_start.isoformat(), 'end_date': range_end.isoformat()}
+            # 每个缺失区间一次批量写入，与覆盖区间在同一事务中提交
+            with Database() as db:
+                manager = SymbolPriceHistoryManager(db)
+                inserted += manager.add_candlesticks(symbol, candlesticks)
+                manager.set_covered_range(symbol, covered['start_date'], covered['end_date'])
+        return inserted
+
+    def backfill_all(self) -> Dict[str, int]:
+        """回填所有持仓标的，返回每个标的新写入的条数"""
+        with Database() as db:
+            targets = SymbolPriceHistoryManager(db).get_backfill_targets()
+        if not targets:
+            return {}
+
+        # 当天K线尚未收盘，只回填到昨天
+        today = get_current_time_utc8().date()
+        end = today - timedelta(days=1)
+        default_start = today - timedelta(days=AppConfig.CANDLESTICK_BACKFILL_DEFAULT_DAYS)
+
+        ctx = self._create_quote_context()
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {}
+            for target in targets:
+                start = date.fromisoformat(target['first_date']) if target['first_date'] else default_start
+                futures[pool.submit(self._backfill_symbol, ctx, target['symbol'], start, end)] = target['symbol']
+
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    results[symbol] = future.result()
+                except Exception as e:
+                    logger.error(f"回填 {symbol} 历史K线失败: {e}")
+        return results
@@ -0,0 +1,167 @@
+import json
+import logging
+import queue
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from ..core.app_config import AppConfig
+from ..core.data_version import get_data_versions
+from ..models import AssetManagerContext
+from .valuation import get_portfolio_summary
+
+logger = logging.getLogger(__name__)
+
+_event_hub = None
+_event_hub_lock = threading.Lock()
+
+
+class Subscription:
+    """一个推送连接：有界的待发送事件队列"""
+
+    def __init__(self, hub: 'EventHub', user_id: str, currency: str, maxsize: int):
+        self.hub = hub
+        self.user_id = user_id
+        self.currency = currency
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event: str, data: Dict) -> None:
+        """非阻塞入队；队列已满说明客户端消费过慢，清空积压并只保留一条 resync，客户端收到后重新拉取全量数据"""
+        try:
+            self._queue.put_nowait((event, data))
+        except queue.Full:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self._queue.put_nowait(('resync', {'version': data.get('version')}))
+            except queue.Full:
+                pass
+
+    def get(self, timeout: float) -> Optional[Tuple[str, Dict]]:
+        """取下一个事件，超时返回 None（用于发送心跳）"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """按用户扇出的实时推送中心
+
+    订阅者按用户分组，每个连接一个有界队列，发布时只做非阻塞入队，慢客户端不会阻塞其他连接。
+    数据版本失效时（本进程提交写入或其他进程写入）唤醒后台线程，逐个检查有订阅者的用户：
+    版本变化才重新读取该用户的资产列表，与上次推送的快照比较，推送变化的资产（assets）及最新估值（valuation）。
+    """
+
+    def __init__(self, queue_size: int = None):
+        self.queue_size = queue_size or AppConfig.STREAM_QUEUE_SIZE
+        self._versions = get_data_versions()
+        # userId -> {'subscribers': set, 'version': int, 'assets': {id: asset}}
+        self._users: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+        self._versions.add_listener(self._wakeup.set)
+        self._thread.start()
+
+    def subscribe(self, user_id: str, currency: str = 'CNY') -> Subscription:
+        """新建订阅；用户的第一个订阅会记录当前版本与资产快照作为比较基准"""
+        subscription = Subscription(self, user_id, currency, self.queue_size)
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._users[user_id] = {'subscribers': set(), 'version': None, 'assets': None}
+            state['subscribers'].add(subscription)
+        if state['assets'] is None:
+            version = self._versions.get(user_id)
+            assets = self._snapshot(user_id)
+            with self._lock:
+                if state['assets'] is None:
+                    state['version'], state['assets'] = version, assets
+        subscription.put('ready', {'version': state['version']})
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            state = self._users.get(subscription.user_id)
+            if state is None:
+                return
+            state['subscribers'].discard(subscription)
+            if not state['subscribers']:
+                del self._users[subscription.user_id]
+
+    def publish(self, user_id: str, event: str, data: Dict) -> None:
+        """向用户的所有连接推送事件"""
+        with self._lock:
+            state = self._users.get(user_id)
+            subscribers = list(state['subscribers']) if state else []
+        for subscription in subscribers:
+            subscription.put(event, data)
+
+    @staticmethod
+    def _snapshot(user_id: str) -> Dict[str, Dict]:
+        return {asset['id']: asset for asset in AssetManagerContext().get_all_assets(user_id)}
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                user_ids = list(self._users.keys())
+            for user_id in user_ids:
+                try:
+                    self._check_user(user_id)
+                except Exception as e:
+                    logger.error(f"推送用户 {user_id} 的数据变更失败: {e}")
+
+    def _check_user(self, user_id: str) -> None:
+        with self._lock:
+            state = self._users.get(user_id)
+        if state is None or state['assets'] is None:
+            return
+        version = self._versions.get(user_id)
+        if version == state['version']:
+            return
+
+        assets = self._snapshot(user_id)
+        previous = state['assets']
+        changed = [asset for asset_id, asset in assets.items() if previous.get(asset_id) != asset]
+        removed = [asset_id for asset_id in previous if asset_id not in assets]
+        state['version'], state['assets'] = version, assets
+        if changed or removed:
+            self.publish(user_id, 'assets', {'version': version, 'changed': changed, 'removed': removed})
+
+        with self._lock:
+            currencies: Set[str] = {s.currency for s in state['subscribers']}
+            subscribers = list(state['subscribers'])
+        for currency in currencies:
+            summary = get_portfolio_summary(user_id, currency)
+            data = {key: summary[key] for key in ('version', 'currency', 'totalValue', 'totalCost', 'unrealizedPnl')}
+            for subscription in subscribers:
+                if subscription.currency == currency:
+                    subscription.put('valuation', data)
+
+
+def get_event_hub() -> EventHub:
+    """获取进程内共享的推送中心（首次调用时启动后台线程）"""
+    global _event_hub
+    if _event_hub is None:
+        with _event_hub_lock:
+            if _event_hub is None:
+                _event_hub = EventHub()
+    return _event_hub
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """按 Server-Sent Events 格式编码一个事件"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    lines = [f'event: {event}']
+    if data.get('version') is not None:
+        lines.append(f"id: {data['version']}")
+    lines.append(f'data: {payload}')
+    return '\n'.join(lines) + '\n\n'
@@ -1,27 +1,64 @@
 # 获取资金流水
 # https://open.longportapp.com/docs/trade/asset/cashflow
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+import hashlib
+import threading
 import uuid
 from zoneinfo import ZoneInfo
-from longport.openapi import OrderSide, QuoteContext, TradeContext, Config, OrderStatus
-from typing import TYPE_CHECKING
+from longport.openapi import OrderSide, QuoteContext, TradeContext, Config, OrderStatus, BalanceType
+from typing import TYPE_CHECKING, Dict
 
+from ..core.app_config import AppConfig
 from ..core.database import Database, AccountManager, TransactionManager
 from ..models import AssetManagerContext
-from ..core.tinydb_config import TinyDBConfigManager
+from ..core.config_store import get_config_manager
 from ..util.time_utils import isoformat_utc8, parse_datetime_utc8
+from ..util.rate_limiter import RateLimiter
+from .security_info import SecurityInfoCache
+
+# 全局限流，与长桥OpenAPI频率限制保持一致（所有用户、所有配置共享）
+trade_rate_limiter = RateLimiter(AppConfig.LONGPORT_TRADE_RATE_LIMIT, 1.0)
+quote_rate_limiter = RateLimiter(AppConfig.LONGPORT_QUOTE_RATE_LIMIT, 1.0)
+security_info_cache = SecurityInfoCache(quote_rate_limiter)
+
+# 长桥历史订单接口单次最多返回的条数，达到时需拆分时间窗口
+HISTORY_ORDERS_LIMIT = 1000
+
+# 资金流水分页大小（长桥接口上限为10000）
+CASH_FLOW_PAGE_SIZE = 1000
+
+# 资金流水按名称关键字归类，按顺序匹配，未命中的归为 other
+CASH_FLOW_TYPE_KEYWORDS = [
+    ('trade', ('买入', '卖出', '成交', 'Buy', 'Sell')),
+    ('dividend', ('股息', '红利', '派息', 'Dividend')),
+    ('interest', ('利息', 'Interest')),
+    ('fee', ('费', '佣金', 'Fee', 'Commission', 'Charge')),
+    ('deposit', ('入金', '存入', 'Deposit')),
+    ('withdrawal', ('出金', '提取', '取款', 'Withdraw')),
+]
 
 
 class LongportService:
+    _config_apply_locks = {}  # 类变量，按配置串行化订单入账（轮询与推送共用）
+    _user_config_locks_guard = threading.Lock()
+
     def __init__(self, userId: str):
         self.userId = userId
         
         # 初始化配置管理器（使用共享实例）
-        self.config_manager = TinyDBConfigManager()
+        self.config_manager = get_config_manager()
+
+    def _get_config_apply_lock(self, config_id: str) -> threading.Lock:
+        with self._user_config_locks_guard:
+            if config_id not in self._config_apply_locks:
+                self._config_apply_locks[config_id] = threading.Lock()
+            return self._config_apply_locks[config_id]
 
 
     def _add_cash_account(self, m: AssetManagerContext, app_key: str, ctx: TradeContext, belongId: str = None):
+        trade_rate_limiter.acquire()
         raw_info = ctx.account_balance()
         if len(raw_info) != 1:
             raise Exception("现金账户数量不唯一，请检查长桥API是否更新")
@@ -41,23 +78,22 @@ class LongportService:
         m.add_asset(cash_account_data)
     
     def _add_stock_account(self, m: AssetManagerContext, app_key: str, ctx: TradeContext, qctx: QuoteContext, belongId: str = None):
+        trade_rate_limiter.acquire()
         raw_info = ctx.stock_positions().channels
         stock_data = []
-        stock_symbols = []
         for x in raw_info:
             for y in x.positions:
                 stock_data.append(y)
-                stock_symbols.append(y.symbol)
-        stock_info = qctx.static_info(stock_symbols)
+        symbols_name = self._get_symbols_name(qctx, stock_data)
 
-        for x, y in zip(stock_data, stock_info):
+        for x in stock_data:
             stock_account_data = {
-                "id": app_key + "_stock_" + y.symbol,
+                "id": app_key + "_stock_" + x.symbol,
                 "userId": self.userId,
-                "symbol": y.symbol,
+                "symbol": x.symbol,
                 "type": "stock",
                 "parentId": belongId,
-                "description": f"{y.name_cn if y.name_cn else y.name_en}(长桥)",
+                "description": symbols_name[x.symbol],
                 "quantity": str(x.quantity),
                 "cost": str(x.cost_price),
                 "currency": x.currency,
@@ -75,13 +111,22 @@ class LongportService:
         )
         ctx = TradeContext(config)
         qctx = QuoteContext(config)
+        created_at = datetime.now(timezone.utc)
         with AssetManagerContext() as m:
-            self._add_cash_account(m, app_key, ctx, belongId)
+            # 股票账户先建：标的名称缓存写入使用独立连接，须在本事务产生写入前完成
             self._add_stock_account(m, app_key, ctx, qctx, belongId)
-        self.set_longport_config(new_config_id, app_key, app_secret, access_token)
+            self._add_cash_account(m, app_key, ctx, belongId)
+        self.set_longport_config(new_config_id, app_key, app_secret, access_token, last_refreshed_at=created_at,
+                                 snapshot_at=created_at)
+        # 创建前的历史成交由定时任务从创建时间起向前分批导入
+        self.set_history_import_checkpoint(new_config_id, {
+            'until': created_at.isoformat(),
+            'cursor': created_at.isoformat(),
+            'done': False
+        })
         return new_config_id
 
-    def _insert_account_if_not_exists(self, m: AssetManagerContext, app_key: str, symbol: str, symbol_name: str, belongId: str, currency: str):
+    def _insert_account_if_not_exists(self, m: AssetManagerContext, app_key: str, symbol: str, symbol_name: str, belongId: str, currency: str, is_active: bool = True):
         stock_id = f"{app_key}_stock_{symbol}"
 
         # 确保股票账户存在（若不存在则以0初始化）
@@ -97,10 +142,10 @@ class LongportService:
                 "quantity": "0",
                 "cost": "0",
                 "currency": currency,
-                "isActive": True
+                "isActive": is_active
             })
 
-    def _buy_or_sell_stock(self, m: AssetManagerContext, app_key: str, symbol: str, quantity: str, price: str, currency: str, direction: int | str, order_time: datetime):
+    def _buy_or_sell_stock(self, m: AssetManagerContext, app_key: str, symbol: str, quantity: str, price: str, currency: str, direction: int | str, order_time: datetime, order_id: str = None):
         stock_id = f"{app_key}_stock_{symbol}"
         m.update_asset_by_transaction({
             "id": str(uuid.uuid4()),
@@ -111,9 +156,11 @@ class LongportService:
             "direction": direction,
             "quantity": quantity,
             "price": price,
-            "currency": currency
+            "currency": currency,
+            "externalId": order_id,
+            "type": "trade"
         })
-    def _gain_or_spend_cash(self, m: AssetManagerContext, app_key: str, amount: str, currency: str, direction: int | str, order_time: datetime):
+    def _gain_or_spend_cash(self, m: AssetManagerContext, app_key: str, amount: str, currency: str, direction: int | str, order_time: datetime, order_id: str = None):
         cash_id = f"{app_key}_cash"
         m.update_asset_by_transaction({
             "id": str(uuid.uuid4()),
@@ -124,10 +171,13 @@ class LongportService:
             "direction": direction,
             "quantity": amount,
             "price": "1.0",
-            "currency": currency
+            "currency": currency,
+            "externalId": order_id,
+            "type": "trade"
         })
     
     def _sync_cash_account(self, ctx: TradeContext, m: AssetManagerContext, app_key: str):
+        trade_rate_limiter.acquire()
         account_balance = ctx.account_balance()
         if not account_balance or len(account_balance) == 0:
             raise Exception("长桥API请求返回数据异常")  
@@ -148,32 +198,151 @@ class LongportService:
                     "direction": 0 if diff > 0 else 1,
                     "quantity": abs(diff),
                     "price": "1.0",
-                    "currency": account_balance.currency
+                    "currency": account_balance.currency,
+                    "type": "adjustment"
                 })
+    @staticmethod
+    def _order_time(updated_at: datetime) -> datetime:
+        # 长桥返回的订单时间不带时区，按北京时间解释
+        if updated_at.tzinfo is None:
+            return updated_at.replace(tzinfo=ZoneInfo("Asia/Shanghai"))
+        return updated_at
+
+    def _apply_filled_order(self, m: AssetManagerContext, app_key: str, order_id: str, symbol: str, symbol_name: str,
+                            side, quantity: Decimal, price: Decimal, currency: str, order_time: datetime):
+        """一笔成交订单入账：股票买卖一条交易，现金对应反向一条交易"""
+        self._insert_account_if_not_exists(m, app_key, symbol, symbol_name, None, currency)
+
+        # 生成买入股票的交易记录（通过资产管理器以更新资产与记录交易）
+        self._buy_or_sell_stock(m, app_key, symbol, quantity, price, currency, 0 if side == OrderSide.Buy else 1, order_time, order_id)
+
+        amount = price * quantity
+        self._gain_or_spend_cash(m, app_key, amount, currency, 1 if side == OrderSide.Buy else 0, order_time, order_id)
+
     def _get_effective_orders(self, ctx: TradeContext, before_time: datetime):
         para = {
             "status": [OrderStatus.Filled]
         }
+        trade_rate_limiter.acquire()
         orders = ctx.today_orders(**para)
         
+        trade_rate_limiter.acquire()
         history_orders = ctx.history_orders(**para, start_at=before_time, end_at=datetime.now(timezone.utc))
 
         orders += history_orders
         # 使用资产管理器以通过交易安全更新资产
         orders.reverse()
         new_orders = []
+        seen_order_ids = set()
         for order in orders:
-            order_time = order.updated_at.replace(tzinfo=ZoneInfo("Asia/Shanghai"))
+            # 当日订单与历史订单可能重叠，按订单号去重
+            if order.order_id in seen_order_ids:
+                continue
+            order_time = self._order_time(order.updated_at)
             if order_time and order_time > before_time:
                 new_orders.append(order)
+                seen_order_ids.add(order.order_id)
         return new_orders
 
-    def _get_symbols_name(self, qctx: QuoteContext, orders):
-        if not orders or len(orders) == 0:
+    @staticmethod
+    def _cash_flow_type(flow) -> str:
+        name = f"{flow.transaction_flow_name} {flow.description}"
+        for flow_type, keywords in CASH_FLOW_TYPE_KEYWORDS:
+            if any(keyword in name for keyword in keywords):
+                return flow_type
+        return 'other'
+
+    @staticmethod
+    def _cash_flow_key(app_key: str, flow) -> str:
+        """资金流水的内容键：长桥资金流水没有流水号，内容完全相同的流水键相同"""
+        return '|'.join(str(x) for x in (
+            app_key, flow.business_time.isoformat(), flow.transaction_flow_name, flow.direction,
+            flow.balance, flow.currency, flow.symbol or '', flow.description
+        ))
+
+    @staticmethod
+    def _cash_flow_external_id(key: str, occurrence: int = 0) -> str:
+        """用内容键与其在同一批中的出现序号生成稳定的ID用于去重
+
+        同一时间两笔金额相同的费用等内容完全相同的流水是不同的流水，按出现序号区分；
+        第一次出现不带序号，与之前生成的ID保持一致。
+        """
+        raw = key if occurrence == 0 else f'{key}|{occurrence}'
+        return 'cashflow:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _get_cash_flows(self, ctx: TradeContext, start_at: datetime, end_at: datetime):
+        """分页拉取时间窗口内的现金类资金流水"""
+        flows = []
+        page = 1
+        while True:
+            trade_rate_limiter.acquire()
+            items = ctx.cash_flow(start_at=start_at, end_at=end_at, business_type=BalanceType.Cash,
+                                  page=page, size=CASH_FLOW_PAGE_SIZE)
+            flows += items
+            if len(items) < CASH_FLOW_PAGE_SIZE:
+                return flows
+            page += 1
+
+    def _apply_cash_flows(self, m: AssetManagerContext, app_key: str, flows) -> int:
+        """资金流水按类型批量入账到现金账户，返回新入账的条数
+
+        买卖成交流水已由订单入账，直接跳过；已入库的流水按 externalId 跳过。
+        内容相同的流水同一时间的全部出现总会落在同一个拉取窗口内，按出现序号生成的ID在各次同步间保持稳定。
+        """
+        cash_id = f"{app_key}_cash"
+        entries = []
+        occurrences = {}
+        for flow in sorted(flows, key=lambda f: f.business_time):
+            flow_type = self._cash_flow_type(flow)
+            direction = str(flow.direction)
+            if flow_type == 'trade' or not flow.balance or not (direction.endswith('.In') or direction.endswith('.Out')):
+                continue
+            key = self._cash_flow_key(app_key, flow)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            external_id = self._cash_flow_external_id(key, occurrence)
+            entries.append({
+                "id": str(uuid.uuid4()),
+                "userId": self.userId,
+                "accountId": cash_id,
+                "description": f"长桥资金流水 {flow.transaction_flow_name}" + (f" {flow.symbol}" if flow.symbol else ""),
+                "date": self._order_time(flow.business_time),
+                "direction": 0 if direction.endswith('.In') else 1,
+                "quantity": abs(flow.balance),
+                "price": "1.0",
+                "currency": flow.currency,
+                "externalId": external_id,
+                "type": flow_type
+            })
+
+        ingested_ids = m.get_existing_external_ids([entry['externalId'] for entry in entries])
+        return m.update_assets_by_transactions([entry for entry in entries if entry['externalId'] not in ingested_ids])
+
+    def _get_symbols_name(self, qctx: QuoteContext, items):
+        """解析订单/持仓中标的的显示名称，静态信息走持久化缓存，仅未知标的才请求长桥"""
+        if not items or len(items) == 0:
             return {}
-        return {x.symbol: f"{x.name_cn if x.name_cn else x.name_en}(长桥)" for x in qctx.static_info([order.symbol for order in orders])}
+        symbols = [item.symbol for item in items if item.symbol]
+        infos = security_info_cache.get_many(symbols, lambda: qctx)
+        return {
+            symbol: f"{SecurityInfoCache.display_name(infos[symbol])}(长桥)" if symbol in infos else f"{symbol}(长桥)"
+            for symbol in symbols
+        }
 
     def update_user_longbridge_account(self, config_id: str):
+        """同步长桥账户的新成交订单、资金流水与现金余额
+
+        整批订单、资金流水与现金校正在同一个事务中处理，任一步失败则整体回滚且水位线不前移；
+        事务提交后才一次性推进 last_refreshed_at，水位线取本次拉取订单之前的时间，
+        拉取期间新成交的订单会在下一次同步中处理。
+        订单号作为交易的 externalId 入库，拉取窗口向前重叠一段时间，已入库的订单直接跳过，
+        因此提交后、写水位线前崩溃也不会重复记账。重叠窗口不早于创建配置时的持仓快照时间
+        snapshot_at，快照之前的成交已计入初始持仓与现金余额，不能再入账。
+        早于快照机制创建的配置没有 snapshot_at，其已入库订单也没有 externalId、无法按订单号跳过，
+        首次同步以当时的水位线作为 snapshot_at（随水位线一并写回），窗口不再向前重叠。
+        资金流水使用独立的游标 cash_flow_cursor（缺省为 last_refreshed_at）增量分页拉取，
+        股息、费用、出入金等逐条入账，余额差额校正只兜底剩余的偏差。
+        """
         longport_config = self.get_longport_config(config_id)
         if not longport_config or not longport_config['app_key']:
             return
@@ -185,40 +354,274 @@ class LongportService:
             enable_print_quote_packages=False
         )
         last_time = parse_datetime_utc8(longport_config['last_refreshed_at'])
+        sync_started_at = datetime.now(timezone.utc)
         ctx = TradeContext(config)
         qctx = QuoteContext(config)
-        orders = self._get_effective_orders(ctx, last_time)
-        symbols_name = self._get_symbols_name(qctx, orders)
-        # 遍历orders，处理每一笔订单
-        for order in orders:
-            with AssetManagerContext() as m:
-                order_time = order.updated_at.replace(tzinfo=ZoneInfo("Asia/Shanghai"))
+        overlap = timedelta(minutes=AppConfig.LONGPORT_SYNC_OVERLAP_MINUTES)
+        legacy_snapshot_at = None
+        if longport_config.get('snapshot_at'):
+            snapshot_at = parse_datetime_utc8(longport_config['snapshot_at'])
+        else:
+            snapshot_at = legacy_snapshot_at = last_time
+        cash_flow_cursor = parse_datetime_utc8(longport_config.get('cash_flow_cursor') or longport_config['last_refreshed_at'])
+        window_start = max(last_time - overlap, snapshot_at)
+        cash_flow_start = max(cash_flow_cursor - overlap, snapshot_at)
+        orders = self._get_effective_orders(ctx, window_start)
+        cash_flows = self._get_cash_flows(ctx, cash_flow_start, sync_started_at)
+        with self._get_config_apply_lock(config_id), AssetManagerContext() as m:
+            # 一次集合查询跳过已入库的订单（包括推送模式下已实时入账的订单）
+            ingested_order_ids = m.get_existing_external_ids([order.order_id for order in orders])
+            orders = [order for order in orders if order.order_id not in ingested_order_ids]
+            symbols_name = self._get_symbols_name(qctx, orders)
+
+            # 遍历orders，处理每一笔订单；按成交数量与成交均价入账，与推送入账一致
+            for order in orders:
+                if not order.symbol:
+                    continue
+                self._apply_filled_order(m, longport_config['app_key'], order.order_id, order.symbol, symbols_name[order.symbol],
+                                         order.side, order.executed_quantity, order.executed_price, order.currency,
+                                         self._order_time(order.updated_at))
+
+            self._apply_cash_flows(m, longport_config['app_key'], cash_flows)
+            self._sync_cash_account(ctx, m, longport_config['app_key'])
+        self.set_longport_config(config_id, last_refreshed_at=sync_started_at, cash_flow_cursor=sync_started_at,
+                                 snapshot_at=legacy_snapshot_at)
 
-                symbol = order.symbol
-                if not symbol:
+    def reconcile_positions(self, config_id: str, apply: bool = False) -> Dict:
+        """对账：比较本地股票账户与长桥持仓，返回偏差报告
+
+        一次 stock_positions 调用取回全部持仓，与本地该配置下的全部股票账户（一次查询）
+        按标的建立映射后逐一比较。apply 为 True 时先同步一次新成交，再为每个偏差生成一笔
+        type 为 adjustment 的修正交易并批量入账；本地缺失的标的会先建立账户。
+
+        Returns:
+            Dict: {'config_id', 'checked_at', 'positions_checked', 'drifts': [...], 'applied'}
+        """
+        longport_config = self.get_longport_config(config_id)
+        if not longport_config or not longport_config['app_key']:
+            raise ValueError(f"长桥配置 {config_id} 不存在")
+        app_key = longport_config['app_key']
+
+        if apply:
+            # 先入账尚未同步的成交，避免把它们误判为偏差
+            self.update_user_longbridge_account(config_id)
+
+        config = Config(
+            app_key=app_key,
+            app_secret=longport_config['app_secret'],
+            access_token=longport_config['access_token'],
+            enable_print_quote_packages=False
+        )
+        ctx = TradeContext(config)
+        checked_at = datetime.now(timezone.utc)
+        stock_prefix = f"{app_key}_stock_"
+
+        with self._get_config_apply_lock(config_id), AssetManagerContext() as m:
+            trade_rate_limiter.acquire()
+            # 同一标的可能分布在多个渠道，数量相加、成本按数量加权
+            broker_positions = {}
+            for channel in ctx.stock_positions().channels:
+                for position in channel.positions:
+                    merged = broker_positions.setdefault(position.symbol, {
+                        'position': position, 'quantity': Decimal('0'), 'total_cost': Decimal('0')
+                    })
+                    merged['quantity'] += Decimal(str(position.quantity))
+                    merged['total_cost'] += Decimal(str(position.quantity)) * Decimal(str(position.cost_price))
+            local_accounts = {account['symbol']: account for account in m.get_assets_by_id_prefix(self.userId, stock_prefix)}
+
+            drifts = []
+            for symbol in sorted(set(broker_positions) | set(local_accounts)):
+                account = local_accounts.get(symbol)
+                position = broker_positions.get(symbol)
+                local_quantity = Decimal(str(account['quantity'])) if account else Decimal('0')
+                broker_quantity = position['quantity'] if position else Decimal('0')
+                if local_quantity == broker_quantity:
                     continue
+                drifts.append({
+                    'symbol': symbol,
+                    'account_id': stock_prefix + symbol,
+                    'local_quantity': str(local_quantity),
+                    'broker_quantity': str(broker_quantity),
+                    'diff': str(broker_quantity - local_quantity),
+                    'missing_locally': account is None
+                })
 
-                currency = order.currency
+            applied = 0
+            if apply and drifts:
+                missing = [broker_positions[d['symbol']]['position'] for d in drifts if d['missing_locally']]
+                symbols_name = self._get_symbols_name(QuoteContext(config), missing) if missing else {}
+                for position in missing:
+                    self._insert_account_if_not_exists(m, app_key, position.symbol, symbols_name[position.symbol], None, position.currency)
 
-                self._insert_account_if_not_exists(m, longport_config['app_key'], symbol, symbols_name[symbol], None, currency)
+                corrections = []
+                for drift in drifts:
+                    diff = Decimal(drift['diff'])
+                    account = local_accounts.get(drift['symbol'])
+                    position = broker_positions.get(drift['symbol'])
+                    # 补入按券商成本价，减出按本地成本价（保持本地平均成本不变）
+                    if diff > 0:
+                        price = (position['total_cost'] / position['quantity']) if position['quantity'] else Decimal('0')
+                    else:
+                        price = Decimal(str(account['cost']))
+                    corrections.append({
+                        "id": str(uuid.uuid4()),
+                        "userId": self.userId,
+                        "accountId": drift['account_id'],
+                        "description": f"长桥持仓对账修正 {drift['symbol']}",
+                        "date": checked_at,
+                        "direction": 0 if diff > 0 else 1,
+                        "quantity": abs(diff),
+                        "price": price,
+                        "currency": position['position'].currency if position else account['currency'],
+                        "type": "adjustment"
+                    })
+                applied = m.update_assets_by_transactions(corrections)
 
-                # 生成买入股票的交易记录（通过资产管理器以更新资产与记录交易）
-                quantity_str = order.quantity
-                price_str = order.price
-                self._buy_or_sell_stock(m, longport_config['app_key'], symbol, quantity_str, price_str, currency, 0 if order.side == OrderSide.Buy else 1, order_time)
+        return {
+            'config_id': config_id,
+            'checked_at': checked_at.isoformat(),
+            'positions_checked': len(set(broker_positions) | set(local_accounts)),
+            'drifts': drifts,
+            'applied': applied
+        }
 
-                amount = order.price * order.quantity
-                self._gain_or_spend_cash(m, longport_config['app_key'], amount, currency, 1 if order.side == OrderSide.Buy else 0, order_time)
-                self.set_longport_config(config_id)
+    def _fetch_history_window(self, ctx: TradeContext, start_at: datetime, end_at: datetime):
+        """拉取时间窗口内的已成交历史订单；条数达到接口上限时二分窗口，避免漏单"""
+        trade_rate_limiter.acquire()
+        orders = ctx.history_orders(status=[OrderStatus.Filled], start_at=start_at, end_at=end_at)
+        if len(orders) >= HISTORY_ORDERS_LIMIT and end_at - start_at > timedelta(minutes=1):
+            middle = start_at + (end_at - start_at) / 2
+            return self._fetch_history_window(ctx, start_at, middle) + self._fetch_history_window(ctx, middle, end_at)
+        return orders
 
-        with AssetManagerContext() as m:
-            self._sync_cash_account(ctx, m, longport_config['app_key'])
-        self.set_longport_config(config_id)
+    def _record_history_orders(self, config_id: str, app_key: str, qctx: QuoteContext, orders) -> int:
+        """将一批历史成交作为仅记录的交易入库，返回新导入的订单数
+
+        当前持仓在创建配置时已按平均成本快照，历史成交只补齐交易记录，不再改动持仓；
+        已不再持有的标的建立未激活账户以挂载交易，未激活账户不受资产编号唯一性限制，
+        用户已有同一标的的手动持仓或其他长桥配置时也不会使整批导入失败。订单号已入库（含轮询/推送已入账）的跳过。
+        """
+        with self._get_config_apply_lock(config_id), AssetManagerContext() as m:
+            ingested_order_ids = m.get_existing_external_ids([order.order_id for order in orders])
+            orders = [order for order in orders if order.order_id not in ingested_order_ids]
+            if not orders:
+                return 0
+            symbols_name = self._get_symbols_name(qctx, orders)
+
+            transactions = []
+            for order in sorted(orders, key=lambda o: o.updated_at):
+                self._insert_account_if_not_exists(m, app_key, order.symbol, symbols_name[order.symbol], None, order.currency, is_active=False)
+                order_time = self._order_time(order.updated_at)
+                is_buy = order.side == OrderSide.Buy
+                transactions.append({
+                    "id": str(uuid.uuid4()),
+                    "userId": self.userId,
+                    "accountId": f"{app_key}_stock_{order.symbol}",
+                    "description": f"长桥历史导入买入 {order.symbol}" if is_buy else f"长桥历史导入卖出 {order.symbol}",
+                    "date": order_time,
+                    "direction": 0 if is_buy else 1,
+                    "quantity": order.executed_quantity,
+                    "price": order.executed_price,
+                    "currency": order.currency,
+                    "externalId": order.order_id,
+                    "type": "history_import"
+                })
+                transactions.append({
+                    "id": str(uuid.uuid4()),
+                    "userId": self.userId,
+                    "accountId": f"{app_key}_cash",
+                    "description": "长桥历史导入现金出账" if is_buy else "长桥历史导入现金入账",
+                    "date": order_time,
+                    "direction": 1 if is_buy else 0,
+                    "quantity": order.executed_price * order.executed_quantity,
+                    "price": "1.0",
+                    "currency": order.currency,
+                    "externalId": order.order_id,
+                    "type": "history_import"
+                })
+            m.record_transactions(transactions)
+        return len(orders)
+
+    def import_order_history(self, config_id: str) -> int:
+        """导入长桥配置创建前的历史成交订单（可中断续传）
+
+        从检查点游标起按 LONGPORT_HISTORY_IMPORT_WINDOW_DAYS 的时间窗口向前翻页，
+        每批并发拉取 LONGPORT_HISTORY_IMPORT_WORKERS 个窗口，整批一次事务入库后推进游标；
+        中断后下次从游标处继续，回溯满 LONGPORT_HISTORY_IMPORT_DAYS 天后标记完成。
+
+        Returns:
+            int: 本次新导入的订单数
+        """
+        longport_config = self.get_longport_config(config_id)
+        if not longport_config or not longport_config['app_key']:
+            return 0
+        checkpoint = longport_config.get('history_import')
+        if not checkpoint or checkpoint.get('done'):
+            return 0
+
+        config = Config(
+            app_key=longport_config['app_key'],
+            app_secret=longport_config['app_secret'],
+            access_token=longport_config['access_token'],
+            enable_print_quote_packages=False
+        )
+        ctx = TradeContext(config)
+        qctx = QuoteContext(config)
+        until = parse_datetime_utc8(checkpoint['until'])
+        cursor = parse_datetime_utc8(checkpoint['cursor'])
+        floor = until - timedelta(days=AppConfig.LONGPORT_HISTORY_IMPORT_DAYS)
+        window = timedelta(days=AppConfig.LONGPORT_HISTORY_IMPORT_WINDOW_DAYS)
+        workers = AppConfig.LONGPORT_HISTORY_IMPORT_WORKERS
+
+        imported = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='longport-import') as pool:
+            while cursor > floor:
+                windows = []
+                window_end = cursor
+                while window_end > floor and len(windows) < workers:
+                    window_start = max(floor, window_end - window)
+                    windows.append((window_start, window_end))
+                    window_end = window_start
+
+                # 窗口边界与拆分可能产生重复订单，按订单号去重；只导入配置创建前的成交
+                orders = {}
+                for window_orders in pool.map(lambda w: self._fetch_history_window(ctx, w[0], w[1]), windows):
+                    for order in window_orders:
+                        if order.symbol and self._order_time(order.updated_at) <= until:
+                            orders.setdefault(order.order_id, order)
+                imported += self._record_history_orders(config_id, longport_config['app_key'], qctx, list(orders.values()))
+
+                cursor = window_end
+                checkpoint = {**checkpoint, 'cursor': cursor.isoformat(), 'done': cursor <= floor}
+                self.set_history_import_checkpoint(config_id, checkpoint)
+        return imported
+
+    def apply_pushed_order(self, config_id: str, event) -> bool:
+        """将一条订单变更推送（PushOrderChanged）增量入账
+
+        只处理已全部成交的订单；订单号已入库时跳过，与轮询同步互不重复。
+        不推进水位线，由低频的轮询对账负责。
+
+        Returns:
+            bool: 是否产生了新的入账
+        """
+        if event.status != OrderStatus.Filled or not event.symbol:
+            return False
+        longport_config = self.get_longport_config(config_id)
+        if not longport_config or not longport_config['app_key']:
+            return False
+
+        with self._get_config_apply_lock(config_id), AssetManagerContext() as m:
+            if m.get_existing_external_ids([event.order_id]):
+                return False
+            self._apply_filled_order(m, longport_config['app_key'], event.order_id, event.symbol, f"{event.stock_name}(长桥)",
+                                     event.side, event.executed_quantity, event.executed_price, event.currency, self._order_time(event.updated_at))
+        return True
 
 
 
     # 配置管理方法
-    def set_longport_config(self, config_id: str, app_key: str=None, app_secret: str=None, access_token: str=None) -> bool:
+    def set_longport_config(self, config_id: str, app_key: str=None, app_secret: str=None, access_token: str=None, last_refreshed_at: datetime=None, cash_flow_cursor: datetime=None, snapshot_at: datetime=None) -> bool:
         """设置长桥证券配置
         
         Args:
@@ -227,14 +630,16 @@ class LongportService:
             app_key: 应用密钥
             app_secret: 应用密钥
             access_token: 访问令牌
+            last_refreshed_at: 同步水位线，默认为当前时间
+            cash_flow_cursor: 资金流水同步游标，为None时不修改
+            snapshot_at: 创建配置时持仓与现金快照的时间，同步窗口不会早于该时间，为None时不修改
             
         Returns:
             bool: 设置是否成功
         """
-        try:
-            # 获取现有配置
-            existing_config = self.config_manager.get_user_config(self.userId) or {}
-            longport_configs = existing_config.get('longport', {})
+        # 同一用户的多个配置可能被多个进程并发同步，读-改-写由配置管理器原子完成
+        def updater(longport_configs):
+            longport_configs = longport_configs or {}
 
             # 获取当前账户配置（如果不存在则新建空字典）
             current_config = longport_configs.get(config_id, {})
@@ -250,19 +655,41 @@ class LongportService:
                 current_config['access_token'] = access_token
 
             # 始终更新时间
-            current_config['last_refreshed_at'] = datetime.now(timezone.utc).isoformat()
+            current_config['last_refreshed_at'] = (last_refreshed_at or datetime.now(timezone.utc)).isoformat()
+
+            if cash_flow_cursor is not None:
+                current_config['cash_flow_cursor'] = cash_flow_cursor.isoformat()
+
+            if snapshot_at is not None:
+                current_config['snapshot_at'] = snapshot_at.isoformat()
 
             # 更新账户配置
             longport_configs[config_id] = current_config
+            return longport_configs
 
-            # 更新配置
-            config_data = {'longport': longport_configs}
-            return self.config_manager.set_user_config(self.userId, config_data)
-            
+        try:
+            return self.config_manager.modify_user_config(self.userId, 'longport', updater)
         except Exception as e:
             print(f"设置长桥配置失败: {str(e)}")
             return False
     
+    def set_history_import_checkpoint(self, config_id: str, checkpoint: Dict) -> bool:
+        """保存历史订单导入进度（不改动同步水位线）"""
+        found = []
+
+        def updater(longport_configs):
+            longport_configs = longport_configs or {}
+            if config_id in longport_configs:
+                longport_configs[config_id]['history_import'] = checkpoint
+                found.append(config_id)
+            return longport_configs
+
+        try:
+            return self.config_manager.modify_user_config(self.userId, 'longport', updater) and bool(found)
+        except Exception as e:
+            print(f"保存历史订单导入进度失败: {str(e)}")
+            return False
+
     def get_longport_config(self, config_id: str):
         """获取长桥证券配置
         
@@ -286,19 +713,25 @@ class LongportService:
             # 如果longport_configs为空或者accountid没找到，则插入新的结构
             print(f"用户 {self.userId} 的账户 {config_id} 配置不存在，创建默认配置")
             
-            # 创建新的账户配置结构
-            longport_configs[config_id] = {
+            # 创建新的账户配置结构（其他进程可能已先创建，已存在时保留）
+            default_config = {
                 'app_key': '',
                 'app_secret': '',
                 'access_token': '',
                 'last_refreshed_at': isoformat_utc8()
             }
-            
+            created = {}
+
+            def updater(longport_configs):
+                longport_configs = longport_configs or {}
+                longport_configs.setdefault(config_id, default_config)
+                created.update(longport_configs[config_id])
+                return longport_configs
+
             # 更新用户配置
-            config_data = {'longport': longport_configs}
-            if self.config_manager.update_user_config(self.userId, config_data):
+            if self.config_manager.modify_user_config(self.userId, 'longport', updater):
                 print(f"用户 {self.userId} 的账户 {config_id} 默认配置创建成功")
-                return longport_configs[config_id]
+                return created
             
             print(f"用户 {self.userId} 的账户 {config_id} 默认配置创建失败")
             return None
@@ -317,20 +750,13 @@ class LongportService:
         Returns:
             bool: 删除是否成功
         """
-        try:
-            config = self.config_manager.get_user_config(self.userId)
-            if not config:
-                return False
-            
-            longport_configs = config.get('longport', {})
-            if config_id in longport_configs:
-                del longport_configs[config_id]
-            
+        def updater(longport_configs):
+            longport_configs = longport_configs or {}
+            longport_configs.pop(config_id, None)
+            return longport_configs
 
-            # 更新配置
-            config_data = {'longport': longport_configs}
-            return self.config_manager.update_user_config(self.userId, config_data)
-            
+        try:
+            return self.config_manager.modify_user_config(self.userId, 'longport', updater)
         except Exception as e:
             print(f"删除长桥配置失败: {str(e)}")
             return False
@@ -346,24 +772,20 @@ class LongportService:
         Returns:
             bool: 更新是否成功
         """
-        try:
-            config = self.config_manager.get_user_config(self.userId)
-            if not config:
-                return False
-            
-            longport_configs = config.get('longport', {})
+        found = []
+
+        def updater(longport_configs):
+            longport_configs = longport_configs or {}
             if config_id in longport_configs:
-                config_item = longport_configs[config_id]
-                config_item.update({
+                longport_configs[config_id].update({
                     'access_token': access_token,
                     'last_refreshed_at': isoformat_utc8()
                 })
-                
-                config_data = {'longport': longport_configs}
-                return self.config_manager.update_user_config(self.userId, config_data)
-            
-            return False
-            
+                found.append(config_id)
+            return longport_configs
+
+        try:
+            return self.config_manager.modify_user_config(self.userId, 'longport', updater) and bool(found)
         except Exception as e:
             print(f"更新访问令牌失败: {str(e)}")
             return False
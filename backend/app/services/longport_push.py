@@ -0,0 +1,90 @@
+import logging
+import threading
+from typing import Dict, Tuple
+from longport.openapi import TradeContext, Config, TopicType, OrderStatus
+
+from ..core.config_store import get_config_manager
+from .longport import LongportService, trade_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class LongportPushManager:
+    """长桥订单推送管理器
+
+    为每个长桥配置维持一个长连接 TradeContext 并订阅私有推送，
+    订单全部成交时立即通过 LongportService.apply_pushed_order 增量入账。
+    """
+
+    def __init__(self):
+        self.config_manager = get_config_manager()
+        # (userId, config_id) -> (TradeContext, access_token)
+        self._contexts: Dict[Tuple[str, str], Tuple[TradeContext, str]] = {}
+        self._lock = threading.Lock()
+
+    def _on_order_changed(self, user_id: str, config_id: str, event):
+        if event.status != OrderStatus.Filled:
+            return
+        try:
+            if LongportService(user_id).apply_pushed_order(config_id, event):
+                logger.info(f"用户 {user_id} 的配置 {config_id} 推送订单 {event.order_id} 已入账")
+        except Exception as e:
+            # 入账失败不影响推送连接，由轮询对账兜底
+            logger.error(f"处理用户 {user_id} 的配置 {config_id} 推送订单 {event.order_id} 失败: {e}")
+
+    def _subscribe(self, user_id: str, config_id: str, longport_config: Dict) -> TradeContext:
+        config = Config(
+            app_key=longport_config['app_key'],
+            app_secret=longport_config['app_secret'],
+            access_token=longport_config['access_token'],
+            enable_print_quote_packages=False
+        )
+        ctx = TradeContext(config)
+        ctx.set_on_order_changed(lambda event: self._on_order_changed(user_id, config_id, event))
+        trade_rate_limiter.acquire()
+        ctx.subscribe([TopicType.Private])
+        return ctx
+
+    def _unsubscribe(self, key: Tuple[str, str]):
+        ctx, _ = self._contexts.pop(key)
+        try:
+            ctx.unsubscribe([TopicType.Private])
+        except Exception as e:
+            logger.warning(f"取消用户 {key[0]} 的配置 {key[1]} 推送订阅失败: {e}")
+
+    def refresh(self):
+        """按当前配置增删订阅：新配置建立连接，已删除的配置断开，令牌变更的配置重连"""
+        with self._lock:
+            active_keys = set()
+            for user_id in self.config_manager.get_all_user_ids():
+                longport_configs = LongportService(user_id).get_all_longport_configs() or {}
+                for config_id, longport_config in longport_configs.items():
+                    if not longport_config.get('app_key'):
+                        continue
+                    key = (user_id, config_id)
+                    active_keys.add(key)
+                    existing = self._contexts.get(key)
+                    if existing and existing[1] == longport_config['access_token']:
+                        continue
+                    if existing:
+                        self._unsubscribe(key)
+                    try:
+                        ctx = self._subscribe(user_id, config_id, longport_config)
+                        self._contexts[key] = (ctx, longport_config['access_token'])
+                        logger.info(f"已订阅用户 {user_id} 的配置 {config_id} 的订单推送")
+                    except Exception as e:
+                        logger.error(f"订阅用户 {user_id} 的配置 {config_id} 的订单推送失败: {e}")
+
+            for key in set(self._contexts) - active_keys:
+                self._unsubscribe(key)
+                logger.info(f"已取消用户 {key[0]} 的配置 {key[1]} 的订单推送")
+
+    def close(self):
+        """断开所有推送连接"""
+        with self._lock:
+            for key in list(self._contexts):
+                self._unsubscribe(key)
+
+
+# 进程内共享的推送管理器
+longport_push_manager = LongportPushManager()
@@ -1,13 +1,15 @@
 from typing import List, Dict, Optional
 from longport.openapi import QuoteContext, Config
-from ..core.tinydb_config import TinyDBConfigManager
+from ..core.config_store import get_config_manager
+from .security_info import SecurityInfoCache
 
 
 class PriceFetcher:
     """价格获取器，负责获取价格信息"""
     
     def __init__(self):
-        self.config_manager = TinyDBConfigManager()
+        self.config_manager = get_config_manager()
+        self.security_info_cache = SecurityInfoCache()
     
     def get_price(self, assets: List[Dict]) -> List[Dict]:
         """获取价格"""
@@ -110,6 +112,30 @@ class PriceFetcher:
             print(f"获取股票 {symbols} 价格失败: {str(e)}")
             return None
     
+    def get_security_info(self, symbols: List[str]) -> Dict[str, Dict]:
+        """获取证券静态信息（名称、每手股数、币种、交易所），优先读取缓存"""
+        try:
+            return self.security_info_cache.get_many(symbols, self._create_quote_context)
+        except Exception as e:
+            print(f"获取证券静态信息失败: {str(e)}")
+            return {}
+    
+    def _create_quote_context(self) -> QuoteContext:
+        app_key = self.config_manager.get_global_config('longport_app_key')
+        app_secret = self.config_manager.get_global_config('longport_app_secret')
+        access_token = self.config_manager.get_global_config('longport_access_token')
+        
+        if not all([app_key, app_secret, access_token]):
+            raise Exception("LongPort API配置不完整，请先设置app_key、app_secret和access_token")
+        
+        config = Config(
+            app_key=app_key,
+            app_secret=app_secret,
+            access_token=access_token,
+            enable_print_quote_packages=False
+        )
+        return QuoteContext(config)
+    
     def set_longport_config(self, app_key: str, app_secret: str, access_token: str) -> bool:
         """设置LongPort API配置
         
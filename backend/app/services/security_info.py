@@ -0,0 +1,65 @@
+import logging
+from datetime import timedelta
+from typing import Callable, Dict, List
+from longport.openapi import QuoteContext
+
+from ..core.app_config import AppConfig
+from ..core.database import Database, SecurityStaticInfoManager
+from ..util.rate_limiter import RateLimiter
+from ..util.time_utils import get_current_time_utc8, format_datetime_utc8
+
+logger = logging.getLogger(__name__)
+
+
+class SecurityInfoCache:
+    """证券静态信息缓存
+
+    以 SecurityStaticInfo 表持久化，超过 SECURITY_INFO_TTL_DAYS 视为过期；
+    只对未知或过期的标的批量调用一次 static_info，拉取失败时沿用过期数据。
+    行情连接通过 qctx_factory 按需创建，缓存全部命中时不会建立连接。
+    """
+
+    def __init__(self, rate_limiter: RateLimiter = None):
+        self.rate_limiter = rate_limiter
+
+    def get_many(self, symbols: List[str], qctx_factory: Callable[[], QuoteContext] = None) -> Dict[str, Dict]:
+        """获取标的静态信息，返回 symbol -> 信息（获取不到的标的不在结果中）"""
+        symbols = list({symbol for symbol in symbols if symbol})
+        if not symbols:
+            return {}
+
+        with Database() as db:
+            cached = SecurityStaticInfoManager(db).get_by_symbols(symbols)
+
+        fresh_after = format_datetime_utc8(get_current_time_utc8() - timedelta(days=AppConfig.SECURITY_INFO_TTL_DAYS))
+        to_fetch = [symbol for symbol in symbols if symbol not in cached or cached[symbol]['updated_at'] < fresh_after]
+        if not to_fetch or qctx_factory is None:
+            return cached
+
+        try:
+            qctx = qctx_factory()
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            updated_at = format_datetime_utc8()
+            infos = [{
+                'symbol': item.symbol,
+                'name_cn': item.name_cn,
+                'name_en': item.name_en,
+                'lot_size': item.lot_size,
+                'currency': item.currency,
+                'exchange': item.exchange,
+                'updated_at': updated_at
+            } for item in qctx.static_info(to_fetch)]
+        except Exception as e:
+            logger.warning(f"获取证券静态信息失败，使用缓存数据: {e}")
+            return cached
+
+        with Database() as db:
+            SecurityStaticInfoManager(db).upsert_many(infos)
+        cached.update({info['symbol']: info for info in infos})
+        return cached
+
+    @staticmethod
+    def display_name(info: Dict) -> str:
+        """证券显示名称，优先中文名"""
+        return info.get('name_cn') or info.get('name_en') or info['symbol']
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+资产估值引擎
+批量加载持仓与汇率，以整数定点数单次遍历计算各用户的总资产及分组汇总
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from app.core.data_version import get_data_versions
+from app.core.database import Database, AccountManager, ForeignExchangeRateManager
+from app.util.get_currency_rate import work_on
+from app.util.time_utils import format_date_utc8
+
+logger = logging.getLogger(__name__)
+
+# 定点数精度：与数据库中数量、成本保留的8位小数一致
+FIXED_DIGITS = 8
+FIXED_SCALE = 10 ** FIXED_DIGITS
+# 汇率以每100外币折合的人民币报价
+RATE_UNIT = 100 * FIXED_SCALE
+# 支持自动获取汇率的外币
+FX_CURRENCIES = ('USD', 'HKD')
+
+# 资产汇总缓存：(userId, 计价货币) -> (数据版本, 汇总)，账户、交易、价格或汇率写入后版本变化即失效
+_summary_cache = LRUCache(maxsize=1024)
+_summary_lock = threading.Lock()
+
+
+def to_fixed(value) -> int:
+    """把十进制字符串/数字转换为定点整数（超出精度的部分四舍五入）"""
+    if value is None:
+        return 0
+    text = str(value).strip()
+    whole, _, frac = text.partition('.')
+    if len(frac) == FIXED_DIGITS:
+        # 快速路径：数据库中的数量、成本均为8位小数，直接去掉小数点解析
+        try:
+            return int(whole + frac)
+        except ValueError:
+            pass
+    if not text:
+        return 0
+    if 'e' in text or 'E' in text:
+        return int((Decimal(text) * FIXED_SCALE).to_integral_value(ROUND_HALF_UP))
+    negative = text[0] == '-'
+    if text[0] in '+-':
+        text = text[1:]
+    whole, _, frac = text.partition('.')
+    fixed = int(whole or '0') * FIXED_SCALE + int((frac + '0' * FIXED_DIGITS)[:FIXED_DIGITS])
+    if len(frac) > FIXED_DIGITS and frac[FIXED_DIGITS] >= '5':
+        fixed += 1
+    return -fixed if negative else fixed
+
+
+def from_fixed(value: int, divisor: int = FIXED_SCALE) -> Decimal:
+    """把 value / divisor 四舍五入为保留8位小数的 Decimal（全程整数运算，不受Decimal上下文精度影响）"""
+    quotient, remainder = divmod(value * FIXED_SCALE, divisor)
+    if remainder * 2 >= divisor:
+        quotient += 1
+    return Decimal(quotient).scaleb(-FIXED_DIGITS)
+
+
+class ValuationEngine:
+    """资产估值引擎
+
+    一次查询取出所有活跃账户的 (userId, type, parentId, currency, quantity, price)，
+    一次查询取出当天各货币汇率；遍历时只做整数乘加，按 (用户, 货币)、(用户, 类型, 货币)、
+    (用户, 分组, 货币) 累加原币市值，最后每个分组按货币各换算一次，汇率查询次数只与货币种类数有关。
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.exchange_rate_manager = ForeignExchangeRateManager(db)
+
+    def load_rates(self, currencies, target_currency: str = 'CNY') -> Dict[str, Tuple[int, int]]:
+        """加载 currency -> (买入价, 卖出价) 的定点整数（每100外币折合人民币）
+
+        当天汇率缺失的外币按原逻辑在线获取并缓存；获取失败或不支持的货币按不换算处理。
+        """
+        rows = self.exchange_rate_manager.get_latest_exchange_rates()
+        rates = {'CNY': (RATE_UNIT, RATE_UNIT)}
+        for currency in set(currencies) | {target_currency}:
+            if currency in rates:
+                continue
+            row = rows.get(currency)
+            if row:
+                rates[currency] = (to_fixed(row['buy_in_price']), to_fixed(row['sell_out_price']))
+                continue
+            if currency not in FX_CURRENCIES:
+                logger.warning(f"不支持的货币 {currency}，按原值计入")
+                continue
+            try:
+                start_date = format_date_utc8(datetime.now(timezone.utc) - timedelta(days=1))
+                buy_in, sell_out = work_on(start_date, format_date_utc8(), currency, self.exchange_rate_manager)
+                rates[currency] = (to_fixed(buy_in), to_fixed(sell_out))
+            except Exception as e:
+                logger.warning(f"获取 {currency} 汇率失败: {e}，按原值计入")
+        return rates
+
+    @staticmethod
+    def _converter(rates: Dict[str, Tuple[int, int]], target_currency: str):
+        """返回把原币定点值换算为计价货币的函数，结果额外放大 RATE_UNIT 倍"""
+        _, target_sell_out = rates.get(target_currency, (RATE_UNIT, RATE_UNIT))
+
+        def convert(value: int, currency: str) -> int:
+            # 原币 -> 人民币 -> 计价货币：value * 买入价 / 卖出价，汇率缺失时不换算
+            if currency == target_currency or currency not in rates:
+                return value * RATE_UNIT
+            return value * rates[currency][0] * RATE_UNIT // target_sell_out
+        return convert
+
+    def valuate(self, user_ids: Optional[List[str]] = None, target_currency: str = 'CNY') -> Dict[str, Dict]:
+        """计算各用户的总资产
+
+        Args:
+            user_ids: 需要估值的用户，None 表示全部用户
+            target_currency: 计价货币
+
+        Returns:
+            Dict[str, Dict]: userId -> {total, currency, accountCount, byType, byGroup, byCurrency}，
+            金额均为保留8位小数的 Decimal；byGroup 按父账户ID汇总直接子账户，无父账户的键为 ''
+        """
+        holdings = AccountManager(self.db).get_active_holdings(user_ids)
+
+        # 按 (用户, 类型, 父账户, 货币) 累加原币市值（定点数平方，2*FIXED_DIGITS 位小数）及账户数，
+        # 各维度的汇总再从这些分组推出，分组数远小于账户数
+        sums: Dict[Tuple[str, str, str, str], int] = {}
+        counts: Dict[Tuple[str, str, str, str], int] = {}
+        for user_id, account_type, parent_id, currency, quantity, price in holdings:
+            key = (user_id, account_type, parent_id or '', currency)
+            sums[key] = sums.get(key, 0) + to_fixed(quantity) * to_fixed(price)
+            counts[key] = counts.get(key, 0) + 1
+
+        convert = self._converter(self.load_rates({key[3] for key in sums}, target_currency), target_currency)
+
+        # 换算后为 2*FIXED_DIGITS 位小数再乘以 RATE_UNIT
+        digits = 2 * FIXED_DIGITS
+        results: Dict[str, Dict] = {}
+        for key, value in sums.items():
+            user_id, account_type, parent_id, currency = key
+            result = results.get(user_id)
+            if result is None:
+                result = results[user_id] = {
+                    'total': 0, 'currency': target_currency, 'accountCount': 0,
+                    'byType': {}, 'byGroup': {}, 'byCurrency': {}
+                }
+            converted = convert(value, currency)
+            result['total'] += converted
+            result['accountCount'] += counts[key]
+            for name, group_key in (('byType', account_type), ('byGroup', parent_id), ('byCurrency', currency)):
+                group = result[name]
+                group[group_key] = group.get(group_key, 0) + converted
+
+        divisor = RATE_UNIT * 10 ** digits
+        for result in results.values():
+            result['total'] = from_fixed(result['total'], divisor)
+            for name in ('byType', 'byGroup', 'byCurrency'):
+                result[name] = {k: from_fixed(v, divisor) for k, v in result[name].items()}
+        return results
+
+    def valuate_tree(self, user_id: str, target_currency: str = 'CNY') -> List[Dict]:
+        """按 parentId 构建用户的资产树，并计算每个节点换算为计价货币后的小计
+
+        账户树由一次递归查询得到（从深到浅），汇率只加载一次；自底向上遍历时把子节点小计累加到父节点。
+        节点字段与前端 AssetNode 一致，另加 convertedValue（自身市值换算后）与 totalValue（含子节点的小计）；
+        同级节点先排资产组，再按小计降序。
+        """
+        rows = AccountManager(self.db).get_account_tree(user_id)
+        convert = self._converter(
+            self.load_rates({row['currency'] for row in rows if row['type'] != 'group'}, target_currency),
+            target_currency
+        )
+        divisor = RATE_UNIT * 10 ** (2 * FIXED_DIGITS)
+
+        nodes: Dict[str, Dict] = {}
+        totals: Dict[str, int] = {}
+        for row in rows:
+            node = {
+                'id': row['id'],
+                'name': row['description'],
+                'type': row['type'],
+                'description': row['description'],
+                'symbol': row['symbol']
+            }
+            own = 0
+            if row['type'] != 'group':
+                value = to_fixed(row['quantity']) * to_fixed(row['price'])
+                own = convert(value, row['currency'])
+                node.update({
+                    'quantity': float(row['quantity']),
+                    'cost': float(row['cost']),
+                    'currency': row['currency'],
+                    'currentPrice': float(row['price']),
+                    'value': float(from_fixed(value, FIXED_SCALE * FIXED_SCALE)),
+                    'convertedValue': float(from_fixed(own, divisor))
+                })
+            nodes[row['id']] = node
+            totals[row['id']] = own
+
+        roots = []
+        # 行按深度从深到浅排列，处理到某个节点时它的子节点都已累加完毕
+        for row in rows:
+            node = nodes[row['id']]
+            node['totalValue'] = float(from_fixed(totals[row['id']], divisor))
+            if 'children' in node:
+                node['children'].sort(key=lambda child: (child['type'] != 'group', -child['totalValue']))
+            if row['depth'] == 0:
+                roots.append(node)
+            else:
+                totals[row['parentId']] += totals[row['id']]
+                nodes[row['parentId']].setdefault('children', []).append(node)
+        roots.sort(key=lambda node: (node['type'] != 'group', -node['totalValue']))
+        return roots
+
+    def summarize(self, user_id: str, target_currency: str = 'CNY') -> Dict:
+        """汇总用户的总市值、总成本、未实现盈亏，及按类型、货币、顶层节点的分布
+
+        与 valuate/valuate_tree 相同：按 (顶层节点, 类型, 货币) 累加原币定点数，每个分组按货币换算一次，
+        全程整数运算，只在最后转换为保留8位小数的浮点数用于展示，与资产树、估值序列的金额一致。
+        """
+        rows = AccountManager(self.db).get_holdings_by_root(user_id)
+
+        # (顶层节点, 类型, 货币) -> [市值, 成本, 账户数]，金额为定点数平方
+        sums: Dict[Tuple[str, str, str], List[int]] = {}
+        roots: Dict[str, Tuple[str, str]] = {}
+        for root_id, root_name, root_type, account_type, currency, quantity, price, cost in rows:
+            fixed_quantity = to_fixed(quantity)
+            item = sums.get((root_id, account_type, currency))
+            if item is None:
+                item = sums[(root_id, account_type, currency)] = [0, 0, 0]
+                roots[root_id] = (root_name, root_type)
+            item[0] += fixed_quantity * to_fixed(price)
+            item[1] += fixed_quantity * to_fixed(cost)
+            item[2] += 1
+
+        convert = self._converter(self.load_rates({key[2] for key in sums}, target_currency), target_currency)
+        total_value = total_cost = account_count = 0
+        groups = {'byType': {}, 'byCurrency': {}, 'byGroup': {}}
+        for (root_id, account_type, currency), (value, cost, count) in sums.items():
+            converted_value, converted_cost = convert(value, currency), convert(cost, currency)
+            total_value += converted_value
+            total_cost += converted_cost
+            account_count += count
+            for name, key, extra in (
+                ('byType', account_type, {'type': account_type}),
+                ('byCurrency', currency, {'currency': currency, 'originalValue': 0}),
+                ('byGroup', root_id, {'id': root_id, 'name': roots[root_id][0], 'type': roots[root_id][1]}),
+            ):
+                item = groups[name].get(key)
+                if item is None:
+                    item = groups[name][key] = dict(extra, value=0, cost=0, accountCount=0)
+                item['value'] += converted_value
+                item['cost'] += converted_cost
+                item['accountCount'] += count
+            groups['byCurrency'][currency]['originalValue'] += value
+
+        divisor = RATE_UNIT * 10 ** (2 * FIXED_DIGITS)
+
+        def display(value: int, scale: int = divisor) -> float:
+            return float(from_fixed(value, scale))
+
+        summary = {
+            'currency': target_currency,
+            'totalValue': display(total_value),
+            'totalCost': display(total_cost),
+            'accountCount': account_count,
+            'unrealizedPnl': display(total_value - total_cost)
+        }
+        for name, items in groups.items():
+            result = []
+            for item in sorted(items.values(), key=lambda item: -item['value']):
+                value, cost = item['value'], item['cost']
+                item['value'], item['cost'] = display(value), display(cost)
+                item['unrealizedPnl'] = display(value - cost)
+                if total_value:
+                    # from_fixed 要求除数为正
+                    item['ratio'] = display(value, total_value) if total_value > 0 else display(-value, -total_value)
+                else:
+                    item['ratio'] = 0.0
+                if 'originalValue' in item:
+                    item['originalValue'] = display(item['originalValue'], FIXED_SCALE * FIXED_SCALE)
+                result.append(item)
+            summary[name] = result
+        return summary
+
+
+def get_portfolio_summary(user_id: str, target_currency: str = 'CNY') -> Dict:
+    """获取用户的资产汇总，数据版本未变化时直接返回缓存结果（返回值只读）"""
+    key = (user_id, target_currency)
+    # 先读版本再计算：计算期间发生写入时缓存的版本偏旧，下次请求会重新计算
+    version = get_data_versions().get(user_id)
+    with _summary_lock:
+        cached = _summary_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with Database() as db:
+        summary = ValuationEngine(db).summarize(user_id, target_currency)
+    summary['version'] = version
+    with _summary_lock:
+        _summary_cache[key] = (version, summary)
+    return summary
@@ -0,0 +1,55 @@
+import re
+from typing import List, Optional, Sequence
+
+# 分桶粒度的单位（秒）
+_RESOLUTION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+_RESOLUTION_PATTERN = re.compile(r'^(\d+)([smhd]?)$')
+
+
+def parse_resolution(value: Optional[str]) -> Optional[int]:
+    """解析分桶粒度，如 '300'、'5m'、'1h'、'1d'；为空或 'raw' 时返回 None 表示不分桶"""
+    if value is None or value.strip().lower() in ('', 'raw'):
+        return None
+    match = _RESOLUTION_PATTERN.match(value.strip().lower())
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"无效的分桶粒度: {value}，应为秒数或带单位的时长（如 5m、1h、1d）")
+    return int(match.group(1)) * _RESOLUTION_UNITS[match.group(2) or 's']
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets 降采样，返回保留点的下标（升序）
+
+    保留首尾两点，中间的点平均分成 threshold - 2 个桶，每个桶选出与上一个保留点、
+    下一个桶均值点构成三角形面积最大的点，在点数大幅减少时仍保留曲线的峰谷形状。
+    xs 需按升序排列；点数不超过 threshold 时原样返回全部下标。
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    selected = [0]
+    every = (count - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # 下一个桶的均值点作为三角形的第三个顶点
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        max_area = -1.0
+        chosen = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+        selected.append(chosen)
+        a = chosen
+
+    selected.append(count - 1)
+    return selected
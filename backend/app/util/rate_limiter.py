@@ -0,0 +1,41 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """令牌桶限流器（线程安全）
+
+    每 period 秒最多放行 rate 次调用，acquire 在令牌不足时阻塞等待。
+    """
+
+    def __init__(self, rate: int, period: float = 1.0):
+        if rate <= 0 or period <= 0:
+            raise ValueError("rate和period必须大于0")
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._tokens = min(self.rate, self._tokens + elapsed * self.rate / self.period)
+        self._updated_at = now
+
+    def acquire(self, timeout: float = None) -> bool:
+        """获取一个令牌，超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) * self.period / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
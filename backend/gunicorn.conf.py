@@ -0,0 +1,28 @@
+"""
+gunicorn 配置
+worker 数、线程数等可通过环境变量调整；SSE 长连接会占用线程，因此使用 gthread worker
+"""
+
+import os
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', 5000)}"
+workers = int(os.getenv('WEB_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 16))
+# SSE 连接依靠心跳保持，超时需大于心跳间隔
+timeout = int(os.getenv('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """每个worker启动后参与定时任务领导者竞选"""
+    from app.schedule.leader import start_scheduler_candidate
+    start_scheduler_candidate()
+
+
+def worker_exit(server, worker):
+    """worker退出时释放租约，其他worker无需等待租约过期即可接任"""
+    from app.schedule.leader import stop_scheduler_candidate
+    stop_scheduler_candidate()
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+账本重建脚本
+按交易记录从头重放所有账户，修正与账本不一致的持仓数量与平均成本，并补齐每笔交易的余额及持仓批次
+"""
+
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+from app.models import AssetManagerContext
+
+if __name__ == '__main__':
+    print("开始按交易记录重建账户持仓...")
+    with AssetManagerContext() as m:
+        result = m.rebuild_all_accounts()
+
+    print(f"重建完成: {result['accounts']} 个账户，{result['transactions']} 笔交易")
+    for account_id, error in result['failed'].items():
+        print(f"账户 {account_id} 重建失败，保持原值: {error}")
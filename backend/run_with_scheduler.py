@@ -35,10 +35,6 @@ def run_scheduler_thread():
     start_scheduler()
 
 if __name__ == '__main__':
-    # 设置Flask配置
-    app.config['JSON_AS_ASCII'] = False  # 支持中文
-    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True  # 美化JSON输出
-    
     # 创建定时器线程
     scheduler_thread = threading.Thread(target=run_scheduler_thread, daemon=True)
     scheduler_thread.start()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+配置存储基准测试 - 比较 TinyDB 与 SQLite 配置存储在大量用户下的读写耗时
+
+用法: python benchmark_config_store.py [用户数，默认10000]
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+
+# 使用临时目录，避免污染真实配置与数据库
+_tmp_dir = tempfile.mkdtemp(prefix='config_bench_')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp_dir, 'finance.db')
+os.environ['TINYDB_CONFIG_PATH'] = os.path.join(_tmp_dir, 'config.json')
+# 默认每次写入立即落盘，批量写入时整份文件重写次数与用户数相同；基准测试使用按间隔合并落盘
+os.environ.setdefault('TINYDB_FLUSH_INTERVAL', '1.0')
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.tinydb_config import TinyDBConfigManager
+from app.core.sqlite_config import SQLiteConfigManager
+
+
+def _user_config(i: int) -> dict:
+    return {
+        'settings': {'currency': 'CNY', 'language': 'zh-CN', 'timezone': 'Asia/Shanghai'},
+        'longport': {
+            f'config-{i}': {
+                'app_key': f'key-{i}',
+                'app_secret': f'secret-{i}',
+                'access_token': f'token-{i}',
+                'last_refreshed_at': '2024-01-01T00:00:00+00:00'
+            }
+        }
+    }
+
+
+def _timed(label: str, func, count: int):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} 总耗时 {elapsed:8.3f}s  平均 {elapsed / count * 1000:8.3f}ms")
+
+
+def benchmark(name: str, manager, user_count: int, sample_count: int):
+    print(f"\n{name}（{user_count} 个用户）")
+    user_ids = [f'user-{i}' for i in range(user_count)]
+    samples = random.sample(user_ids, sample_count)
+
+    def populate():
+        for i, user_id in enumerate(user_ids):
+            manager.set_user_config(user_id, _user_config(i))
+        manager.flush()
+
+    def read_users():
+        for user_id in samples:
+            manager.get_user_config(user_id)
+
+    def update_users():
+        for user_id in samples:
+            manager.set_user_config(user_id, {'settings': {'currency': 'USD'}})
+        manager.flush()
+
+    def list_users():
+        for _ in range(10):
+            manager.get_all_user_ids()
+
+    def read_globals():
+        for _ in range(sample_count):
+            manager.get_global_config('longport_app_key')
+
+    manager.set_global_config({'longport_app_key': 'bench'})
+    _timed('写入全部用户', populate, user_count)
+    _timed(f'随机读取 {sample_count} 个用户', read_users, sample_count)
+    _timed(f'随机更新 {sample_count} 个用户', update_users, sample_count)
+    _timed('列出全部用户ID x10', list_users, 10)
+    _timed(f'读取全局配置 x{sample_count}', read_globals, sample_count)
+
+
+if __name__ == "__main__":
+    user_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    sample_count = min(1000, user_count)
+    print(f"=== 配置存储基准测试（临时目录 {_tmp_dir}） ===")
+
+    benchmark('TinyDB', TinyDBConfigManager(), user_count, sample_count)
+    benchmark('SQLite', SQLiteConfigManager(), user_count, sample_count)
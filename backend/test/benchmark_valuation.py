@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+资产估值基准测试 - 比较逐账户 Decimal 计算与估值引擎在大量账户下的耗时
+
+用法: python benchmark_valuation.py [账户数，默认100000] [用户数，默认1000]
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+# 使用临时目录，避免污染真实配置与数据库
+_tmp_dir = tempfile.mkdtemp(prefix='valuation_bench_')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp_dir, 'finance.db')
+os.environ['TINYDB_CONFIG_PATH'] = os.path.join(_tmp_dir, 'config.json')
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.database import Database, AccountManager, ForeignExchangeRateManager
+from app.services.valuation import ValuationEngine
+from app.util.get_currency_rate import convert_currency_amount
+
+CURRENCIES = ['CNY', 'CNY', 'USD', 'HKD']
+TYPES = ['stock', 'cash', 'asset', 'liability']
+
+
+def populate(account_count: int, user_count: int):
+    with Database() as db:
+        rate_manager = ForeignExchangeRateManager(db)
+        rate_manager.set_exchange_rate({'id': str(uuid.uuid4()), 'foreign_currency': 'USD',
+                                        'buy_in_price': '710.12', 'sell_out_price': '713.14'})
+        rate_manager.set_exchange_rate({'id': str(uuid.uuid4()), 'foreign_currency': 'HKD',
+                                        'buy_in_price': '91.02', 'sell_out_price': '91.38'})
+        rows = []
+        for i in range(account_count):
+            cost = f'{random.uniform(1, 500):.8f}'
+            market_price = random.choice([None, '0', f'{random.uniform(1, 500):.8f}'])
+            rows.append((
+                str(uuid.uuid4()), f'user-{i % user_count}', f'SYM{i}', random.choice(TYPES), '',
+                f'acc-{i}', f'{random.randint(1, 10000)}.00000000', cost, market_price,
+                random.choice(CURRENCIES)
+            ))
+        db.execute_many('''
+            INSERT INTO Accounts (id, userId, symbol, type, parentId, description, quantity, cost, marketPrice, currency)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+
+def legacy_valuate(user_ids):
+    """原定时任务的算法：逐用户查询、逐账户 Decimal 计算并换算汇率"""
+    results = {}
+    with Database() as db:
+        account_manager = AccountManager(db)
+        exchange_rate_manager = ForeignExchangeRateManager(db)
+        for user_id in user_ids:
+            total = Decimal('0')
+            for account in account_manager.get_accounts_by_user(user_id):
+                market_price = account.get('marketPrice')
+                if not market_price or market_price == '0':
+                    market_price = account.get('cost', '0')
+                value = Decimal(str(account['quantity'])) * Decimal(str(market_price))
+                if account['currency'] != 'CNY':
+                    value = convert_currency_amount(value, account['currency'], 'CNY', None, exchange_rate_manager)
+                total += value
+            results[user_id] = total
+    return results
+
+
+def engine_valuate():
+    with Database() as db:
+        return ValuationEngine(db).valuate()
+
+
+def _timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"  {label:<24} 耗时 {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+if __name__ == "__main__":
+    account_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    user_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f"=== 资产估值基准测试（{account_count} 个账户，{user_count} 个用户，临时目录 {_tmp_dir}） ===")
+
+    _timed('写入测试数据', lambda: populate(account_count, user_count))
+    user_ids = [f'user-{i}' for i in range(user_count)]
+    legacy = _timed('逐账户 Decimal', lambda: legacy_valuate(user_ids))
+    engine = _timed('估值引擎', engine_valuate)
+
+    max_diff = max(abs(legacy[user_id] - engine[user_id]['total']) for user_id in user_ids)
+    print(f"  两种算法最大差异: {max_diff}")
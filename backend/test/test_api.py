@@ -105,6 +105,47 @@ class TestAPI(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertIn('data', data)
 
+    def test_get_portfolio_valuation(self):
+        """测试获取总资产估值序列接口"""
+        print("\n测试获取总资产估值序列接口...")
+        response = requests.get(
+            f"{self.base_url}/api/v1/portfolio/valuation?userId={self.user_id}&start=2024-01-01&end=2099-12-31"
+        )
+        
+        print(f"状态码: {response.status_code}")
+        print(f"响应: {response.json()}")
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['data']['userId'], self.user_id)
+        self.assertIsInstance(data['data']['valuations'], list)
+        
+        # 缺少userId
+        response = requests.get(f"{self.base_url}/api/v1/portfolio/valuation")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+    def test_get_price_tracing_downsampled(self):
+        """测试价格追踪数据的分桶与降采样参数"""
+        print("\n测试价格追踪数据的分桶与降采样参数...")
+        response = requests.get(
+            f"{self.base_url}/api/v1/get_price_tracing?accountId=0&resolution=1d&mode=ohlc&max_points=50"
+        )
+        
+        print(f"状态码: {response.status_code}")
+        print(f"响应: {response.json()}")
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertLessEqual(len(data['data']['price_tracing']), 50)
+        
+        # 无效的分桶粒度
+        response = requests.get(f"{self.base_url}/api/v1/get_price_tracing?accountId=0&resolution=abc")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
     def test_update_asset(self):
         """测试更新资产接口"""
         print("\n测试更新资产接口...")
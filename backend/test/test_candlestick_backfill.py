@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+历史K线回填测试 - 覆盖区间与限流（用假的行情上下文和临时数据库，无需启动服务器或连接长桥）
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+# 配置文件放在临时目录，避免导入应用时在当前目录生成config.json
+os.environ.setdefault('TINYDB_CONFIG_PATH', os.path.join(tempfile.mkdtemp(prefix='backfill_test_config_'), 'config.json'))
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.app_config import AppConfig
+from app.core.database import Database, SymbolPriceHistoryManager
+from app.models import AssetManagerContext
+from app.services import candlestick_backfill
+from app.services.candlestick_backfill import CandlestickBackfiller
+from app.util.time_utils import get_current_time_utc8
+
+USER_ID = 'backfill-test-user'
+SYMBOL = 'AAPL.US'
+
+
+class FakeQuoteContext:
+    """只为工作日返回日K的行情上下文，记录每次请求的区间"""
+
+    def __init__(self):
+        self.requests = []
+
+    def history_candlesticks_by_date(self, symbol, period, adjust_type, start, end):
+        self.requests.append((start, end))
+        days = (end - start).days + 1
+        return [SimpleNamespace(timestamp=datetime.combine(day, datetime.min.time()),
+                                open=1, high=1, low=1, close=1, volume=100)
+                for day in (start + timedelta(days=i) for i in range(days)) if day.weekday() < 5]
+
+
+class TestCandlestickBackfill(unittest.TestCase):
+    """历史K线回填测试类"""
+
+    def setUp(self):
+        """每个测试使用独立的临时数据库"""
+        self._tmp_dir = tempfile.mkdtemp(prefix='backfill_test_')
+        self._database_path = AppConfig.DATABASE_PATH
+        AppConfig.DATABASE_PATH = os.path.join(self._tmp_dir, 'finance.db')
+        self.ctx = FakeQuoteContext()
+        patcher = mock.patch.object(CandlestickBackfiller, '_create_quote_context', lambda backfiller: self.ctx)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        AppConfig.DATABASE_PATH = self._database_path
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def _hold_since(self, first_date):
+        with AssetManagerContext() as m:
+            m.add_asset({
+                'id': 'stock-1', 'userId': USER_ID, 'symbol': SYMBOL, 'type': 'stock',
+                'description': SYMBOL, 'quantity': '0', 'cost': '0', 'currency': 'USD'
+            })
+            m.update_asset_by_transaction({
+                'id': 'buy-1', 'userId': USER_ID, 'accountId': 'stock-1', 'description': 'buy-1',
+                'date': f'{first_date.isoformat()} 10:00:00', 'direction': 0, 'quantity': '1', 'price': '1',
+                'currency': 'USD'
+            })
+
+    def test_non_trading_days_are_not_refetched(self):
+        """首笔交易在周末、最后一根K线之后是非交易日时，再次回填不会重复请求"""
+        today = get_current_time_utc8().date()
+        saturday = today - timedelta(days=today.weekday() + 9)
+        self._hold_since(saturday)
+
+        with mock.patch.object(candlestick_backfill.quote_rate_limiter, 'acquire') as acquire:
+            CandlestickBackfiller(max_workers=1).backfill_all()
+            self.assertEqual(self.ctx.requests, [(saturday, today - timedelta(days=1))])
+            self.assertEqual(acquire.call_count, 1)
+
+            CandlestickBackfiller(max_workers=1).backfill_all()
+            self.assertEqual(len(self.ctx.requests), 1)
+
+        with Database() as db:
+            covered = SymbolPriceHistoryManager(db).get_covered_range(SYMBOL)
+        self.assertEqual(covered['start_date'], saturday.isoformat())
+        self.assertEqual(covered['end_date'], (today - timedelta(days=1)).isoformat())
+
+    def test_legacy_candles_extend_coverage(self):
+        """没有覆盖记录时按已入库K线的范围计算，补齐头部后记为连续的覆盖区间"""
+        today = get_current_time_utc8().date()
+        yesterday = today - timedelta(days=1)
+        first = yesterday - timedelta(days=20)
+        self._hold_since(first)
+        with Database() as db:
+            SymbolPriceHistoryManager(db).add_candlesticks(SYMBOL, [{
+                'date': day.isoformat(), 'open': 1, 'high': 1, 'low': 1, 'close': 1, 'volume': 1
+            } for day in (first + timedelta(days=10), yesterday)])
+
+        CandlestickBackfiller(max_workers=1).backfill_all()
+        self.assertEqual(self.ctx.requests, [(first, first + timedelta(days=9))])
+        with Database() as db:
+            covered = SymbolPriceHistoryManager(db).get_covered_range(SYMBOL)
+        self.assertEqual((covered['start_date'], covered['end_date']), (first.isoformat(), yesterday.isoformat()))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+降采样测试 - 分桶粒度解析与 LTTB 算法（纯函数，无需启动服务器）
+"""
+
+import math
+import os
+import sys
+import tempfile
+import unittest
+
+# 配置文件放在临时目录，避免导入应用时在当前目录生成config.json
+os.environ.setdefault('TINYDB_CONFIG_PATH', os.path.join(tempfile.mkdtemp(prefix='downsample_test_config_'), 'config.json'))
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.util.downsample import lttb, parse_resolution
+
+
+class TestParseResolution(unittest.TestCase):
+    """分桶粒度解析测试类"""
+
+    def test_units(self):
+        self.assertEqual(parse_resolution('300'), 300)
+        self.assertEqual(parse_resolution('45s'), 45)
+        self.assertEqual(parse_resolution('5m'), 300)
+        self.assertEqual(parse_resolution('1h'), 3600)
+        self.assertEqual(parse_resolution(' 2D '), 2 * 86400)
+
+    def test_raw(self):
+        self.assertIsNone(parse_resolution(None))
+        self.assertIsNone(parse_resolution(''))
+        self.assertIsNone(parse_resolution('raw'))
+
+    def test_invalid(self):
+        for value in ('0', '0m', '-5', '5w', '1.5h', 'h', 'abc'):
+            with self.assertRaises(ValueError, msg=value):
+                parse_resolution(value)
+
+
+class TestLttb(unittest.TestCase):
+    """LTTB 降采样测试类"""
+
+    def test_short_series_unchanged(self):
+        self.assertEqual(lttb([0, 1, 2], [5, 6, 7], 3), [0, 1, 2])
+        self.assertEqual(lttb([0, 1, 2], [5, 6, 7], 10), [0, 1, 2])
+        self.assertEqual(lttb([], [], 5), [])
+
+    def test_threshold_below_three_unchanged(self):
+        self.assertEqual(lttb(list(range(5)), [0] * 5, 2), list(range(5)))
+
+    def test_keeps_endpoints_and_count(self):
+        xs = list(range(1000))
+        ys = [math.sin(x / 30) for x in xs]
+        indices = lttb(xs, ys, 50)
+        self.assertEqual(len(indices), 50)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], 999)
+        self.assertEqual(indices, sorted(set(indices)))
+
+    def test_keeps_spike(self):
+        xs = list(range(100))
+        ys = [0.0] * 100
+        ys[37] = 100.0
+        self.assertIn(37, lttb(xs, ys, 10))
+
+    def test_uneven_spacing(self):
+        # 时间间隔不均匀时按 x 值计算面积
+        xs = [0, 1, 2, 3, 100, 101, 102, 103, 104, 200]
+        ys = [0, 0, 0, 0, 50, 0, 0, 0, 0, 0]
+        indices = lttb(xs, ys, 4)
+        self.assertEqual(len(indices), 4)
+        self.assertIn(4, indices)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+账本测试 - 交易重放、期初持仓等（直接使用临时数据库，无需启动服务器）
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+
+# 配置文件放在临时目录，避免导入应用时在当前目录生成config.json
+os.environ.setdefault('TINYDB_CONFIG_PATH', os.path.join(tempfile.mkdtemp(prefix='ledger_test_config_'), 'config.json'))
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.app_config import AppConfig
+from app.core.database import Database, AccountCheckpointManager, TransactionManager
+from app.models import AssetManagerContext
+
+USER_ID = 'ledger-test-user'
+
+
+class TestLedger(unittest.TestCase):
+    """账本测试类"""
+
+    def setUp(self):
+        """每个测试使用独立的临时数据库"""
+        self._tmp_dir = tempfile.mkdtemp(prefix='ledger_test_')
+        self._database_path = AppConfig.DATABASE_PATH
+        AppConfig.DATABASE_PATH = os.path.join(self._tmp_dir, 'finance.db')
+
+    def tearDown(self):
+        AppConfig.DATABASE_PATH = self._database_path
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def _add_account(self, account_id: str, quantity: str = '0', cost: str = '0'):
+        with AssetManagerContext() as m:
+            m.add_asset({
+                'id': account_id, 'userId': USER_ID, 'symbol': account_id, 'type': 'stock',
+                'description': account_id, 'quantity': quantity, 'cost': cost, 'currency': 'USD'
+            })
+
+    def _trade(self, account_id: str, transaction_id: str, date: str, direction: int, quantity: str, price: str, **extra):
+        with AssetManagerContext() as m:
+            m.update_asset_by_transaction(dict({
+                'id': transaction_id, 'userId': USER_ID, 'accountId': account_id, 'description': transaction_id,
+                'date': date, 'direction': direction, 'quantity': quantity, 'price': price, 'currency': 'USD'
+            }, **extra))
+
+    def _position(self, account_id: str):
+        with AssetManagerContext() as m:
+            account = m.get_asset_by_id(account_id)
+        return Decimal(account['quantity']), Decimal(account['cost'])
+
+    def _balances(self, *transaction_ids):
+        """各笔交易入账后的余额 (balanceQuantity, balanceCost)"""
+        with Database() as db:
+            manager = TransactionManager(db)
+            rows = [manager.get_transaction_by_id(transaction_id) for transaction_id in transaction_ids]
+        return [(Decimal(row['balanceQuantity']), Decimal(row['balanceCost'])) for row in rows]
+
+    def _seed_trades(self):
+        """1月2日买入10@10，1月4日卖出4@13"""
+        self._add_account('acc')
+        self._trade('acc', 'buy1', '2024-01-02 10:00:00', 0, '10', '10')
+        self._trade('acc', 'sell1', '2024-01-04 10:00:00', 1, '4', '13')
+
+    def test_append_records_balances(self):
+        """按时间顺序追加的交易直接记录入账后的余额"""
+        self._seed_trades()
+        self.assertEqual(self._balances('buy1', 'sell1'), [(Decimal('10'), Decimal('10')), (Decimal('6'), Decimal('8'))])
+        self.assertEqual(self._position('acc'), (Decimal('6'), Decimal('8')))
+
+    def test_backdated_insert_replays_later_entries(self):
+        """补录更早的交易后，其后交易的余额与账户持仓都被重算"""
+        self._seed_trades()
+        self._trade('acc', 'buy0', '2024-01-03 10:00:00', 0, '10', '20')
+
+        self.assertEqual(self._balances('buy1', 'buy0', 'sell1'), [
+            (Decimal('10'), Decimal('10')), (Decimal('20'), Decimal('15')), (Decimal('16'), Decimal('15.5'))
+        ])
+        self.assertEqual(self._position('acc'), (Decimal('16'), Decimal('15.5')))
+
+    def test_edit_transaction_replays_from_earlier_position(self):
+        """修改交易（含改到更早的日期）后从新旧位置中靠前的一个开始重放"""
+        self._seed_trades()
+        self._trade('acc', 'buy2', '2024-01-05 10:00:00', 0, '6', '20')
+        with AssetManagerContext() as m:
+            self.assertTrue(m.update_transaction(USER_ID, 'buy2', {'date': '2024-01-03 10:00:00', 'quantity': '10'}))
+
+        self.assertEqual(self._balances('buy1', 'buy2', 'sell1'), [
+            (Decimal('10'), Decimal('10')), (Decimal('20'), Decimal('15')), (Decimal('16'), Decimal('15.5'))
+        ])
+        self.assertEqual(self._position('acc'), (Decimal('16'), Decimal('15.5')))
+
+    def test_delete_transaction_replays(self):
+        """删除交易后其后交易的余额被重算；导致卖出超过持有数量的删除整体回滚"""
+        self._seed_trades()
+        self._trade('acc', 'buy2', '2024-01-03 10:00:00', 0, '10', '20')
+        with AssetManagerContext() as m:
+            self.assertTrue(m.delete_transaction(USER_ID, 'buy2'))
+        self.assertEqual(self._balances('sell1'), [(Decimal('6'), Decimal('8'))])
+
+        with self.assertRaises(ValueError):
+            with AssetManagerContext() as m:
+                m.delete_transaction(USER_ID, 'buy1')
+        self.assertEqual(self._position('acc'), (Decimal('6'), Decimal('8')))
+        self.assertEqual(self._balances('buy1', 'sell1'), [(Decimal('10'), Decimal('10')), (Decimal('6'), Decimal('8'))])
+
+    def test_rebuild_matches_incremental_replay(self):
+        """全量重建与增量重放得到相同的余额与持仓，并修正与账本不一致的持仓"""
+        self._seed_trades()
+        self._trade('acc', 'buy0', '2024-01-03 10:00:00', 0, '10', '20')
+        balances = self._balances('buy1', 'buy0', 'sell1')
+        position = self._position('acc')
+        with Database() as db:
+            db.execute_update("UPDATE Accounts SET quantity = '999' WHERE id = 'acc'")
+            db.execute_update('UPDATE Transactions SET balanceQuantity = NULL, balanceCost = NULL')
+
+        with AssetManagerContext() as m:
+            result = m.rebuild_all_accounts()
+        self.assertEqual((result['accounts'], result['transactions'], result['failed']), (1, 3, {}))
+        self.assertEqual(self._balances('buy1', 'buy0', 'sell1'), balances)
+        self.assertEqual(self._position('acc'), position)
+
+    def _seed_months(self):
+        """跨三个月的五笔交易，每3笔交易及每月最后一笔交易处记录检查点"""
+        AppConfig.LEDGER_CHECKPOINT_INTERVAL, interval = 3, AppConfig.LEDGER_CHECKPOINT_INTERVAL
+        self.addCleanup(setattr, AppConfig, 'LEDGER_CHECKPOINT_INTERVAL', interval)
+        self._add_account('acc')
+        self._trade('acc', 't1', '2024-01-10 10:00:00', 0, '10', '10')  # 10 @ 10
+        self._trade('acc', 't2', '2024-01-20 10:00:00', 0, '10', '20')  # 20 @ 15，一月最后一笔
+        self._trade('acc', 't3', '2024-02-05 10:00:00', 1, '5', '30')   # 15 @ 10，第3笔
+        self._trade('acc', 't4', '2024-02-15 10:00:00', 0, '5', '10')   # 20 @ 10，二月最后一笔
+        self._trade('acc', 't5', '2024-03-01 10:00:00', 1, '10', '12')  # 10 @ 8
+
+    def _checkpoints(self):
+        with Database() as db:
+            return [(row['asOfDate'], row['txCount'], Decimal(row['quantity']), Decimal(row['cost']))
+                    for row in AccountCheckpointManager(db).get_checkpoints('acc')]
+
+    def _as_of(self, date: str):
+        with AssetManagerContext() as m:
+            position = m.get_position_as_of('acc', date)
+        return position['quantity'], position['cost']
+
+    def test_checkpoints_at_interval_and_month_end(self):
+        """按交易笔数间隔及每月最后一笔交易记录检查点，补录交易后其后的检查点重新生成"""
+        self._seed_months()
+        self.assertEqual(self._checkpoints(), [
+            ('2024-01-20 10:00:00', 2, Decimal('20'), Decimal('15')),
+            ('2024-02-05 10:00:00', 3, Decimal('15'), Decimal('10')),
+            ('2024-02-15 10:00:00', 4, Decimal('20'), Decimal('10')),
+        ])
+
+        self._trade('acc', 't0', '2024-01-15 10:00:00', 0, '10', '30')
+        self.assertEqual([(date, count) for date, count, _, _ in self._checkpoints()], [
+            ('2024-01-20 10:00:00', 3), ('2024-02-15 10:00:00', 5), ('2024-03-01 10:00:00', 6)
+        ])
+        with AssetManagerContext() as m:
+            m.rebuild_all_accounts()
+        self.assertEqual([(date, count) for date, count, _, _ in self._checkpoints()], [
+            ('2024-01-20 10:00:00', 3), ('2024-02-15 10:00:00', 5), ('2024-03-01 10:00:00', 6)
+        ])
+
+    def test_position_as_of_across_checkpoints_and_months(self):
+        """历史持仓查询：有余额时直接取余额，旧数据没有余额时从最近的检查点开始重放，结果一致"""
+        self._seed_months()
+        dates = ['2024-01-01 00:00:00', '2024-01-15 00:00:00', '2024-01-31 23:59:59', '2024-02-10 00:00:00',
+                 '2024-02-29 23:59:59', '2024-03-01 10:00:00', '2024-12-31 00:00:00']
+        expected = [
+            (Decimal('0'), Decimal('0')), (Decimal('10'), Decimal('10')), (Decimal('20'), Decimal('15')),
+            (Decimal('15'), Decimal('10')), (Decimal('20'), Decimal('10')), (Decimal('10'), Decimal('8')),
+            (Decimal('10'), Decimal('8')),
+        ]
+        self.assertEqual([self._as_of(date) for date in dates], expected)
+
+        with Database() as db:
+            db.execute_update('UPDATE Transactions SET balanceQuantity = NULL, balanceCost = NULL')
+        self.assertEqual([self._as_of(date) for date in dates], expected)
+
+    def _lots(self):
+        """{批次ID: 剩余数量}（仅未平仓批次）及已实现盈亏合计"""
+        with AssetManagerContext() as m:
+            result = m.get_lots('acc')
+        return {lot['id']: Decimal(lot['remainingQuantity']) for lot in result['lots']}, result['realizedPnl']
+
+    def test_fifo_and_specific_lot_sells(self):
+        """先进先出卖出跨批次消耗；指定 lotId 的卖出只消耗该批次，剩余不足时拒绝并回滚"""
+        self._add_account('acc')
+        self._trade('acc', 'b1', '2024-01-02 10:00:00', 0, '10', '10')
+        self._trade('acc', 'b2', '2024-01-03 10:00:00', 0, '10', '20')
+        self._trade('acc', 's1', '2024-01-04 10:00:00', 1, '15', '25')
+        self.assertEqual(self._lots(), ({'b2': Decimal('5')}, Decimal('175')))
+
+        self._trade('acc', 'b3', '2024-01-05 10:00:00', 0, '10', '30')
+        self._trade('acc', 's2', '2024-01-06 10:00:00', 1, '3', '40', lotId='b3')
+        self.assertEqual(self._lots(), ({'b2': Decimal('5'), 'b3': Decimal('7')}, Decimal('205')))
+
+        with self.assertRaises(ValueError):
+            self._trade('acc', 's3', '2024-01-07 10:00:00', 1, '8', '40', lotId='b3')
+        self.assertEqual(self._lots(), ({'b2': Decimal('5'), 'b3': Decimal('7')}, Decimal('205')))
+        self.assertEqual(self._position('acc')[0], Decimal('12'))
+
+    def test_backdated_sell_rerealizes_and_matches_rebuild(self):
+        """补录更早的卖出后重新分配其后卖出消耗的批次，结果与全量重建一致"""
+        self._add_account('acc')
+        self._trade('acc', 'b1', '2024-01-02 10:00:00', 0, '10', '10')
+        self._trade('acc', 'b2', '2024-01-03 10:00:00', 0, '10', '20')
+        self._trade('acc', 's1', '2024-01-04 10:00:00', 1, '15', '25')
+        self._trade('acc', 'b3', '2024-01-05 10:00:00', 0, '10', '30')
+        self._trade('acc', 's2', '2024-01-06 10:00:00', 1, '3', '40', lotId='b3')
+
+        self._trade('acc', 's0', '2024-01-03 12:00:00', 1, '5', '15')
+        incremental = self._lots()
+        self.assertEqual(incremental, ({'b3': Decimal('7')}, Decimal('180')))
+
+        with AssetManagerContext() as m:
+            m.rebuild_all_accounts()
+        self.assertEqual(self._lots(), incremental)
+
+    def test_rebuild_keeps_opening_balance(self):
+        """账户建立时的持仓（如长桥快照）没有对应交易，全量重建后仍保留"""
+        self._add_account('acc', '100', '10')
+        self._trade('acc', 'buy', '2024-01-02 10:00:00', 0, '5', '12')
+        self._trade('acc', 'sell', '2024-01-03 10:00:00', 1, '50', '15')
+        before = self._position('acc')
+
+        with AssetManagerContext() as m:
+            result = m.rebuild_all_accounts()
+        self.assertEqual(result['failed'], {})
+        self.assertEqual(self._position('acc'), before)
+        self.assertEqual(before[0], Decimal('55'))
+
+    def test_delete_first_transaction_keeps_opening_balance(self):
+        """删除账户的第一笔交易后从期初持仓重放"""
+        self._add_account('acc', '100', '10')
+        self._trade('acc', 'buy', '2024-01-02 10:00:00', 0, '5', '12')
+
+        with AssetManagerContext() as m:
+            self.assertTrue(m.delete_transaction(USER_ID, 'buy'))
+            self.assertEqual(m.get_position_as_of('acc', '2024-01-01')['quantity'], Decimal('100'))
+        self.assertEqual(self._position('acc'), (Decimal('100'), Decimal('10')))
+
+
+    def test_fifo_sell_consumes_opening_lot_first(self):
+        """期初持仓早于所有批次，先进先出卖出时最先消耗，按期初成本计算盈亏"""
+        self._add_account('acc', '100', '10')
+        self._trade('acc', 'buy', '2024-01-02 10:00:00', 0, '10', '20')
+        self._trade('acc', 'sell', '2024-01-03 10:00:00', 1, '50', '15')
+
+        with AssetManagerContext() as m:
+            result = m.get_lots('acc')
+        lots = {lot['id']: Decimal(lot['remainingQuantity']) for lot in result['lots']}
+        self.assertEqual(lots, {'opening:acc': Decimal('50'), 'buy': Decimal('10')})
+        self.assertEqual(result['realizedPnl'], Decimal('250'))
+
+    def test_failed_rebuild_keeps_lots_and_checkpoints(self):
+        """重建失败的账户保留原有持仓、检查点与批次"""
+        AppConfig.LEDGER_CHECKPOINT_INTERVAL, interval = 1, AppConfig.LEDGER_CHECKPOINT_INTERVAL
+        self.addCleanup(setattr, AppConfig, 'LEDGER_CHECKPOINT_INTERVAL', interval)
+        self._add_account('acc')
+        self._trade('acc', 'buy', '2024-01-02 10:00:00', 0, '10', '20')
+        self._trade('acc', 'sell', '2024-01-03 10:00:00', 1, '4', '25')
+        with AssetManagerContext() as m:
+            lots_before = m.get_lots('acc')
+        # 直接改坏账本，使重放时卖出超过持有数量
+        with Database() as db:
+            checkpoints_before = AccountCheckpointManager(db).get_checkpoints('acc')
+            db.execute_update("UPDATE Transactions SET quantity = '40' WHERE id = 'sell'")
+
+        with AssetManagerContext() as m:
+            result = m.rebuild_all_accounts()
+            self.assertIn('acc', result['failed'])
+            self.assertEqual(m.get_lots('acc'), lots_before)
+        with Database() as db:
+            self.assertEqual(AccountCheckpointManager(db).get_checkpoints('acc'), checkpoints_before)
+        self.assertEqual(len(checkpoints_before), 2)
+        self.assertEqual(self._position('acc'), (Decimal('6'), Decimal('16.66666667')))
+
+
+if __name__ == '__main__':
+    unittest.main()
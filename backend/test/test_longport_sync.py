@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+长桥同步测试 - 同步窗口与重复记账（用假的长桥上下文和临时数据库，无需启动服务器或连接长桥）
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+# 配置文件放在临时目录，避免导入应用时在当前目录生成config.json
+os.environ.setdefault('TINYDB_CONFIG_PATH', os.path.join(tempfile.mkdtemp(prefix='longport_test_config_'), 'config.json'))
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from longport.openapi import OrderSide
+
+from app.core.app_config import AppConfig
+from app.core.config_store import get_config_manager
+from app.models import AssetManagerContext
+from app.services import longport as longport_module
+from app.services.longport import LongportService
+
+USER_ID = 'longport-test-user'
+CONFIG_ID = 'legacy-config'
+APP_KEY = 'legacy-key'
+STOCK_ID = f'{APP_KEY}_stock_AAPL.US'
+CASH_ID = f'{APP_KEY}_cash'
+BEIJING = timezone(timedelta(hours=8))
+
+
+class FakeTradeContext:
+    """按时间窗口返回预设成交订单的交易上下文"""
+
+    orders = []
+    total_cash = Decimal('0')
+
+    def __init__(self, config):
+        pass
+
+    def today_orders(self, status=None):
+        return []
+
+    def history_orders(self, status=None, start_at=None, end_at=None):
+        return [order for order in self.orders
+                if start_at <= order.updated_at.replace(tzinfo=BEIJING) <= end_at]
+
+    def cash_flow(self, **kwargs):
+        return []
+
+    def account_balance(self):
+        return [SimpleNamespace(total_cash=self.total_cash, currency='USD')]
+
+
+class FakeQuoteContext:
+    def __init__(self, config):
+        pass
+
+    def static_info(self, symbols):
+        return []
+
+
+def _order(order_id: str, updated_at: datetime, quantity: str, price: str):
+    # 长桥返回的订单时间不带时区，按北京时间解释
+    return SimpleNamespace(
+        order_id=order_id, symbol='AAPL.US', side=OrderSide.Buy, executed_quantity=Decimal(quantity),
+        executed_price=Decimal(price), currency='USD', updated_at=updated_at.astimezone(BEIJING).replace(tzinfo=None)
+    )
+
+
+class TestLongportSync(unittest.TestCase):
+    """长桥同步测试类"""
+
+    def setUp(self):
+        """每个测试使用独立的临时数据库"""
+        self._tmp_dir = tempfile.mkdtemp(prefix='longport_test_')
+        self._database_path = AppConfig.DATABASE_PATH
+        AppConfig.DATABASE_PATH = os.path.join(self._tmp_dir, 'finance.db')
+        for name, fake in (('TradeContext', FakeTradeContext), ('QuoteContext', FakeQuoteContext)):
+            patcher = mock.patch.object(longport_module, name, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        AppConfig.DATABASE_PATH = self._database_path
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        get_config_manager().modify_user_config(USER_ID, 'longport', lambda configs: {})
+
+    def _position(self, account_id: str):
+        with AssetManagerContext() as m:
+            return Decimal(m.get_asset_by_id(account_id)['quantity'])
+
+    def test_legacy_config_does_not_rebook_overlap(self):
+        """早于快照机制的配置：水位线前已入库（externalId 为空）的成交不会因重叠窗口再次入账"""
+        last_refreshed_at = datetime.now(timezone.utc) - timedelta(hours=1)
+        old_order = _order('order-old', last_refreshed_at - timedelta(minutes=5), '10', '100')
+        new_order = _order('order-new', last_refreshed_at + timedelta(minutes=5), '2', '110')
+
+        # 旧版本同步入账的订单没有 externalId
+        with AssetManagerContext() as m:
+            for account_id, symbol, account_type, quantity in ((STOCK_ID, 'AAPL.US', 'stock', '0'),
+                                                               (CASH_ID, 'longport_cash', 'cash', '10000')):
+                m.add_asset({
+                    'id': account_id, 'userId': USER_ID, 'symbol': symbol, 'type': account_type,
+                    'description': account_id, 'quantity': quantity, 'cost': '1', 'currency': 'USD'
+                })
+            m.update_asset_by_transaction({
+                'id': 'legacy-buy', 'userId': USER_ID, 'accountId': STOCK_ID, 'description': 'legacy-buy',
+                'date': last_refreshed_at - timedelta(minutes=5), 'direction': 0, 'quantity': '10', 'price': '100',
+                'currency': 'USD'
+            })
+        get_config_manager().modify_user_config(USER_ID, 'longport', lambda configs: {CONFIG_ID: {
+            'app_key': APP_KEY, 'app_secret': 'secret', 'access_token': 'token',
+            'last_refreshed_at': last_refreshed_at.isoformat()
+        }})
+        FakeTradeContext.orders = [new_order, old_order]
+        FakeTradeContext.total_cash = Decimal('9780')
+
+        service = LongportService(USER_ID)
+        service.update_user_longbridge_account(CONFIG_ID)
+        self.assertEqual(self._position(STOCK_ID), Decimal('12'))
+        self.assertEqual(self._position(CASH_ID), Decimal('9780'))
+
+        # 首次同步写回 snapshot_at，之后的同步照常向前重叠并按订单号跳过已入账的订单
+        config = service.get_longport_config(CONFIG_ID)
+        self.assertEqual(datetime.fromisoformat(config['snapshot_at']), last_refreshed_at)
+        service.update_user_longbridge_account(CONFIG_ID)
+        self.assertEqual(self._position(STOCK_ID), Decimal('12'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+时间序列测试 - 价格追踪与总资产估值的分桶、降采样（直接使用临时数据库，无需启动服务器）
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# 配置文件放在临时目录，避免导入应用时在当前目录生成config.json
+os.environ.setdefault('TINYDB_CONFIG_PATH', os.path.join(tempfile.mkdtemp(prefix='series_test_config_'), 'config.json'))
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app
+from app.core.app_config import AppConfig
+from app.core.database import Database, PortfolioValuationManager, PriceTracingManager
+
+USER_ID = 'series-test-user'
+
+
+class TestSeries(unittest.TestCase):
+    """时间序列测试类"""
+
+    def setUp(self):
+        """每个测试使用独立的临时数据库"""
+        self._tmp_dir = tempfile.mkdtemp(prefix='series_test_')
+        self._database_path = AppConfig.DATABASE_PATH
+        AppConfig.DATABASE_PATH = os.path.join(self._tmp_dir, 'finance.db')
+        self.client = create_app().test_client()
+
+    def tearDown(self):
+        AppConfig.DATABASE_PATH = self._database_path
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def _add_valuations(self, points, currency='USD'):
+        with Database() as db:
+            PortfolioValuationManager(db).add_valuations([
+                {'userId': USER_ID, 'ts': ts, 'value': value, 'currency': currency} for ts, value in points
+            ])
+
+    def _valuations(self, **params):
+        response = self.client.get('/api/v1/portfolio/valuation', query_string=dict(params, userId=USER_ID))
+        return response.status_code, response.get_json()
+
+    def test_valuation_buckets(self):
+        self._add_valuations([
+            ('2024-01-01 09:00:00', 10), ('2024-01-01 12:00:00', 30), ('2024-01-01 15:00:00', 20),
+            ('2024-01-02 10:00:00', 40), ('2024-01-03 10:00:00', 50)
+        ])
+        with Database() as db:
+            rows = PortfolioValuationManager(db).get_valuation_buckets(USER_ID, 86400, end='2024-01-02 23:59:59')
+        self.assertEqual([(row['date'], row['open'], row['high'], row['low'], row['close'], row['count'])
+                          for row in rows],
+                         [('2024-01-01 00:00:00', 10, 30, 10, 20, 3), ('2024-01-02 00:00:00', 40, 40, 40, 40, 1)])
+        self.assertAlmostEqual(rows[0]['mean'], 20)
+        self.assertEqual(rows[0]['currency'], 'USD')
+
+    def test_valuation_route_params(self):
+        self._add_valuations([(f'2024-01-{day:02d} 10:00:00', day) for day in range(1, 31)])
+
+        status, body = self._valuations()
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body['data']['valuations']), 30)
+        self.assertEqual(body['data']['valuations'][0], {'date': '2024-01-01 10:00:00', 'value': '1', 'currency': 'USD'})
+
+        status, body = self._valuations(start='2024-01-10', end='2024-01-12')
+        self.assertEqual([item['date'] for item in body['data']['valuations']],
+                         ['2024-01-10 10:00:00', '2024-01-11 10:00:00', '2024-01-12 10:00:00'])
+
+        status, body = self._valuations(resolution='7d', mode='ohlc')
+        first = body['data']['valuations'][0]
+        # 7 天的桶按 Unix 纪元对齐，第一个桶从 2023-12-28 开始，包含 1 月 1 日至 3 日
+        self.assertEqual((first['date'], first['open'], first['close'], first['value']),
+                         ('2023-12-28 00:00:00', '1.0', '3.0', '3.0'))
+        self.assertEqual(sum(item['count'] for item in body['data']['valuations']), 30)
+
+        status, body = self._valuations(max_points=5)
+        dates = [item['date'] for item in body['data']['valuations']]
+        self.assertEqual(len(dates), 5)
+        self.assertEqual((dates[0], dates[-1]), ('2024-01-01 10:00:00', '2024-01-30 10:00:00'))
+
+    def test_valuation_currencies_downsampled_separately(self):
+        self._add_valuations([(f'2024-01-{day:02d} 10:00:00', day) for day in range(1, 11)], currency='USD')
+        self._add_valuations([(f'2024-02-{day:02d} 10:00:00', day) for day in range(1, 11)], currency='CNY')
+
+        status, body = self._valuations(max_points=4)
+        valuations = body['data']['valuations']
+        self.assertEqual([item['currency'] for item in valuations], ['USD'] * 4 + ['CNY'] * 4)
+        self.assertEqual([item['date'] for item in valuations], sorted(item['date'] for item in valuations))
+
+    def test_invalid_params(self):
+        for params in ({'resolution': '5w'}, {'mode': 'median'}, {'max_points': 2}):
+            status, body = self._valuations(**params)
+            self.assertEqual(status, 400, params)
+            self.assertFalse(body['success'])
+
+    def test_price_tracing_buckets(self):
+        with Database() as db:
+            manager = PriceTracingManager(db)
+            for date, price in (('2024-01-01 10:00:00', '1'), ('2024-01-01 11:00:00', '3'), ('2024-01-02 10:00:00', '5')):
+                manager.add_price_point('acc-1', date, price)
+        response = self.client.get('/api/v1/get_price_tracing',
+                                   query_string={'accountId': 'acc-1', 'resolution': '1d'})
+        points = response.get_json()['data']['price_tracing']
+        self.assertEqual([(item['date'], item['price'], item['count']) for item in points],
+                         [('2024-01-01 00:00:00', '2.0', 2), ('2024-01-02 00:00:00', '5.0', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+估值测试 - 资产汇总与资产树、总资产估值使用同一定点数换算（直接使用临时数据库，无需启动服务器）
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+import uuid
+from decimal import Decimal
+
+# 配置文件放在临时目录，避免导入应用时在当前目录生成config.json
+os.environ.setdefault('TINYDB_CONFIG_PATH', os.path.join(tempfile.mkdtemp(prefix='valuation_test_config_'), 'config.json'))
+
+# 添加backend目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.app_config import AppConfig
+from app.core.database import Database, ForeignExchangeRateManager
+from app.services.valuation import ValuationEngine
+
+USER_ID = 'valuation-test-user'
+
+
+class TestValuation(unittest.TestCase):
+    """估值测试类"""
+
+    def setUp(self):
+        """每个测试使用独立的临时数据库"""
+        self._tmp_dir = tempfile.mkdtemp(prefix='valuation_test_')
+        self._database_path = AppConfig.DATABASE_PATH
+        AppConfig.DATABASE_PATH = os.path.join(self._tmp_dir, 'finance.db')
+        with Database() as db:
+            rate_manager = ForeignExchangeRateManager(db)
+            rate_manager.set_exchange_rate({'id': str(uuid.uuid4()), 'foreign_currency': 'USD',
+                                            'buy_in_price': '710.12', 'sell_out_price': '713.14'})
+            rate_manager.set_exchange_rate({'id': str(uuid.uuid4()), 'foreign_currency': 'HKD',
+                                            'buy_in_price': '91.02', 'sell_out_price': '91.38'})
+            db.execute_many('''
+                INSERT INTO Accounts (id, userId, symbol, type, parentId, description, quantity, cost, marketPrice, currency)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                ('group-1', USER_ID, 'group-1', 'group', None, '券商', '0', '0', None, 'CNY'),
+                ('stock-1', USER_ID, 'AAPL.US', 'stock', 'group-1', 'AAPL', '3.00000000', '100.10000000', '101.33333333', 'USD'),
+                ('stock-2', USER_ID, '00700.HK', 'stock', 'group-1', '腾讯', '7.00000000', '300.00000000', '0', 'HKD'),
+                ('cash-1', USER_ID, 'cash', 'cash', 'group-1', '现金', '0.10000000', '1.00000000', None, 'USD'),
+                ('cash-2', USER_ID, 'cny', 'cash', None, '人民币', '1234.56789012', '1.00000000', None, 'CNY'),
+            ])
+
+    def _add_random_accounts(self, count: int):
+        """添加一批随机金额的账户，浮点数逐笔累加时会产生舍入误差"""
+        rng = random.Random(42)
+        with Database() as db:
+            db.execute_many('''
+                INSERT INTO Accounts (id, userId, symbol, type, parentId, description, quantity, cost, marketPrice, currency)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                f'random-{i}', USER_ID, f'SYM{i}', rng.choice(['stock', 'asset']), rng.choice(['group-1', None]),
+                f'random-{i}', f'{rng.uniform(1, 10000):.8f}', f'{rng.uniform(1, 500):.8f}',
+                f'{rng.uniform(1, 500):.8f}', rng.choice(['CNY', 'USD', 'HKD'])
+            ) for i in range(count)])
+
+    def tearDown(self):
+        AppConfig.DATABASE_PATH = self._database_path
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def test_summary_matches_tree_and_valuation(self):
+        self._add_random_accounts(500)
+        for currency in ('CNY', 'USD', 'HKD'):
+            with Database() as db:
+                engine = ValuationEngine(db)
+                summary = engine.summarize(USER_ID, currency)
+                tree = engine.valuate_tree(USER_ID, currency)
+                valuation = engine.valuate([USER_ID], currency)[USER_ID]
+
+            self.assertEqual(summary['totalValue'], float(valuation['total']), currency)
+            self.assertEqual(summary['accountCount'], 504)
+            by_group = {item['id']: item['value'] for item in summary['byGroup']}
+            self.assertEqual(by_group, {node['id']: node['totalValue'] for node in tree}, currency)
+            by_type = {item['type']: item['value'] for item in summary['byType']}
+            self.assertEqual(by_type, {key: float(value) for key, value in valuation['byType'].items() if key != 'group'}, currency)
+
+    def test_summary_cost_and_original_value(self):
+        with Database() as db:
+            summary = ValuationEngine(db).summarize(USER_ID, 'USD')
+        by_currency = {item['currency']: item for item in summary['byCurrency']}
+        # 原币市值不换算：3 * 101.33333333 + 0.1 * 1
+        self.assertEqual(by_currency['USD']['originalValue'], float(Decimal('304.09999999')))
+        self.assertEqual(by_currency['USD']['cost'], 300.4)
+        self.assertEqual(summary['unrealizedPnl'], round(summary['totalValue'] - summary['totalCost'], 8))
+        self.assertAlmostEqual(sum(item['ratio'] for item in summary['byGroup']), 1.0, places=7)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
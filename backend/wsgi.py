@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+资金管理系统后端生产环境入口（WSGI）
+用法: gunicorn -c gunicorn.conf.py wsgi:app
+多个worker共享同一个SQLite数据库，定时任务由 gunicorn.conf.py 在每个worker中参与竞选，只有领导者运行
+"""
+
+import os
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 多worker部署：配置缓存与数据版本需要感知其他进程的写入（须在导入应用前设置）
+os.environ.setdefault('CONFIG_MULTIPROCESS', 'True')
+
+from app import create_app
+
+app = create_app()
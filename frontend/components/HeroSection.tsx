@@ -10,7 +10,10 @@ import { AssetDistribution } from "./AssetDistribution"
 import { Area, AreaChart, CartesianGrid, ResponsiveContainer, Tooltip, XAxis, YAxis } from 'recharts'
 import { buildAssetTree, AssetNode } from "../utils/assetUtils"
 import { useCurrency, useDataRefresh, CurrencyCode } from "../contexts/CurrencyContext"
-import { apiService, PriceTracingData } from "../services/api"
+import { apiService, PortfolioValuationData, CURRENT_USER_ID } from "../services/api"
+
+// 总资产走势图最多展示的点数
+const CHART_MAX_POINTS = 500
 
 interface PortfolioData {
   totalValue: number
@@ -72,24 +75,25 @@ export function HeroSection({ onAddTransactionRequest }: HeroSectionProps) {
     // 计算基于昨天价格的增长率
     let totalGrowth = 0
     try {
-      // 获取价格追踪数据
-      const response = await apiService.getPriceTracingData('0')
+      // 获取总资产估值序列
+      const response = await apiService.getPortfolioValuation(CURRENT_USER_ID)
       
-      if (response.success && response.data && response.data.price_tracing && response.data.price_tracing.length >= 1) {
-        // 获取价格数据并按日期排序
-        const priceData = response.data.price_tracing
+      if (response.success && response.data && response.data.valuations && response.data.valuations.length >= 1) {
+        // 获取估值数据并按日期排序
+        const priceData = response.data.valuations
           .map(item => ({
             date: new Date(item.date),
-            price: parseFloat(item.price)
+            price: parseFloat(item.value),
+            currency: (item.currency || 'CNY') as CurrencyCode
           }))
           .sort((a, b) => a.date.getTime() - b.date.getTime())
 
         if (priceData.length >= 1) {
-          // 获取昨天的价格（price_tracing数组中最后一个价格）
-          const yesterdayPrice = priceData[priceData.length - 1].price
+          // 获取昨天的估值（估值序列中最后一个点）
+          const yesterdayPoint = priceData[priceData.length - 1]
           
-          // 处理货币转换 - 假设price_tracing数据是以CNY为单位
-          const convertedYesterdayPrice = await convertCurrency(yesterdayPrice, 'CNY', selectedCurrency)
+          // 处理货币转换 - 估值按其记录的货币换算
+          const convertedYesterdayPrice = await convertCurrency(yesterdayPoint.price, yesterdayPoint.currency, selectedCurrency)
           
           // 计算增长率：(当前总价值 - 昨天价值) / 昨天价值 * 100
           if (convertedYesterdayPrice > 0) {
@@ -146,20 +150,20 @@ export function HeroSection({ onAddTransactionRequest }: HeroSectionProps) {
       setChartLoading(true)
       setChartError(null)
       
-      // 使用accountId=0获取总资产价格数据
-      const response = await apiService.getPriceTracingData('0')
+      // 获取当前用户的总资产估值序列，点数过多时由服务端降采样
+      const response = await apiService.getPortfolioValuation(CURRENT_USER_ID, CHART_MAX_POINTS)
       
       if (!response.success) {
         throw new Error(response.error || '获取价格数据失败')
       }
 
-      if (response.data && response.data.price_tracing) {
+      if (response.data && response.data.valuations) {
         // 转换数据格式为图表可用的格式
-        const processedData: ChartDataPoint[] = response.data.price_tracing.map((item: PriceTracingData) => {
+        const processedData: ChartDataPoint[] = response.data.valuations.map((item: PortfolioValuationData) => {
           const date = new Date(item.date)
           return {
             date: item.date,
-            price: parseFloat(item.price),
+            price: parseFloat(item.value),
             formattedDate: date.toLocaleDateString('zh-CN', {
               month: 'short',
               day: 'numeric'
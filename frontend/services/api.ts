@@ -46,6 +46,18 @@ export interface PriceTracingResponse {
   price_tracing: PriceTracingData[]
 }
 
+// 总资产估值序列数据接口定义
+export interface PortfolioValuationData {
+  date: string      // 估值时间
+  value: string     // 总资产估值（字符串格式）
+  currency: string  // 估值货币
+}
+
+export interface PortfolioValuationResponse {
+  userId: string
+  valuations: PortfolioValuationData[]
+}
+
 // 长桥证券配置接口定义
 export interface LongportConfig {
   userId: string
@@ -401,6 +413,15 @@ class ApiService {
     return this.makeRequest<PriceTracingResponse>(`/api/v1/get_price_tracing?accountId=${encodeURIComponent(accountId)}`)
   }
 
+  // 获取用户的总资产估值序列，maxPoints 为最多返回的点数（超出时服务端降采样）
+  async getPortfolioValuation(userId: string, maxPoints?: number): Promise<ApiResponse<PortfolioValuationResponse>> {
+    const params = new URLSearchParams({ userId })
+    if (maxPoints) {
+      params.set('max_points', String(maxPoints))
+    }
+    return this.makeRequest<PortfolioValuationResponse>(`/api/v1/portfolio/valuation?${params.toString()}`)
+  }
+
   // === 长桥证券相关API ===
 
   // 添加长桥证券配置